@@ -0,0 +1,52 @@
+"""Add chunks table
+
+Revision ID: 3f9a2c1d7b40
+Revises: e117fe54c208
+Create Date: 2026-10-18 09:12:41.118204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f9a2c1d7b40'
+down_revision: Union[str, None] = 'e117fe54c208'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # The application creates missing tables on startup, so the table may exist.
+    if not sa.inspect(op.get_bind()).has_table('chunks'):
+        op.create_table(
+            'chunks',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('document_id', sa.Integer(), nullable=True),
+            sa.Column('position', sa.Integer(), nullable=False),
+            sa.Column('text', sa.String(), nullable=False),
+            sa.Column('embedding', sa.LargeBinary(), nullable=True),
+            sa.ForeignKeyConstraint(['document_id'], ['documents.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('id'),
+        )
+        op.create_index(op.f('ix_chunks_id'), 'chunks', ['id'], unique=False)
+        op.create_index(op.f('ix_chunks_document_id'), 'chunks', ['document_id'], unique=False)
+
+    # Documents ingested before chunking become a single chunk with their existing embedding.
+    op.execute(
+        """
+        INSERT INTO chunks (document_id, position, text, embedding)
+        SELECT d.id, 0, d.text, d.embedding
+        FROM documents d
+        WHERE d.embedding IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM chunks c WHERE c.document_id = d.id)
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_chunks_document_id'), table_name='chunks')
+    op.drop_index(op.f('ix_chunks_id'), table_name='chunks')
+    op.drop_table('chunks')
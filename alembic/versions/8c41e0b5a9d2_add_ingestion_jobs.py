@@ -0,0 +1,59 @@
+"""Add ingestion job tables
+
+Revision ID: 8c41e0b5a9d2
+Revises: 3f9a2c1d7b40
+Create Date: 2026-10-18 11:03:27.540913
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c41e0b5a9d2'
+down_revision: Union[str, None] = '3f9a2c1d7b40'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # The application creates missing tables on startup, so the tables may exist.
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table('ingestion_jobs'):
+        op.create_table(
+            'ingestion_jobs',
+            sa.Column('id', sa.String(length=32), nullable=False),
+            sa.Column('status', sa.String(length=16), nullable=False),
+            sa.Column('source_path', sa.String(), nullable=False),
+            sa.Column('committed_offset', sa.Integer(), nullable=False),
+            sa.Column('succeeded', sa.Integer(), nullable=False),
+            sa.Column('failed', sa.Integer(), nullable=False),
+            sa.Column('error', sa.String(), nullable=True),
+            sa.Column('created_at', sa.DateTime(timezone=True), nullable=True),
+            sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+            sa.PrimaryKeyConstraint('id'),
+        )
+        op.create_index(op.f('ix_ingestion_jobs_status'), 'ingestion_jobs', ['status'], unique=False)
+    if not inspector.has_table('ingestion_job_items'):
+        op.create_table(
+            'ingestion_job_items',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('job_id', sa.String(length=32), nullable=True),
+            sa.Column('position', sa.Integer(), nullable=False),
+            sa.Column('filename', sa.String(), nullable=False),
+            sa.Column('status', sa.String(length=16), nullable=False),
+            sa.Column('document_id', sa.Integer(), nullable=True),
+            sa.Column('detail', sa.String(), nullable=True),
+            sa.ForeignKeyConstraint(['job_id'], ['ingestion_jobs.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('id'),
+        )
+        op.create_index(op.f('ix_ingestion_job_items_job_id'), 'ingestion_job_items', ['job_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_ingestion_job_items_job_id'), table_name='ingestion_job_items')
+    op.drop_table('ingestion_job_items')
+    op.drop_index(op.f('ix_ingestion_jobs_status'), table_name='ingestion_jobs')
+    op.drop_table('ingestion_jobs')
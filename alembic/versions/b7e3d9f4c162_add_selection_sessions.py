@@ -0,0 +1,36 @@
+"""Add selection sessions table
+
+Revision ID: b7e3d9f4c162
+Revises: 8c41e0b5a9d2
+Create Date: 2026-10-18 13:21:44.108265
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e3d9f4c162'
+down_revision: Union[str, None] = '8c41e0b5a9d2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # The application creates missing tables on startup, so the table may exist.
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table('selection_sessions'):
+        op.create_table(
+            'selection_sessions',
+            sa.Column('session_id', sa.String(length=128), nullable=False),
+            sa.Column('document_ids', sa.LargeBinary(), nullable=False),
+            sa.Column('chunk_ids', sa.LargeBinary(), nullable=False),
+            sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+            sa.PrimaryKeyConstraint('session_id'),
+        )
+
+
+def downgrade() -> None:
+    op.drop_table('selection_sessions')
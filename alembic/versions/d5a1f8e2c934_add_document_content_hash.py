@@ -0,0 +1,70 @@
+"""Add document content hash
+
+Revision ID: d5a1f8e2c934
+Revises: b7e3d9f4c162
+Create Date: 2026-10-18 16:40:12.527031
+
+"""
+import hashlib
+import unicodedata
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd5a1f8e2c934'
+down_revision: Union[str, None] = 'b7e3d9f4c162'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def content_hash(text):
+    # Same normalization as app.services.ingestion_service.content_hash
+    normalized = " ".join(unicodedata.normalize("NFC", text).split())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    columns = {column['name'] for column in inspector.get_columns('documents')}
+    if 'content_hash' not in columns:
+        op.add_column('documents', sa.Column('content_hash', sa.String(length=64), nullable=True))
+
+    # Hash existing documents. Only the first copy of duplicated content gets
+    # its hash; the others keep NULL, which the unique index allows.
+    documents = sa.table(
+        'documents',
+        sa.column('id', sa.Integer),
+        sa.column('text', sa.String),
+        sa.column('content_hash', sa.String),
+    )
+    seen = set()
+    rows = bind.execute(
+        sa.select(documents.c.id, documents.c.text)
+        .where(documents.c.content_hash.is_(None))
+        .order_by(documents.c.id)
+    ).all()
+    for row in rows:
+        digest = content_hash(row.text or "")
+        if digest in seen:
+            continue
+        seen.add(digest)
+        bind.execute(
+            documents.update().where(documents.c.id == row.id).values(content_hash=digest)
+        )
+
+    indexes = {index['name'] for index in inspector.get_indexes('documents')}
+    if 'ix_documents_content_hash' not in indexes:
+        op.create_index(op.f('ix_documents_content_hash'), 'documents', ['content_hash'], unique=True)
+    # The btree index on the full text is replaced by the hash index.
+    if 'ix_documents_text' in indexes:
+        op.drop_index('ix_documents_text', table_name='documents')
+
+
+def downgrade() -> None:
+    op.create_index('ix_documents_text', 'documents', ['text'], unique=False)
+    op.drop_index(op.f('ix_documents_content_hash'), table_name='documents')
+    op.drop_column('documents', 'content_hash')
@@ -0,0 +1,23 @@
+from typing import Optional
+from fastapi import Header
+from app.models.db_models import AsyncSessionLocal
+from app.services.selection_store import DEFAULT_SESSION
+
+
+async def get_db():
+    """
+    Dependency to get an async database session from the pooled async engine.
+    Ensures that the session is properly closed after use.
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def get_session_id(
+    x_session_id: Optional[str] = Header(None, max_length=128),
+):
+    """
+    Dependency returning the client's selection session from the
+    ``X-Session-ID`` header. Clients without the header share one session.
+    """
+    return x_session_id or DEFAULT_SESSION
@@ -1,39 +1,83 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
-from sqlalchemy.orm import Session
-from app.models.db_models import SessionLocal, Document
-from app.services.embedding_service import generate_embedding
-from app.models.embedding_store_instance import embedding_store
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Query
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from app.api.dependencies import get_db
+from app.models.db_models import IngestionJob
+from app.services.ingestion_service import ingest_document
+from app.services.ingestion_pipeline import ingestion_worker
 from app.core.logging_config import logger
 from pydantic import BaseModel
+from typing import List, Optional
 
 router = APIRouter()
 
 
-def get_db():
+class UploadResponse(BaseModel):
+    message: str
+    document_id: int
+
+
+class FileResult(BaseModel):
     """
-    Dependency to get the database session.
-    Ensures that the session is properly closed after use.
+    Outcome of one document in a bulk upload.
     """
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
 
+    filename: str
+    status: str
+    document_id: Optional[int] = None
+    detail: Optional[str] = None
 
-class UploadResponse(BaseModel):
-    message: str
-    document_id: int
+
+class IngestionJobResponse(BaseModel):
+    """
+    Progress and per-document results of a bulk upload job.
+    """
+
+    job_id: str
+    status: str
+    processed: int
+    succeeded: int
+    failed: int
+    error: Optional[str] = None
+    results: List[FileResult]
+
+
+def job_response(job, include_results=True):
+    """
+    Build the API response for an ingestion job row.
+    """
+    results = []
+    if include_results:
+        results = [
+            FileResult(
+                filename=item.filename,
+                status=item.status,
+                document_id=item.document_id,
+                detail=item.detail,
+            )
+            for item in job.items
+        ]
+    return IngestionJobResponse(
+        job_id=job.id,
+        status=job.status,
+        processed=job.committed_offset,
+        succeeded=job.succeeded,
+        failed=job.failed,
+        error=job.error,
+        results=results,
+    )
 
 
 @router.post(
     "/upload/",
     response_model=UploadResponse,
-    summary="Upload a document and generate embedding",
+    summary="Upload a document and generate embeddings for its chunks",
 )
-async def upload_document(file: UploadFile = File(...), db: Session = Depends(get_db)):
+async def upload_document(file: UploadFile = File(...)):
     """
-    Upload a document and generate embeddings for it.
+    Upload a document, split it into chunks and generate embeddings for them.
     Only supports .txt files and non-empty content.
     """
     try:
@@ -57,26 +101,16 @@ async def upload_document(file: UploadFile = File(...), db: Session = Depends(ge
             logger.error("Uploaded document is empty.")
             raise HTTPException(status_code=400, detail="Uploaded document is empty.")
 
-        # Generate embedding
-        embedding = generate_embedding(document_text)
-        if embedding is None:
+        # Chunk, embed, save and index the document in a worker thread
+        document_id = await run_in_threadpool(ingest_document, document_text)
+        if document_id is None:
             logger.error("Error generating embedding.")
             raise HTTPException(status_code=500, detail="Error generating embedding.")
 
-        # Save document
-        db_document = Document(text=document_text, embedding=embedding)
-        db.add(db_document)
-        db.commit()
-        db.refresh(db_document)
-
-        embedding_store.add_embedding(embedding)
-
-        logger.info(f"Document {db_document.id} uploaded successfully.")
-        # Reload FAISS after upload
-        embedding_store.load_existing_embeddings()
+        logger.info(f"Document {document_id} uploaded successfully.")
 
         return UploadResponse(
-            message="Document uploaded successfully", document_id=db_document.id
+            message="Document uploaded successfully", document_id=document_id
         )
 
     except HTTPException as http_ex:
@@ -85,3 +119,69 @@ async def upload_document(file: UploadFile = File(...), db: Session = Depends(ge
     except Exception as e:
         logger.error(f"Unexpected error uploading document: {e}")
         raise HTTPException(status_code=500, detail="Internal server error.")
+
+
+@router.post(
+    "/upload/bulk/",
+    response_model=IngestionJobResponse,
+    status_code=202,
+    summary="Queue many documents as files, zip/tar archives or JSONL",
+)
+async def bulk_upload_documents(
+    files: List[UploadFile] = File(...), db: AsyncSession = Depends(get_db)
+):
+    """
+    Upload many documents at once.
+    Accepts .txt files, zip and tar archives of .txt files, and JSONL files with
+    one {"text": ...} object per line. The files are saved and ingested by a
+    background job; poll the returned job ID for progress and results.
+    """
+    try:
+        job_id = await run_in_threadpool(ingestion_worker.submit, files)
+        return job_response(await db.get(IngestionJob, job_id), include_results=False)
+
+    except HTTPException as http_ex:
+        raise http_ex  # Ensure FastAPI handles HTTPExceptions properly
+
+    except Exception as e:
+        logger.error(f"Unexpected error in bulk upload: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error.")
+
+
+@router.get(
+    "/upload/jobs/",
+    response_model=List[IngestionJobResponse],
+    summary="List recent bulk upload jobs",
+)
+async def list_ingestion_jobs(
+    status: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Return the most recent bulk upload jobs, newest first, without their
+    per-document results. Optionally filter by status.
+    """
+    query = select(IngestionJob)
+    if status:
+        query = query.where(IngestionJob.status == status)
+    jobs = (
+        await db.scalars(query.order_by(IngestionJob.created_at.desc()).limit(limit))
+    ).all()
+    return [job_response(job, include_results=False) for job in jobs]
+
+
+@router.get(
+    "/upload/jobs/{job_id}",
+    response_model=IngestionJobResponse,
+    summary="Get the progress of a bulk upload job",
+)
+async def get_ingestion_job(job_id: str, db: AsyncSession = Depends(get_db)):
+    """
+    Return the progress and per-document results of a bulk upload job.
+    """
+    job = await db.get(IngestionJob, job_id, options=[selectinload(IngestionJob.items)])
+    if job is None:
+        logger.warning(f"Ingestion job {job_id} not found.")
+        raise HTTPException(status_code=404, detail="Ingestion job not found.")
+    return job_response(job)
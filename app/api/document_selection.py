@@ -1,24 +1,15 @@
 from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
 from typing import List
-from app.models.db_models import SessionLocal, Document
+from app.api.dependencies import get_db, get_session_id
+from app.models.db_models import Document
 from app.core.logging_config import logger
+from app.services.selection_store import Selection, selection_store
 
 router = APIRouter()
-selected_docs_store = set()
-
-
-def get_db():
-    """
-    Dependency to get the database session.
-    Ensures that the session is properly closed after use.
-    """
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
 
 
 class DocumentSelectionRequest(BaseModel):
@@ -35,6 +26,7 @@ class DocumentSelectionResponse(BaseModel):
     """
 
     selected_documents: List[int]
+    session_id: str
 
 
 @router.post(
@@ -43,31 +35,40 @@ class DocumentSelectionResponse(BaseModel):
     summary="Select documents by IDs",
 )
 async def select_documents(
-    request: DocumentSelectionRequest, db: Session = Depends(get_db)
+    request: DocumentSelectionRequest,
+    db: AsyncSession = Depends(get_db),
+    session_id: str = Depends(get_session_id),
 ):
     """
     Select documents from the database based on provided IDs.
-    Stores selected document IDs in memory.
+    Stores the selection, with its chunk IDs, for the client's session.
     """
     try:
         if not request.doc_ids:
             logger.warning("No document IDs provided in request.")
             raise HTTPException(status_code=400, detail="No document IDs provided.")
 
-        # Fetch valid documents from the database
-        valid_docs = db.query(Document).filter(Document.id.in_(request.doc_ids)).all()
-        valid_doc_ids = {doc.id for doc in valid_docs}
+        # Fetch valid document IDs from the database
+        valid_doc_ids = set(
+            (
+                await db.scalars(
+                    select(Document.id).where(Document.id.in_(request.doc_ids))
+                )
+            ).all()
+        )
 
         if not valid_doc_ids:
             logger.warning(f"No matching documents found for IDs: {request.doc_ids}")
             raise HTTPException(status_code=404, detail="No matching documents found.")
 
-        # Store selected document IDs in memory
-        selected_docs_store.clear()
-        selected_docs_store.update(valid_doc_ids)
+        # Store the selection, resolved to chunk IDs, for this session
+        selection = await Selection.resolve(db, valid_doc_ids)
+        await run_in_threadpool(selection_store.set, session_id, selection)
 
-        logger.info(f"Selected documents: {selected_docs_store}")
-        return DocumentSelectionResponse(selected_documents=list(selected_docs_store))
+        logger.info(f"Selected documents for session {session_id}: {valid_doc_ids}")
+        return DocumentSelectionResponse(
+            selected_documents=selection.document_ids.tolist(), session_id=session_id
+        )
 
     except HTTPException as http_ex:
         raise http_ex  # Ensure FastAPI handles HTTPExceptions properly
@@ -77,15 +78,29 @@ async def select_documents(
         raise HTTPException(status_code=500, detail="Internal server error.")
 
 
+@router.get(
+    "/selected_documents/",
+    response_model=DocumentSelectionResponse,
+    summary="Get selected documents",
+)
+async def get_selected_documents(session_id: str = Depends(get_session_id)):
+    """
+    Return the documents selected in the client's session.
+    """
+    selection = await run_in_threadpool(selection_store.get, session_id)
+    selected = selection.document_ids.tolist() if selection is not None else []
+    return DocumentSelectionResponse(selected_documents=selected, session_id=session_id)
+
+
 @router.post(
     "/clear_selected_documents/",
     response_model=DocumentSelectionResponse,
     summary="Clear selected documents",
 )
-async def clear_documents():
+async def clear_documents(session_id: str = Depends(get_session_id)):
     """
-    Clear selected documents from memory.
+    Clear the selected documents of the client's session.
     """
-    selected_docs_store.clear()
-    logger.info("Cleared selected documents.")
-    return DocumentSelectionResponse(selected_documents=[])
+    await run_in_threadpool(selection_store.clear, session_id)
+    logger.info(f"Cleared selected documents for session {session_id}.")
+    return DocumentSelectionResponse(selected_documents=[], session_id=session_id)
@@ -0,0 +1,24 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from app.services.lifecycle import startup
+
+router = APIRouter()
+
+
+@router.get("/health/live", summary="Liveness probe")
+async def live():
+    """
+    Report that the process is up and serving requests.
+    """
+    return {"status": "alive"}
+
+
+@router.get("/health/ready", summary="Readiness probe")
+async def ready():
+    """
+    Report whether startup has completed, with the time taken by each component.
+    Returns 503 while warming up or after a failed startup.
+    """
+    report = startup.report()
+    status_code = 200 if report["status"] == "ready" else 503
+    return JSONResponse(status_code=status_code, content=report)
@@ -1,36 +1,99 @@
+import json
 from fastapi import APIRouter, HTTPException, Depends
-from pydantic import BaseModel
-from sqlalchemy.orm import Session
-from transformers import pipeline
-from app.models.db_models import SessionLocal
-from app.services.embedding_service import generate_embedding
-from app.services.retrieval_service import retrieve_relevant_docs
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from pydantic import BaseModel, Field
+from typing import List, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import (
+    CACHE_ENABLED,
+    GENERATION_MAX_NEW_TOKENS,
+    QA_BATCH_MAX_QUESTIONS,
+)
+from app.services.cache import (
+    answer_cache,
+    cache_stats,
+    embedding_cache,
+    normalize_question,
+    prompt_key,
+)
+from app.api.dependencies import get_db, get_session_id
+from app.services.context_builder import QuestionTooLongError, build_prompt_async
+from app.services.embedding_service import (
+    generate_embedding_async,
+    generate_embeddings_async,
+)
+from app.services.generation_service import (
+    AnswerStream,
+    generate_answer_async,
+    generate_answers_async,
+)
+from app.services.retrieval_service import (
+    retrieve_relevant_docs,
+    retrieve_relevant_docs_batch,
+)
+from app.services.reranking_service import (
+    candidate_count,
+    rerank_async,
+    rerank_batch_async,
+)
+from app.services.selection_store import selection_store
 from app.core.logging_config import logger
 
 router = APIRouter()
 
-# Load a LLM model for answer generation
-qa_pipeline = pipeline("text2text-generation", model="google/flan-t5-large")
-
 
-def get_db():
+class Query(BaseModel):
     """
-    Dependency to get the database session.
-    Ensures that the session is properly closed after use.
+    Request model for question answering.
     """
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
 
+    question: str
+    k: int = Field(5, ge=1, le=50, description="Number of chunks to retrieve.")
+    min_similarity: Optional[float] = Field(
+        None,
+        ge=-1.0,
+        le=1.0,
+        description="Minimum cosine similarity of retrieved chunks.",
+    )
+    max_new_tokens: Optional[int] = Field(
+        None,
+        ge=1,
+        le=GENERATION_MAX_NEW_TOKENS,
+        description="Maximum answer length in tokens.",
+    )
+    max_time: Optional[float] = Field(
+        None,
+        gt=0,
+        description="Generation time budget in seconds; the answer may be cut short.",
+    )
 
-class Query(BaseModel):
+
+class BatchQuery(BaseModel):
     """
-    Request model for question answering.
+    Request model for answering several questions at once.
     """
 
-    question: str
+    questions: List[str] = Field(..., min_length=1, max_length=QA_BATCH_MAX_QUESTIONS)
+    k: int = Field(5, ge=1, le=50, description="Number of chunks to retrieve per question.")
+    min_similarity: Optional[float] = Field(
+        None,
+        ge=-1.0,
+        le=1.0,
+        description="Minimum cosine similarity of retrieved chunks.",
+    )
+    max_new_tokens: Optional[int] = Field(
+        None,
+        ge=1,
+        le=GENERATION_MAX_NEW_TOKENS,
+        description="Maximum answer length in tokens.",
+    )
+    max_time: Optional[float] = Field(
+        None,
+        gt=0,
+        description="Generation time budget in seconds; the answer may be cut short.",
+    )
 
 
 class AnswerResponse(BaseModel):
@@ -42,55 +105,122 @@ class AnswerResponse(BaseModel):
     message: str
 
 
+class BatchAnswerItem(BaseModel):
+    """
+    Answer to one question of a batch; ``error`` is set if it failed.
+    """
+
+    question: str
+    answer: Optional[str] = None
+    message: Optional[str] = None
+    error: Optional[str] = None
+
+
+class BatchAnswerResponse(BaseModel):
+    """
+    Response model for batch question answering, in the order of the questions.
+    """
+
+    results: List[BatchAnswerItem]
+
+
+async def get_query_embedding(question_text):
+    """
+    Embed a question, reusing the embedding of a previously asked equal question.
+    """
+    question_key = normalize_question(question_text)
+    query_embedding = embedding_cache.get(question_key) if CACHE_ENABLED else None
+    if query_embedding is None:
+        query_embedding = await generate_embedding_async(question_text)
+        if query_embedding is None:
+            logger.error("Failed to generate embedding for the query.")
+            raise HTTPException(status_code=500, detail="Embedding generation failed.")
+        if CACHE_ENABLED:
+            embedding_cache.set(question_key, query_embedding)
+    return query_embedding
+
+
+def answer_key(prompt, query):
+    """
+    Cache key of the answer to a prompt under the request's generation budget.
+    """
+    return prompt_key(prompt, max_new_tokens=query.max_new_tokens, max_time=query.max_time)
+
+
+async def retrieve_for_query(db, query, session_id):
+    """
+    Validate the question, embed it and retrieve chunks from the session's selection.
+
+    With re-ranking enabled, ``RERANK_CANDIDATES`` chunks are retrieved and the
+    ``k`` best by cross-encoder score are returned.
+
+    Returns:
+        tuple: ``(relevant_docs, message)`` as returned by retrieve_relevant_docs.
+
+    Raises:
+        HTTPException: If the question is empty or embedding fails.
+    """
+    # Validate input question
+    question_text = query.question.strip()
+    if not question_text:
+        logger.warning("Received empty question input.")
+        raise HTTPException(status_code=400, detail="Question cannot be empty.")
+
+    query_embedding = await get_query_embedding(question_text)
+
+    # Retrieve relevant documents from the session's selection
+    selection = await run_in_threadpool(selection_store.get, session_id)
+    relevant_docs, message = await retrieve_relevant_docs(
+        db,
+        query_embedding,
+        k=candidate_count(query.k),
+        threshold=query.min_similarity,
+        selection=selection,
+        query_text=question_text,
+    )
+    return await rerank_async(question_text, relevant_docs, query.k), message
+
+
 @router.post(
     "/qa/",
     response_model=AnswerResponse,
     summary="Answer a question using retrieved documents",
 )
-async def answer_question(query: Query, db: Session = Depends(get_db)):
+async def answer_question(
+    query: Query,
+    db: AsyncSession = Depends(get_db),
+    session_id: str = Depends(get_session_id),
+):
     """
     Answer a user's question by retrieving relevant documents.
-    If no documents are selected, returns a message indicating that.
+    Only the documents selected in the client's session (``X-Session-ID``
+    header) are searched; if none are selected, all documents are searched and
+    the message says so.
     """
     try:
-        # Validate input question
-        question_text = query.question.strip()
-        if not question_text:
-            logger.warning("Received empty question input.")
-            raise HTTPException(status_code=400, detail="Question cannot be empty.")
-
-        # Generate embedding for query
-        query_embedding = generate_embedding(question_text)
-        if query_embedding is None:
-            logger.error("Failed to generate embedding for the query.")
-            raise HTTPException(status_code=500, detail="Embedding generation failed.")
-
-        # Retrieve relevant documents
-        relevant_docs, message = retrieve_relevant_docs(query_embedding)
+        relevant_docs, message = await retrieve_for_query(db, query, session_id)
         if not relevant_docs:
             logger.info("No relevant documents found for the query.")
             return AnswerResponse(answer="No relevant content found.", message=message)
 
-        # Extract and concatenate document texts
-        context = " ".join(
-            set(doc.text.strip() for doc in relevant_docs if doc.text.strip())
-        )
-        if not context:
+        prompt = await build_prompt_async(query.question.strip(), relevant_docs)
+        if prompt is None:
             logger.info("Retrieved documents did not contain useful information.")
             return AnswerResponse(
                 answer="No relevant content found.",
                 message="Relevant documents did not contain useful information.",
             )
 
-        # Improved Prompting (Removes unnecessary instructions)
-        prompt = (
-            f"Based on the given information, provide a concise answer:\n\n{context}"
-        )
-
-        # Generate answer using the language model
-        hf_response = qa_pipeline(prompt, max_length=150)
-        logger.info(f"Response from Hugging Face: {hf_response}")
-        generated_answer = hf_response[0]["generated_text"].strip()
+        # Generate answer using the language model, off the event loop,
+        # unless the same prompt was answered before
+        key = answer_key(prompt, query)
+        generated_answer = answer_cache.get(key) if CACHE_ENABLED else None
+        if generated_answer is None:
+            generated_answer = await generate_answer_async(
+                prompt, max_new_tokens=query.max_new_tokens, max_time=query.max_time
+            )
+            if generated_answer and CACHE_ENABLED:
+                answer_cache.set(key, generated_answer)
 
         if not generated_answer:
             logger.info("Failed to generate answer for the query.")
@@ -109,3 +239,242 @@ async def answer_question(query: Query, db: Session = Depends(get_db)):
         # Log unexpected errors
         logger.error(f"Unexpected error in Q&A: {e}")
         raise HTTPException(status_code=500, detail="Internal server error.")
+
+
+def sse_event(event, data):
+    """
+    Format one Server-Sent Event with a JSON payload.
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@router.post(
+    "/qa/stream/",
+    summary="Answer a question, streaming the answer as Server-Sent Events",
+    response_class=StreamingResponse,
+)
+async def stream_answer_question(
+    query: Query,
+    db: AsyncSession = Depends(get_db),
+    session_id: str = Depends(get_session_id),
+):
+    """
+    Answer a question like /qa/, but stream the response as Server-Sent Events.
+
+    A ``meta`` event with the retrieval message and the IDs of the retrieved
+    documents and chunks is sent as soon as retrieval is done, followed by
+    ``token`` events while the answer is generated and a final ``done`` event
+    with the full answer. Failures after streaming has started are reported as
+    an ``error`` event. Disconnecting stops the generation.
+    """
+    try:
+        relevant_docs, message = await retrieve_for_query(db, query, session_id)
+    except HTTPException as http_ex:
+        raise http_ex  # Ensure FastAPI handles HTTPExceptions properly
+    except Exception as e:
+        logger.error(f"Unexpected error in streaming Q&A: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error.")
+
+    prompt = (
+        await build_prompt_async(query.question.strip(), relevant_docs)
+        if relevant_docs
+        else None
+    )
+    if relevant_docs and prompt is None:
+        message = "Relevant documents did not contain useful information."
+
+    # Reserve a generation slot before responding, so a full queue is still a 503
+    key = cached_answer = answer_stream = None
+    if prompt is not None:
+        key = answer_key(prompt, query)
+        cached_answer = answer_cache.get(key) if CACHE_ENABLED else None
+        if cached_answer is None:
+            answer_stream = AnswerStream(
+                prompt, max_new_tokens=query.max_new_tokens, max_time=query.max_time
+            )
+
+    async def events():
+        yield sse_event(
+            "meta",
+            {
+                "message": message,
+                "document_ids": list(dict.fromkeys(doc.document_id for doc in relevant_docs)),
+                "chunk_ids": [doc.id for doc in relevant_docs],
+            },
+        )
+        if prompt is None:
+            yield sse_event("done", {"answer": "No relevant content found."})
+            return
+        if cached_answer is not None:
+            yield sse_event("token", {"text": cached_answer})
+            yield sse_event("done", {"answer": cached_answer})
+            return
+
+        parts = []
+        try:
+            async for text in answer_stream:
+                parts.append(text)
+                yield sse_event("token", {"text": text})
+        except Exception as e:
+            logger.error(f"Error streaming answer: {e}")
+            yield sse_event("error", {"detail": "Failed to generate answer."})
+            return
+
+        answer = "".join(parts).strip()
+        if answer and CACHE_ENABLED:
+            answer_cache.set(key, answer)
+        logger.info(f"Streamed Q&A executed successfully for: {query.question}")
+        yield sse_event("done", {"answer": answer or "No answer generated."})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # Frees the reserved slot if the client left before the answer started
+        background=BackgroundTask(answer_stream.close) if answer_stream else None,
+    )
+
+
+@router.post(
+    "/qa/batch/",
+    response_model=BatchAnswerResponse,
+    summary="Answer several questions in one request",
+)
+async def answer_questions(
+    query: BatchQuery,
+    db: AsyncSession = Depends(get_db),
+    session_id: str = Depends(get_session_id),
+):
+    """
+    Answer a list of questions like /qa/, batching every stage.
+
+    All new questions are queued for embedding together, searched in one FAISS
+    call and their chunks loaded in one query; the prompts are then generated
+    in length-sorted batches. Results come back in the order of the questions,
+    and a failed question only sets ``error`` on its own item. If the embedding
+    queue has no room for the questions, the request gets a 503.
+    """
+    try:
+        results = [BatchAnswerItem(question=question) for question in query.questions]
+        texts = {}
+        for position, question in enumerate(query.questions):
+            if question.strip():
+                texts[position] = question.strip()
+            else:
+                results[position].error = "Question cannot be empty."
+
+        # Embed the distinct questions that are not cached, together
+        embeddings = {}
+        if CACHE_ENABLED:
+            for position, text in texts.items():
+                embedding = embedding_cache.get(normalize_question(text))
+                if embedding is not None:
+                    embeddings[position] = embedding
+        missing = list(
+            dict.fromkeys(
+                text for position, text in texts.items() if position not in embeddings
+            )
+        )
+        if missing:
+            encoded = await generate_embeddings_async(missing)
+            if encoded is not None:
+                encoded = dict(zip(missing, encoded))
+                for text, embedding in encoded.items():
+                    if CACHE_ENABLED:
+                        embedding_cache.set(normalize_question(text), embedding)
+                for position, text in texts.items():
+                    if position not in embeddings:
+                        embeddings[position] = encoded[text]
+        for position in texts:
+            if position not in embeddings:
+                results[position].error = "Embedding generation failed."
+
+        # Retrieve the chunks of every question with one search and one query
+        positions = sorted(embeddings)
+        selection = await run_in_threadpool(selection_store.get, session_id)
+        retrieved = await retrieve_relevant_docs_batch(
+            db,
+            [embeddings[position] for position in positions],
+            k=candidate_count(query.k),
+            threshold=query.min_similarity,
+            selection=selection,
+            query_texts=[texts[position] for position in positions],
+        )
+        # Re-rank the candidates of all questions together
+        reranked = await rerank_batch_async(
+            [texts[position] for position in positions],
+            [relevant_docs for relevant_docs, _ in retrieved],
+            query.k,
+        )
+        retrieved = [
+            (relevant_docs, message)
+            for relevant_docs, (_, message) in zip(reranked, retrieved)
+        ]
+
+        # Answer from the cache where possible and generate the remaining prompts
+        prompts = {}
+        for position, (relevant_docs, message) in zip(positions, retrieved):
+            results[position].message = message
+            try:
+                prompt = (
+                    await build_prompt_async(texts[position], relevant_docs)
+                    if relevant_docs
+                    else None
+                )
+            except QuestionTooLongError as e:
+                results[position].error = e.detail
+                continue
+            if prompt is None:
+                if relevant_docs:
+                    results[position].message = (
+                        "Relevant documents did not contain useful information."
+                    )
+                results[position].answer = "No relevant content found."
+                continue
+            cached_answer = (
+                answer_cache.get(answer_key(prompt, query)) if CACHE_ENABLED else None
+            )
+            if cached_answer is not None:
+                results[position].answer = cached_answer
+            else:
+                prompts[position] = prompt
+
+        distinct_prompts = list(dict.fromkeys(prompts.values()))
+        if distinct_prompts:
+            answers = dict(
+                zip(
+                    distinct_prompts,
+                    await generate_answers_async(
+                        distinct_prompts,
+                        max_new_tokens=query.max_new_tokens,
+                        max_time=query.max_time,
+                    ),
+                )
+            )
+            for prompt, answer in answers.items():
+                if answer and CACHE_ENABLED:
+                    answer_cache.set(answer_key(prompt, query), answer)
+            for position, prompt in prompts.items():
+                if answers[prompt]:
+                    results[position].answer = answers[prompt]
+                else:
+                    results[position].error = "Failed to generate answer."
+
+        logger.info(f"Batch Q&A executed for {len(query.questions)} questions.")
+        return BatchAnswerResponse(results=results)
+
+    except HTTPException as http_ex:
+        raise http_ex  # Ensure FastAPI handles HTTPExceptions properly
+
+    except Exception as e:
+        # Log unexpected errors
+        logger.error(f"Unexpected error in batch Q&A: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error.")
+
+
+@router.get("/qa/cache/", summary="Get hit and miss counters of the Q&A caches")
+async def get_cache_stats():
+    """
+    Return entries, memory use, hits, misses and evictions of each cache layer.
+    """
+    return cache_stats()
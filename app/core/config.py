@@ -12,3 +12,184 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL environment variable is not set")
+
+# URL of the async engine used by the request handlers. Defaults to
+# DATABASE_URL with its async driver: asyncpg for PostgreSQL, aiosqlite for SQLite.
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL")
+
+# Log every SQL statement (debugging only; very verbose)
+SQL_ECHO = os.getenv("SQL_ECHO", "false").lower() in ("1", "true", "yes")
+
+# Connection pool: kept-open connections, extra connections under load, seconds
+# to wait for a free connection, and seconds after which a connection is
+# replaced (before the server drops it). Not used with SQLite.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+# Project root, used to resolve default paths for on-disk artifacts
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+
+# Directory holding the FAISS index snapshot and its delta log
+FAISS_INDEX_DIR = os.getenv("FAISS_INDEX_DIR", os.path.join(BASE_DIR, "data", "faiss"))
+
+# Number of logged index changes after which a new snapshot is written
+FAISS_SNAPSHOT_INTERVAL = int(os.getenv("FAISS_SNAPSHOT_INTERVAL", "1000"))
+
+# FAISS index type: flat, ivf_flat, ivf_pq or hnsw
+FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "flat").lower()
+
+# Corpus size at which trained index types (IVF) are built in the background
+FAISS_TRAIN_THRESHOLD = int(os.getenv("FAISS_TRAIN_THRESHOLD", "50000"))
+
+# IVF settings: number of inverted lists and lists visited per query
+FAISS_NLIST = int(os.getenv("FAISS_NLIST", "1024"))
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", "16"))
+
+# Product quantizer settings for ivf_pq (sub-quantizers must divide the dimension)
+FAISS_PQ_M = int(os.getenv("FAISS_PQ_M", "48"))
+FAISS_PQ_NBITS = int(os.getenv("FAISS_PQ_NBITS", "8"))
+
+# HNSW settings: graph degree and candidate list sizes at build and query time
+FAISS_HNSW_M = int(os.getenv("FAISS_HNSW_M", "32"))
+FAISS_HNSW_EF_CONSTRUCTION = int(os.getenv("FAISS_HNSW_EF_CONSTRUCTION", "200"))
+FAISS_HNSW_EF_SEARCH = int(os.getenv("FAISS_HNSW_EF_SEARCH", "64"))
+
+# Searches restricted to at most this many chunks are scored exactly instead of
+# going through the index with an ID selector
+FAISS_EXACT_SEARCH_MAX_IDS = int(os.getenv("FAISS_EXACT_SEARCH_MAX_IDS", "4096"))
+
+# Serving role of this process: "standalone" (one process owns the index),
+# "writer" (the index writer process) or "reader" (API workers serving the index
+# the writer publishes)
+INDEX_ROLE = os.getenv("INDEX_ROLE", "standalone").lower()
+
+# Seconds between checks for a newly published index in reader processes
+INDEX_REFRESH_INTERVAL = float(os.getenv("INDEX_REFRESH_INTERVAL", "2"))
+
+# Seconds between database polls (and snapshot publications) of the index writer
+INDEX_PUBLISH_INTERVAL = float(os.getenv("INDEX_PUBLISH_INTERVAL", "5"))
+
+# Retrieval: "vector" (FAISS only) or "hybrid" (FAISS and BM25 keyword search,
+# fused by reciprocal rank fusion over HYBRID_CANDIDATES results of each)
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid").lower()
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "50"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+# BM25 index: term frequency saturation, length normalization, snapshot
+# directory and number of added chunks after which a snapshot is written
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+LEXICAL_INDEX_DIR = os.getenv("LEXICAL_INDEX_DIR", os.path.join(BASE_DIR, "data", "bm25"))
+LEXICAL_SNAPSHOT_INTERVAL = int(os.getenv("LEXICAL_SNAPSHOT_INTERVAL", "10000"))
+
+# Local copy of the stored embeddings in memory-mapped files, used to rebuild
+# the FAISS index without reading them from the database, and its element type:
+# "float32" (exact), "float16" or "int8" (scalar quantized, 2x or 4x smaller)
+VECTOR_STORAGE_DIR = os.getenv(
+    "VECTOR_STORAGE_DIR", os.path.join(BASE_DIR, "data", "vectors")
+)
+VECTOR_STORAGE_DTYPE = os.getenv("VECTOR_STORAGE_DTYPE", "float32").lower()
+
+# Minimum cosine similarity between a query and a document to count as a match
+SIMILARITY_THRESHOLD = float(os.getenv("SIMILARITY_THRESHOLD", "0.3"))
+
+# Document chunking: "sentences" or "tokens", with sizes in whitespace tokens
+CHUNK_STRATEGY = os.getenv("CHUNK_STRATEGY", "sentences").lower()
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "128"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "32"))
+
+# Sentence embedding model
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+
+# Inference backend of each model: "torch" (fp32), "torch_int8" (dynamically
+# quantized) or "onnx" (onnxruntime, needs optimum[onnxruntime])
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+GENERATION_BACKEND = os.getenv("GENERATION_BACKEND", "torch").lower()
+
+# Directory where ONNX exports of the generation model are kept
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", os.path.join(BASE_DIR, "data", "onnx"))
+
+# Maximum number of texts encoded per forward pass of the embedding model
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+
+# Longest time a request waits for concurrent requests to join its batch
+EMBEDDING_MAX_WAIT_MS = float(os.getenv("EMBEDDING_MAX_WAIT_MS", "5"))
+
+# Maximum number of texts waiting to be embedded
+EMBEDDING_QUEUE_SIZE = int(os.getenv("EMBEDDING_QUEUE_SIZE", "4096"))
+
+# Retrieved passages whose word 3-grams overlap a passage already in the prompt
+# by at least this Jaccard similarity are left out as near-duplicates
+CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.8"))
+
+# Answer generation model, and an optional smaller model (e.g.
+# google/flan-t5-base) that answers prompts of at most GENERATION_ROUTE_MAX_TOKENS
+GENERATION_MODEL = os.getenv("GENERATION_MODEL", "google/flan-t5-large")
+GENERATION_SMALL_MODEL = os.getenv("GENERATION_SMALL_MODEL", "")
+GENERATION_ROUTE_MAX_TOKENS = int(os.getenv("GENERATION_ROUTE_MAX_TOKENS", "128"))
+
+# Decoding: beams (1 is greedy), early stopping of beam search, default answer
+# length and time budget in seconds (0 for none; requests may ask for less)
+GENERATION_NUM_BEAMS = int(os.getenv("GENERATION_NUM_BEAMS", "1"))
+GENERATION_EARLY_STOPPING = os.getenv(
+    "GENERATION_EARLY_STOPPING", "true"
+).lower() in ("1", "true", "yes")
+GENERATION_MAX_NEW_TOKENS = int(os.getenv("GENERATION_MAX_NEW_TOKENS", "150"))
+GENERATION_MAX_TIME = float(os.getenv("GENERATION_MAX_TIME", "0"))
+
+# Prompts are truncated to the model's input limit, capped at this many tokens
+GENERATION_MAX_INPUT_TOKENS = int(os.getenv("GENERATION_MAX_INPUT_TOKENS", "512"))
+
+# Generation runs in a "thread" or "process" pool with a bounded wait queue
+GENERATION_EXECUTOR = os.getenv("GENERATION_EXECUTOR", "thread").lower()
+GENERATION_WORKERS = int(os.getenv("GENERATION_WORKERS", "1"))
+GENERATION_MAX_PENDING = int(os.getenv("GENERATION_MAX_PENDING", "8"))
+
+# Maximum number of prompts generated together by batched Q&A
+GENERATION_BATCH_SIZE = int(os.getenv("GENERATION_BATCH_SIZE", "8"))
+
+# Optional cross-encoder re-ranking: the top RERANK_CANDIDATES retrieved chunks
+# are scored against the question in batches of RERANK_BATCH_SIZE and only the
+# best k go into the prompt. Re-ranking is skipped when RERANK_WORKERS calls are
+# already running, and stops when RERANK_TIME_BUDGET_MS runs out.
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "false").lower() in ("1", "true", "yes")
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "32"))
+RERANK_TIME_BUDGET_MS = float(os.getenv("RERANK_TIME_BUDGET_MS", "300"))
+RERANK_WORKERS = int(os.getenv("RERANK_WORKERS", "2"))
+
+# Maximum number of questions accepted by one /qa/batch/ request
+QA_BATCH_MAX_QUESTIONS = int(os.getenv("QA_BATCH_MAX_QUESTIONS", "256"))
+
+# Seconds clients are asked to wait (Retry-After) when inference is saturated
+INFERENCE_RETRY_AFTER = int(os.getenv("INFERENCE_RETRY_AFTER", "5"))
+
+# Number of documents stored per bulk insert during bulk ingestion
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "64"))
+
+# Directory where bulk uploads are spooled until their ingestion job completes
+INGEST_SPOOL_DIR = os.getenv("INGEST_SPOOL_DIR", os.path.join(BASE_DIR, "data", "ingest"))
+
+# Batches buffered between the stages of the background ingestion pipeline
+INGEST_QUEUE_DEPTH = int(os.getenv("INGEST_QUEUE_DEPTH", "4"))
+
+# Query caches: question -> embedding, retrieval -> chunk IDs, prompt -> answer
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "3600"))
+# Limits applied to each cache layer separately
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+CACHE_MAX_MB = float(os.getenv("CACHE_MAX_MB", "64"))
+
+# Where document selections are kept: "memory" (per process) or "database"
+# (shared by all workers), how many sessions and for how long
+SELECTION_BACKEND = os.getenv("SELECTION_BACKEND", "memory").lower()
+SELECTION_MAX_SESSIONS = int(os.getenv("SELECTION_MAX_SESSIONS", "10000"))
+SELECTION_TTL_SECONDS = float(os.getenv("SELECTION_TTL_SECONDS", "86400"))
+
+# Startup: "background" warms up models after the server starts listening (it
+# reports ready when done), "blocking" warms up before listening, "lazy" loads
+# models on first use
+WARMUP_MODE = os.getenv("WARMUP_MODE", "background").lower()
@@ -0,0 +1,66 @@
+import os
+import time
+from filelock import FileLock, Timeout
+from app.core.config import (
+    FAISS_INDEX_DIR,
+    INDEX_PUBLISH_INTERVAL,
+    INDEX_ROLE,
+    RETRIEVAL_MODE,
+)
+from app.core.logging_config import logger
+
+
+def run_writer(poll_interval=INDEX_PUBLISH_INTERVAL):
+    """
+    Run the single index writer for multi-worker serving.
+
+    The writer keeps the FAISS index up to date with the database, publishes a
+    new snapshot for the reader workers whenever it changed, and runs the bulk
+    ingestion jobs the workers record. A lock file in the index directory
+    ensures only one writer runs at a time.
+
+    Args:
+        poll_interval (float, optional): Seconds between database polls.
+            Defaults to INDEX_PUBLISH_INTERVAL.
+    """
+    if INDEX_ROLE != "writer":
+        raise SystemExit("The index writer must run with INDEX_ROLE=writer.")
+
+    os.makedirs(FAISS_INDEX_DIR, exist_ok=True)
+    lock = FileLock(os.path.join(FAISS_INDEX_DIR, "writer.lock"))
+    try:
+        lock.acquire(timeout=0)
+    except Timeout:
+        raise SystemExit("Another index writer is already running.")
+
+    # Load the index only once this process is known to be the only writer.
+    from app.models.db_models import init_db
+    from app.models.embedding_store_instance import embedding_store
+    from app.models.lexical_index_instance import lexical_index
+    from app.services.ingestion_pipeline import ingestion_worker
+
+    init_db()
+    embedding_store.load_existing_embeddings()
+    if RETRIEVAL_MODE == "hybrid":
+        lexical_index.load_existing()
+    ingestion_worker.start()
+    embedding_store.save_snapshot()
+    logger.info(f"Index writer started; polling every {poll_interval}s.")
+    try:
+        while True:
+            ingestion_worker.enqueue_pending()
+            added = embedding_store.sync_from_database()
+            if added:
+                logger.info(f"Index writer picked up {added} new embedding(s).")
+            if embedding_store.has_unpublished_changes():
+                embedding_store.save_snapshot()
+            # Keeps the BM25 snapshot readers start from close to the database
+            if RETRIEVAL_MODE == "hybrid":
+                lexical_index.sync_from_database()
+            time.sleep(poll_interval)
+    finally:
+        lock.release()
+
+
+if __name__ == "__main__":
+    run_writer()
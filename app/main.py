@@ -1,14 +1,34 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from app.api import document_ingestion, document_selection, question_answering
+from app.api import document_ingestion, document_selection, health, question_answering
 from app.core.logging_config import logger
+from app.models.db_models import async_engine
+from app.services.lifecycle import startup
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """
+    Start the application: create tables, load the index, start the ingestion
+    worker (which resumes interrupted bulk jobs) and warm up the models.
+
+    Depending on WARMUP_MODE this runs in the background, so the server listens
+    right away and /health/ready turns 200 once it is done. On shutdown the
+    pooled async database connections are closed.
+    """
+    startup.start()
+    yield
+    await async_engine.dispose()
+
 
 # Initialize FastAPI
-app = FastAPI(title="Document Q&A API", version="1.0")
+app = FastAPI(title="Document Q&A API", version="1.0", lifespan=lifespan)
 
 # Include API routers
 app.include_router(document_ingestion.router, tags=["Document Ingestion"])
 app.include_router(document_selection.router, tags=["Document Selection"])
 app.include_router(question_answering.router, tags=["Question Answering"])
+app.include_router(health.router, tags=["Health"])
 
 
 @app.get("/")
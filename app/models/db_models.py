@@ -1,6 +1,25 @@
-from sqlalchemy import Column, Integer, String, LargeBinary, create_engine
-from sqlalchemy.orm import DeclarativeBase, sessionmaker
-from app.core.config import DATABASE_URL
+from datetime import datetime, timezone
+from sqlalchemy import (
+    Column,
+    Integer,
+    String,
+    LargeBinary,
+    ForeignKey,
+    DateTime,
+    create_engine,
+    make_url,
+)
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import DeclarativeBase, deferred, relationship, sessionmaker
+from app.core.config import (
+    ASYNC_DATABASE_URL,
+    DATABASE_URL,
+    DB_MAX_OVERFLOW,
+    DB_POOL_RECYCLE,
+    DB_POOL_SIZE,
+    DB_POOL_TIMEOUT,
+    SQL_ECHO,
+)
 from app.core.logging_config import logger
 
 
@@ -16,20 +35,206 @@ class Document(Base):
     Attributes:
         id (int): Primary key for the document.
         text (str): The textual content of the document.
+        content_hash (str): SHA-256 of the normalized text. Unique, so each
+            content is stored (and embedded) once; re-uploads return its ID.
         embedding (bytes): The document's vector embedding stored as binary data.
+            Only set for documents ingested before chunking was introduced.
+            Deferred: loaded only when accessed.
+        chunks (list[Chunk]): The passages the document was split into.
     """
 
     __tablename__ = "documents"
     id = Column(Integer, primary_key=True, index=True)
-    text = Column(String, index=True)
-    embedding = Column(LargeBinary)
-
-
-# Database setup
-try:
-    engine = create_engine(DATABASE_URL, echo=True)
-    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-    Base.metadata.create_all(bind=engine)
-    logger.info("Database initialized successfully.")
-except Exception as e:
-    logger.error(f"Error initializing database: {e}")
+    text = Column(String)
+    content_hash = Column(String(64), unique=True, index=True)
+    embedding = deferred(Column(LargeBinary), group="embedding")
+    chunks = relationship(
+        "Chunk",
+        back_populates="document",
+        cascade="all, delete-orphan",
+        order_by="Chunk.position",
+    )
+
+
+class Chunk(Base):
+    """
+    Represents a passage of a document, the unit that is embedded and retrieved.
+
+    Attributes:
+        id (int): Primary key for the chunk, also its ID in the FAISS index.
+        document_id (int): ID of the document the chunk belongs to.
+        position (int): Zero-based position of the chunk within its document.
+        text (str): The textual content of the chunk.
+        embedding (bytes): The chunk's vector embedding stored as binary data.
+            Deferred, like ``Document.embedding``: loading chunks for retrieval
+            leaves the 1.5 KB vectors in the database, and the index reads them
+            with explicit column queries.
+    """
+
+    __tablename__ = "chunks"
+    id = Column(Integer, primary_key=True, index=True)
+    document_id = Column(
+        Integer, ForeignKey("documents.id", ondelete="CASCADE"), index=True
+    )
+    position = Column(Integer, nullable=False)
+    text = Column(String, nullable=False)
+    embedding = deferred(Column(LargeBinary), group="embedding")
+    document = relationship("Document", back_populates="chunks")
+
+
+def utc_now():
+    """
+    Return the current time as a timezone-aware UTC datetime.
+    """
+    return datetime.now(timezone.utc)
+
+
+class IngestionJob(Base):
+    """
+    Represents a background bulk ingestion job.
+
+    Uploaded files are spooled to ``source_path`` and processed in batches.
+    ``committed_offset`` counts the documents whose batch has been committed, so
+    a job interrupted by a crash resumes right after its last committed batch.
+
+    Attributes:
+        id (str): Job identifier returned to the client.
+        status (str): ``queued``, ``running``, ``completed`` or ``failed``.
+        source_path (str): Directory holding the job's spooled uploads.
+        committed_offset (int): Number of documents handled by committed batches.
+        succeeded (int): Number of documents stored and indexed.
+        failed (int): Number of documents rejected.
+        error (str): Why the job failed, if it did.
+    """
+
+    __tablename__ = "ingestion_jobs"
+    id = Column(String(32), primary_key=True)
+    status = Column(String(16), nullable=False, default="queued", index=True)
+    source_path = Column(String, nullable=False)
+    committed_offset = Column(Integer, nullable=False, default=0)
+    succeeded = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    error = Column(String)
+    created_at = Column(DateTime(timezone=True), default=utc_now)
+    updated_at = Column(DateTime(timezone=True), default=utc_now, onupdate=utc_now)
+    items = relationship(
+        "IngestionJobItem",
+        cascade="all, delete-orphan",
+        order_by="IngestionJobItem.position",
+    )
+
+
+class IngestionJobItem(Base):
+    """
+    Represents the outcome of one document of an ingestion job.
+
+    Attributes:
+        id (int): Primary key.
+        job_id (str): ID of the job the document belongs to.
+        position (int): Zero-based position of the document in the job's input.
+        filename (str): File name, archive member or JSONL line of the document.
+        status (str): ``ok`` or ``error``.
+        document_id (int): ID of the stored document on success.
+        detail (str): Why the document was rejected on failure.
+    """
+
+    __tablename__ = "ingestion_job_items"
+    id = Column(Integer, primary_key=True)
+    job_id = Column(
+        String(32), ForeignKey("ingestion_jobs.id", ondelete="CASCADE"), index=True
+    )
+    position = Column(Integer, nullable=False)
+    filename = Column(String, nullable=False)
+    status = Column(String(16), nullable=False)
+    document_id = Column(Integer)
+    detail = Column(String)
+
+
+class SelectionSession(Base):
+    """
+    Represents the document selection of one client session.
+
+    IDs are stored as packed int64 arrays so a selection can be loaded with a
+    single primary key lookup and used by retrieval without further queries.
+
+    Attributes:
+        session_id (str): Session identifier sent by the client.
+        document_ids (bytes): Sorted IDs of the selected documents.
+        chunk_ids (bytes): Sorted IDs of all chunks of the selected documents.
+        updated_at (datetime): When the selection was last changed.
+    """
+
+    __tablename__ = "selection_sessions"
+    session_id = Column(String(128), primary_key=True)
+    document_ids = Column(LargeBinary, nullable=False)
+    chunk_ids = Column(LargeBinary, nullable=False)
+    updated_at = Column(DateTime(timezone=True), default=utc_now, onupdate=utc_now)
+
+
+def engine_options(url):
+    """
+    Return the create_engine options for a database URL.
+
+    Server databases get a tuned connection pool: pre-ping replaces connections
+    the server closed, and recycling replaces them before idle timeouts do.
+    SQLite keeps SQLAlchemy's default pool, which takes no sizing options.
+    """
+    options = {"echo": SQL_ECHO}
+    if make_url(url).get_backend_name() != "sqlite":
+        options.update(
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_pre_ping=True,
+        )
+    return options
+
+
+# Async drivers used for the request handlers, by backend
+ASYNC_DRIVERS = {"postgresql": "asyncpg", "sqlite": "aiosqlite"}
+
+
+def async_database_url(url):
+    """
+    Return the URL of the async engine: ``ASYNC_DATABASE_URL`` if set, else
+    ``url`` with the async driver of its backend.
+
+    Raises:
+        ValueError: If the backend has no known async driver.
+    """
+    if ASYNC_DATABASE_URL:
+        return ASYNC_DATABASE_URL
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(
+            f"No async driver known for '{backend}' databases; set ASYNC_DATABASE_URL."
+        )
+    return url.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}")
+
+
+# Database setup; creating the engines does not connect yet. The sync engine
+# serves ingestion, the index and other worker threads; request handlers use
+# the async engine so database round trips do not block the event loop.
+engine = create_engine(DATABASE_URL, **engine_options(DATABASE_URL))
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+async_engine = create_async_engine(
+    async_database_url(DATABASE_URL), **engine_options(DATABASE_URL)
+)
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, autoflush=False, expire_on_commit=False
+)
+
+
+def init_db():
+    """
+    Create missing tables. Called at application startup rather than on import,
+    so importing the models never touches the database.
+    """
+    try:
+        Base.metadata.create_all(bind=engine)
+        logger.info("Database initialized successfully.")
+    except Exception as e:
+        logger.error(f"Error initializing database: {e}")
+        raise
@@ -1,109 +1,1189 @@
+import glob
+import json
+import os
+import threading
+import time
 import faiss
 import numpy as np
+from sqlalchemy import select
+from app.core.config import (
+    FAISS_INDEX_DIR,
+    FAISS_SNAPSHOT_INTERVAL,
+    FAISS_INDEX_TYPE,
+    FAISS_TRAIN_THRESHOLD,
+    FAISS_NLIST,
+    FAISS_NPROBE,
+    FAISS_PQ_M,
+    FAISS_PQ_NBITS,
+    FAISS_HNSW_M,
+    FAISS_HNSW_EF_CONSTRUCTION,
+    FAISS_HNSW_EF_SEARCH,
+    FAISS_EXACT_SEARCH_MAX_IDS,
+    INDEX_ROLE,
+    INDEX_REFRESH_INTERVAL,
+    SIMILARITY_THRESHOLD,
+    VECTOR_STORAGE_DIR,
+)
 from app.core.logging_config import logger
-from app.models.db_models import Document
+from app.models import index_factory
+from app.models.lexical_index import GAP_RETRY_SECONDS, MAX_GAP_IDS
+from app.models.vector_storage import VectorStorage
+from app.models.db_models import Chunk
 from app.models.db_models import SessionLocal
 
+# Number of rows fetched per round trip when reading embeddings from the database
+LOAD_BATCH_SIZE = 1000
+
+# Training sample size per IVF list; FAISS recommends between 39 and 256
+TRAINING_POINTS_PER_LIST = 64
+
+# Upper bound on extra neighbours fetched to make up for tombstoned vectors
+MAX_TOMBSTONE_OVERFETCH = 1000
+
+# Upper bound on the HNSW candidate list of searches restricted to a subset
+MAX_SELECTIVE_EF_SEARCH = 4096
+
+# What the IDs in a snapshot refer to; older snapshots were keyed by document ID
+SNAPSHOT_KEY = "chunk"
+
+# Serving roles: a standalone process owns its index; with several processes one
+# writer updates and publishes the index and readers memory-map what it publishes
+STANDALONE = "standalone"
+WRITER = "writer"
+READER = "reader"
+ROLES = (STANDALONE, WRITER, READER)
+
 
 class EmbeddingStore:
     """
-    A class to manage document embeddings using FAISS.
+    A class to manage document chunk embeddings using FAISS.
+
+    Embeddings are stored in an index keyed by ``Chunk.id`` so that chunks can be
+    added, removed and updated individually or in batches, and searches return
+    real chunk IDs instead of FAISS row positions.
+
+    The index is persisted as an on-disk snapshot plus a delta log of the
+    changes made since that snapshot. On startup the snapshot is memory-mapped
+    and only the logged changes and chunks newer than the snapshot's watermark
+    (its highest chunk ID) are read from the database.
+
+    Embeddings read from the database are also appended to a memory-mapped
+    VectorStorage, so rebuilding the index (without a snapshot, or to train a
+    new index type) streams vectors from local files instead of the database.
+    Removed and updated chunks are recorded in the storage as well.
+
+    The index type is configurable (flat, IVF-Flat, IVF-PQ or HNSW). Trained
+    index types start out flat and are built in a background thread once the
+    corpus reaches ``FAISS_TRAIN_THRESHOLD`` vectors; queries keep using the
+    current index until the new one is swapped in.
+
+    To serve from several worker processes, run one process in the ``writer``
+    role and the workers as ``reader``s. Every snapshot is written to a new
+    versioned file and published by atomically replacing the metadata file.
+    Readers map the published snapshot read-only, so all workers share one
+    copy of the vectors in the page cache, and swap in newer versions as the
+    writer publishes them. Readers never modify the index; chunks they store
+    are picked up from the database by the writer.
+
+    Chunks are not always committed in ID order, e.g. with concurrent uploads.
+    IDs below the watermark that were skipped (gaps) are looked up again by
+    database syncs, and on startup, for ``GAP_RETRY_SECONDS``, like in the BM25
+    index.
 
     Attributes:
         dimension (int): The dimension of the embedding vectors.
-        index (faiss.IndexFlatL2): FAISS index to store and retrieve embeddings.
+        index (faiss.Index): FAISS index mapping chunk IDs to embeddings.
+        index_type (str): The configured index type.
+        active_type (str): The type of the index currently serving queries.
+        index_dir (str): Directory holding the snapshot, its metadata and delta log.
+        role (str): ``standalone``, ``writer`` or ``reader``.
+        snapshot_version (int): Version of the last snapshot written or loaded.
     """
 
-    def __init__(self, dimension=384):
+    def __init__(
+        self,
+        dimension=384,
+        index_dir=FAISS_INDEX_DIR,
+        index_type=FAISS_INDEX_TYPE,
+        role=INDEX_ROLE,
+        load=True,
+        vector_dir=VECTOR_STORAGE_DIR,
+    ):
         """
-        Initialize the FAISS index and load existing embeddings from the database.
+        Initialize the FAISS index and load existing embeddings.
 
         Args:
             dimension (int, optional): The dimensionality of the embeddings. Defaults to 384.
+            index_dir (str, optional): Directory for the index snapshot and delta log.
+            index_type (str, optional): Index type to build. Defaults to FAISS_INDEX_TYPE.
+            role (str, optional): Serving role. Defaults to INDEX_ROLE.
+            load (bool, optional): Load existing embeddings now. When False, call
+                ``load_existing_embeddings`` later (e.g. at application startup).
+            vector_dir (str, optional): Directory of the vector storage.
+                Defaults to VECTOR_STORAGE_DIR.
         """
+        if index_type not in index_factory.INDEX_TYPES:
+            raise ValueError(
+                f"Unsupported FAISS index type '{index_type}'. "
+                f"Expected one of {index_factory.INDEX_TYPES}."
+            )
+        if role not in ROLES:
+            raise ValueError(f"Unsupported index role '{role}'. Expected one of {ROLES}.")
         self.dimension = dimension
-        self.index = faiss.IndexFlatL2(
-            dimension
-        )  # IndexFlatL2 creates a flat FAISS index for L2 (Euclidean) distance-based similarity search.
-        self.load_existing_embeddings()  # Load on startup
+        # Embeddings are L2-normalized at ingest, so inner product is cosine similarity.
+        self.metric = faiss.METRIC_INNER_PRODUCT
+        self.index_type = index_type
+        self.index_dir = index_dir
+        self.role = role
+        self.meta_path = os.path.join(index_dir, "index.meta.json")
+        self.delta_path = os.path.join(index_dir, "index.delta.jsonl")
+        self.vectors = VectorStorage(vector_dir, dimension)
+        self._lock = threading.RLock()
+        self._pending_changes = 0
+        self._tombstones = set()
+        self._build_thread = None
+        self._build_log = None
+        self.build_error = None
+        self.watermark = 0
+        # Skipped chunk IDs below the watermark -> when they were first seen missing
+        self._gaps = {}
+        self.snapshot_version = 0
+        self._refresh_pid = None
+        self._loaded = threading.Event()
+        self.nprobe = FAISS_NPROBE
+        self.ef_search = FAISS_HNSW_EF_SEARCH
+        self.active_type = self._initial_type()
+        self.index = self._create_index(self.active_type)
+        if load:
+            self.load_existing_embeddings()
+
+    def _initial_type(self):
+        """
+        Return the index type to serve before any training has happened.
+        """
+        if self.index_type in index_factory.TRAINED_INDEX_TYPES:
+            return index_factory.FLAT
+        return self.index_type
+
+    def _create_index(self, index_type, ntotal=0):
+        """
+        Create an empty index of the given type using the configured parameters.
+
+        The number of IVF lists is capped so that every list gets enough training
+        points for the current corpus size.
+        """
+        nlist = FAISS_NLIST
+        if index_type in index_factory.TRAINED_INDEX_TYPES and ntotal:
+            nlist = max(1, min(FAISS_NLIST, ntotal // 39))
+            if nlist < FAISS_NLIST:
+                logger.warning(
+                    f"Reducing nlist from {FAISS_NLIST} to {nlist} for {ntotal} vectors."
+                )
+        params = {
+            "nlist": nlist,
+            "nprobe": self.nprobe,
+            "pq_m": FAISS_PQ_M,
+            "pq_nbits": FAISS_PQ_NBITS,
+            "hnsw_m": FAISS_HNSW_M,
+            "ef_construction": FAISS_HNSW_EF_CONSTRUCTION,
+            "ef_search": self.ef_search,
+        }
+        return index_factory.create_index(
+            index_type, self.dimension, self.metric, params
+        )
 
     def load_existing_embeddings(self):
         """
-        Load all stored embeddings from the database into the FAISS index.
+        Load the FAISS index from its snapshot, or rebuild it from the database.
 
-        Retrieves all document embeddings from the database and adds them to the FAISS index
-        for efficient similarity search.
+        If a snapshot exists it is memory-mapped, the delta log is replayed and only
+        chunks above the snapshot watermark are fetched. Otherwise every stored
+        embedding is loaded in batches and a fresh snapshot is written.
+
+        Readers only map the published snapshot, if there is one yet.
         """
         try:
-            db = SessionLocal()
-            documents = db.query(Document).all()
+            if self.role == READER:
+                self.refresh()
+                return
+            self.vectors.open()
+            meta = self._read_snapshot_meta()
+            if meta is not None:
+                self._load_snapshot(meta)
+            else:
+                self._rebuild_from_database()
+            self._maybe_schedule_build()
+        except Exception as e:
+            logger.error(f"Error loading existing embeddings: {e}")
+        finally:
+            self._loaded.set()
+
+    @property
+    def loaded(self):
+        """
+        Whether existing embeddings have been loaded (or loading has failed).
+        """
+        return self._loaded.is_set()
+
+    def _rebuild_from_database(self):
+        """
+        Rebuild the index from every embedding stored in the database.
+        """
+        self.vectors.compact()
+        active_type = self._initial_type()
+        index = self._create_index(active_type)
+        with self._lock:
+            self.watermark = 0
+            self._gaps = {}
+        for ids, embeddings in self._iter_embeddings():
+            index.add_with_ids(embeddings, ids)
+            with self._lock:
+                self._advance_watermark(ids)
+
+        with self._lock:
+            self.index = index
+            self.active_type = active_type
+            self._tombstones = set()
+            self._reset_delta_log()
+
+        if index.ntotal == 0:
+            logger.info("No existing embeddings found in database.")
+            return
+
+        logger.info(f"✅ Loaded {index.ntotal} embeddings into FAISS index.")
+        self.save_snapshot()
+
+    def _read_snapshot_meta(self):
+        """
+        Return the metadata of a usable snapshot, or None if it must be rebuilt.
+
+        Snapshots written with a different similarity metric or dimension, or
+        keyed by something other than chunk IDs, are discarded since their
+        vectors cannot be compared with new queries.
+        """
+        if not os.path.exists(self.meta_path):
+            return None
+        with open(self.meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if not os.path.exists(self._snapshot_path(meta)):
+            return None
+        if (
+            meta.get("metric") != self.metric
+            or meta.get("dimension") != self.dimension
+            or meta.get("key") != SNAPSHOT_KEY
+        ):
+            logger.warning("FAISS snapshot layout changed; rebuilding index.")
+            return None
+        return meta
+
+    def _snapshot_path(self, meta):
+        """
+        Return the path of the snapshot file a metadata record points to.
+
+        Snapshots written before versioning all used ``index.faiss``.
+        """
+        return os.path.join(self.index_dir, meta.get("snapshot", "index.faiss"))
+
+    def _load_snapshot(self, meta):
+        """
+        Memory-map the index snapshot and bring it up to date with the database.
+        """
+        active_type = meta.get("index_type", index_factory.FLAT)
+        index = index_factory.read_index(self._snapshot_path(meta), active_type)
+        index_factory.set_search_params(index, active_type, self.nprobe, self.ef_search)
+        watermark = int(meta.get("watermark", 0))
+        tombstones = set(meta.get("tombstones", []))
+        # Snapshots written before gaps were tracked have none
+        now = time.monotonic()
+        gaps = {int(chunk_id): now for chunk_id in meta.get("gaps", [])}
+        logger.info(
+            f"Loaded {active_type} FAISS snapshot with {index.ntotal} embeddings "
+            f"(watermark {watermark})."
+        )
+
+        with self._lock:
+            self.index = index
+            self.active_type = active_type
+            self._tombstones = tombstones
+            self.snapshot_version = int(meta.get("version", 0))
+            self.watermark = watermark
+            self._gaps = gaps
+
+        # Replay the changes logged since the snapshot was written.
+        changes = self._read_delta_log()
+        added_ids = [chunk_id for op, chunk_id in changes if op == "add"]
+        vectors = self._fetch_embeddings(added_ids)
+        for op, chunk_id in changes:
+            if op == "remove":
+                self._remove_from_index(index, chunk_id)
+            elif chunk_id in vectors:
+                self._add_to_index(index, chunk_id, vectors[chunk_id], replace=True)
+
+        # Catch up on chunks committed after the snapshot, or in its gaps, but
+        # never logged.
+        replayed = set(added_ids)
+        caught_up = 0
+        for ids, embeddings in self._iter_embeddings(min_id=watermark, gap_ids=list(gaps)):
+            keep = np.array([chunk_id not in replayed for chunk_id in ids.tolist()])
+            if keep.any():
+                index.add_with_ids(embeddings[keep], ids[keep])
+                caught_up += int(keep.sum())
+            with self._lock:
+                self._advance_watermark(ids)
+
+        with self._lock:
+            if added_ids:
+                self._advance_watermark(added_ids)
+            self._pending_changes = len(changes)
+
+        logger.info(
+            f"✅ Replayed {len(changes)} logged change(s) and {caught_up} new embedding(s)."
+        )
+        if changes or caught_up:
+            self.save_snapshot()
+
+    def _iter_embeddings(self, min_id=0, gap_ids=()):
+        """
+        Stream ``(ids, embeddings)`` batches for chunks with ``id > min_id`` or
+        whose ID is in ``gap_ids``.
+
+        Chunks up to the vector storage's watermark are read from its mapped
+        files; the rest, and the gaps, come from the database, reading only the
+        ID and embedding columns, and are appended to the storage so the next
+        pass finds them there. Chunks removed from the index are skipped.
+        Embeddings may be read-only views of the storage.
+        """
+        yield from self.vectors.iter_batches(min_id)
+        db = SessionLocal()
+        try:
+            for start in range(0, len(gap_ids), LOAD_BATCH_SIZE):
+                rows = db.execute(
+                    select(Chunk.id, Chunk.embedding).where(
+                        Chunk.id.in_(gap_ids[start : start + LOAD_BATCH_SIZE]),
+                        Chunk.embedding.isnot(None),
+                    )
+                ).all()
+                # Gaps are below the watermark; never extend the storage past them.
+                batch = self._decode_rows(rows, extend=False)
+                if batch is not None:
+                    yield batch
+            # Extending the storage past chunks this pass skips would hide them
+            # from later passes; rows below its watermark go to its overflow.
+            contiguous = min_id <= self.vectors.watermark
+            result = db.execute(
+                select(Chunk.id, Chunk.embedding)
+                .where(
+                    Chunk.id > max(min_id, self.vectors.watermark),
+                    Chunk.embedding.isnot(None),
+                )
+                .order_by(Chunk.id)
+                .execution_options(yield_per=LOAD_BATCH_SIZE)
+            )
+            for rows in result.partitions():
+                batch = self._decode_rows(rows, extend=contiguous)
+                if batch is not None:
+                    yield batch
+        finally:
             db.close()
 
-            if not documents:
-                logger.info("No existing embeddings found in database.")
+    def _decode_rows(self, rows, extend):
+        """
+        Turn ``(id, embedding)`` database rows into an ``(ids, embeddings)``
+        batch, store it in the vector storage and leave out removed chunks.
+
+        Returns:
+            tuple: The batch, or None if no chunk is left.
+        """
+        if not rows:
+            return None
+        ids = np.fromiter((row.id for row in rows), dtype=np.int64)
+        embeddings = np.frombuffer(
+            b"".join(row.embedding for row in rows), dtype=np.float32
+        ).reshape(len(rows), self.dimension).copy()
+        # Rows written before embeddings were normalized at ingest.
+        faiss.normalize_L2(embeddings)
+        if self.role != READER:
+            self.vectors.append(ids, embeddings, extend=extend)
+        # Removed chunks are still in the database.
+        keep = ~self.vectors.is_deleted(ids)
+        if not keep.any():
+            return None
+        return ids[keep], embeddings[keep]
+
+    def _fetch_embeddings(self, chunk_ids):
+        """
+        Fetch the embeddings of the given chunks as a ``{id: vector}`` dict.
+        """
+        if not chunk_ids:
+            return {}
+        db = SessionLocal()
+        try:
+            rows = (
+                db.query(Chunk.id, Chunk.embedding)
+                .filter(Chunk.id.in_(set(chunk_ids)), Chunk.embedding.isnot(None))
+                .all()
+            )
+        finally:
+            db.close()
+        vectors = {}
+        for row in rows:
+            vector = np.frombuffer(row.embedding, dtype=np.float32).reshape(1, -1).copy()
+            faiss.normalize_L2(vector)
+            vectors[row.id] = vector[0]
+        return vectors
+
+    def _add_to_index(self, index, chunk_id, embedding, replace=False):
+        """
+        Add one vector to ``index``, optionally replacing an existing vector.
+
+        Index types without in-place removal keep removed IDs as tombstones until
+        the next background rebuild; re-adding such an ID is deferred to that
+        rebuild so the stale vector is never returned.
+        """
+        ids = np.array([chunk_id], dtype=np.int64)
+        if not index_factory.supports_removal(self.active_type):
+            if chunk_id in self._tombstones:
                 return
+        elif replace:
+            index.remove_ids(ids)
+        index.add_with_ids(np.array([embedding], dtype=np.float32), ids)
 
-            # Convert binary embeddings to a list of NumPy arrays, then combine into a 2D NumPy array for FAISS indexing.
-            embeddings = [
-                np.frombuffer(doc.embedding, dtype=np.float32) for doc in documents
-            ]
-            embeddings = np.array(embeddings, dtype=np.float32)
+    def _remove_from_index(self, index, chunk_id):
+        """
+        Remove one vector from ``index`` and return the number of vectors removed.
+        """
+        if index_factory.supports_removal(self.active_type):
+            return index.remove_ids(np.array([chunk_id], dtype=np.int64))
+        self._tombstones.add(int(chunk_id))
+        return 1
 
-            # If valid embeddings exist, they are added to the FAISS index.
-            if embeddings.shape[0] > 0:
-                self.index.add(embeddings)
-                logger.info(f"✅ Loaded {len(embeddings)} embeddings into FAISS index.")
-            else:
-                logger.warning("No valid embeddings found in database.")
+    def save_snapshot(self):
+        """
+        Write the current index to disk and truncate the delta log.
+
+        Each snapshot goes to a new versioned file and is published by atomically
+        replacing the metadata file that points to it, so a crash never leaves a
+        partially written snapshot behind and readers always see a complete one.
+        Older snapshot files are deleted; readers still mapping them keep their
+        pages until they swap.
+        """
+        if self.role == READER:
+            return
+        try:
+            os.makedirs(self.index_dir, exist_ok=True)
+            with self._lock:
+                version = self.snapshot_version + 1
+                snapshot = f"index.{version}.faiss"
+                tmp_path = os.path.join(self.index_dir, f"{snapshot}.tmp")
+                faiss.write_index(self.index, tmp_path)
+                os.replace(tmp_path, os.path.join(self.index_dir, snapshot))
+
+                tmp_meta = f"{self.meta_path}.tmp"
+                with open(tmp_meta, "w", encoding="utf-8") as f:
+                    json.dump(
+                        {
+                            "version": version,
+                            "snapshot": snapshot,
+                            "watermark": self.watermark,
+                            "gaps": sorted(self._gaps),
+                            "ntotal": self.index.ntotal,
+                            "index_type": self.active_type,
+                            "tombstones": sorted(self._tombstones),
+                            "metric": self.metric,
+                            "dimension": self.dimension,
+                            "key": SNAPSHOT_KEY,
+                        },
+                        f,
+                    )
+                os.replace(tmp_meta, self.meta_path)
+                self.snapshot_version = version
+
+                self._reset_delta_log()
+                self._remove_old_snapshots(snapshot)
+            logger.info(
+                f"Saved FAISS snapshot version {version} with "
+                f"{self.index.ntotal} embeddings."
+            )
         except Exception as e:
-            logger.error(f"Error loading existing embeddings: {e}")
+            logger.error(f"Error saving FAISS snapshot: {e}")
+
+    def _remove_old_snapshots(self, current):
+        """
+        Delete snapshot files other than ``current``.
+        """
+        for path in glob.glob(os.path.join(self.index_dir, "index*.faiss")):
+            if os.path.basename(path) != current:
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    logger.warning(f"Could not remove old FAISS snapshot {path}: {e}")
+
+    def refresh(self):
+        """
+        Swap in the latest published snapshot if it is newer than the one served.
+
+        Used by readers; the snapshot is mapped read-only and replaces the current
+        index atomically, so in-flight searches finish on the previous one.
+
+        Returns:
+            bool: True if a newer snapshot was loaded.
+        """
+        meta = self._read_snapshot_meta()
+        if meta is None or int(meta.get("version", 0)) == self.snapshot_version:
+            return False
+        active_type = meta.get("index_type", index_factory.FLAT)
+        try:
+            index = index_factory.read_index(
+                self._snapshot_path(meta), active_type, writable=False
+            )
+        except RuntimeError as e:
+            # The writer replaced the snapshot while it was being opened; the next
+            # poll will find the newer one.
+            logger.warning(f"Could not load published FAISS snapshot: {e}")
+            return False
+        index_factory.set_search_params(index, active_type, self.nprobe, self.ef_search)
+        with self._lock:
+            self.index = index
+            self.active_type = active_type
+            self._tombstones = set(meta.get("tombstones", []))
+            self.watermark = int(meta.get("watermark", 0))
+            self.snapshot_version = int(meta.get("version", 0))
+        logger.info(
+            f"Serving FAISS snapshot version {self.snapshot_version} with "
+            f"{index.ntotal} embeddings."
+        )
+        return True
+
+    def _ensure_refresher(self):
+        """
+        Start the thread that polls for published snapshots in reader processes.
+
+        Checked per process, since threads do not survive a fork.
+        """
+        if self.role != READER or self._refresh_pid == os.getpid():
+            return
+        with self._lock:
+            if self._refresh_pid == os.getpid():
+                return
+            self._refresh_pid = os.getpid()
+            threading.Thread(
+                target=self._refresh_loop, name="faiss-index-refresh", daemon=True
+            ).start()
+
+    def _refresh_loop(self):
+        """
+        Poll for newly published snapshots every ``INDEX_REFRESH_INTERVAL`` seconds.
+        """
+        while True:
+            time.sleep(INDEX_REFRESH_INTERVAL)
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Error refreshing FAISS index: {e}")
+
+    def sync_from_database(self):
+        """
+        Add chunks committed to the database above the watermark, and chunks in
+        gaps below it that have been committed since, to the index.
+
+        Used by the writer to pick up chunks stored by reader processes.
+
+        Returns:
+            int: Number of embeddings added.
+        """
+        with self._lock:
+            self._expire_gaps()
+            gap_ids = list(self._gaps)
+            watermark = self.watermark
+        added = 0
+        for ids, embeddings in self._iter_embeddings(min_id=watermark, gap_ids=gap_ids):
+            self.add_embeddings(ids, embeddings)
+            added += len(ids)
+        return added
+
+    def _advance_watermark(self, ids):
+        """
+        Raise the watermark to the highest of ``ids`` (chunks just added) and
+        record the IDs it skips as gaps. The lock must be held.
+
+        Chunks are not always committed in ID order, e.g. with concurrent
+        uploads, so gaps are looked up again by database syncs for
+        ``GAP_RETRY_SECONDS``; at most ``MAX_GAP_IDS`` are recorded per call.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        self._expire_gaps()
+        if self._gaps:
+            for chunk_id in ids.tolist():
+                self._gaps.pop(chunk_id, None)
+        highest = int(ids.max())
+        if highest <= self.watermark:
+            return
+        start = max(self.watermark + 1, highest - len(ids) - MAX_GAP_IDS)
+        skipped = np.setdiff1d(np.arange(start, highest, dtype=np.int64), ids)
+        now = time.monotonic()
+        for chunk_id in skipped[-MAX_GAP_IDS:].tolist():
+            self._gaps[chunk_id] = now
+        self.watermark = highest
+
+    def _expire_gaps(self):
+        """
+        Stop looking up gaps older than ``GAP_RETRY_SECONDS``; their chunks were
+        rolled back. The lock must be held.
+        """
+        expired = time.monotonic() - GAP_RETRY_SECONDS
+        # Gaps are recorded in time order
+        while self._gaps:
+            chunk_id, seen = next(iter(self._gaps.items()))
+            if seen > expired:
+                break
+            del self._gaps[chunk_id]
+
+    def has_unpublished_changes(self):
+        """
+        Return whether changes were made since the last snapshot was written.
+        """
+        return self._pending_changes > 0
+
+    def _read_delta_log(self):
+        """
+        Read the ``(op, chunk_id)`` entries logged since the last snapshot.
+        """
+        if not os.path.exists(self.delta_path):
+            return []
+        changes = []
+        with open(self.delta_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    changes.append((entry["op"], int(entry["id"])))
+                except (ValueError, KeyError):
+                    # A torn final line from a crash mid-write is ignored.
+                    logger.warning("Skipping malformed FAISS delta log entry.")
+        return changes
+
+    def _reset_delta_log(self):
+        """
+        Truncate the delta log after a snapshot has captured its changes.
+        """
+        self._pending_changes = 0
+        if os.path.exists(self.delta_path):
+            os.remove(self.delta_path)
+
+    def _log_change(self, op, chunk_id, embedding=None):
+        """
+        Append a change to the delta log and snapshot once enough have piled up.
+        """
+        self._log_changes(op, [chunk_id], [embedding])
+
+    def _log_changes(self, op, chunk_ids, embeddings):
+        """
+        Append the same change for several chunks to the delta log.
+
+        While a background build is running the changes are also queued so they
+        can be applied to the new index before it is swapped in.
+        """
+        os.makedirs(self.index_dir, exist_ok=True)
+        with open(self.delta_path, "a", encoding="utf-8") as f:
+            f.writelines(
+                json.dumps({"op": op, "id": int(chunk_id)}) + "\n"
+                for chunk_id in chunk_ids
+            )
+        if self._build_log is not None:
+            self._build_log.extend(
+                (op, int(chunk_id), embedding)
+                for chunk_id, embedding in zip(chunk_ids, embeddings)
+            )
+        self._pending_changes += len(chunk_ids)
+        if self._pending_changes >= FAISS_SNAPSHOT_INTERVAL:
+            self.save_snapshot()
 
-    def add_embedding(self, embedding):
+    def _maybe_schedule_build(self):
+        """
+        Start a background build when the serving index no longer matches the
+        configured type, or when tombstones are waiting to be purged.
+        """
+        if self.role == READER:
+            return
+        with self._lock:
+            if self._build_thread is not None:
+                return
+            needs_upgrade = (
+                self.build_error is None
+                and self.active_type != self.index_type
+                and (
+                    self.index_type not in index_factory.TRAINED_INDEX_TYPES
+                    or self.index.ntotal >= FAISS_TRAIN_THRESHOLD
+                )
+            )
+            if not needs_upgrade and not self._tombstones:
+                return
+            self._build_log = []
+            self._build_thread = threading.Thread(
+                target=self._build_in_background, name="faiss-index-build", daemon=True
+            )
+            self._build_thread.start()
+
+    def _build_in_background(self):
+        """
+        Build (and train, if needed) a new index of the configured type from the
+        database, then swap it in.
+
+        Queries keep using the current index while the new one is built. Changes
+        made in the meantime are queued and applied before the swap, which is the
+        only step that takes the lock.
+        """
+        index_type = self.index_type
+        started = time.perf_counter()
+        try:
+            # Merge late chunks and drop removed ones before reading the storage.
+            self.vectors.compact()
+            ntotal = self.index.ntotal
+            index = self._create_index(index_type, ntotal)
+            if not index.is_trained:
+                sample = self._training_sample(faiss.extract_index_ivf(index).nlist, ntotal)
+                logger.info(
+                    f"Training {index_type} index on {len(sample)} vectors in the background."
+                )
+                index.train(sample)
+
+            built_ids = []
+            for ids, embeddings in self._iter_embeddings():
+                index.add_with_ids(embeddings, ids)
+                built_ids.append(ids)
+            built_ids = np.concatenate(built_ids) if built_ids else np.empty(0, np.int64)
+
+            with self._lock:
+                previous_type = self.active_type
+                self.active_type = index_type
+                self._tombstones = set()
+                removed = set()
+                for op, chunk_id, embedding in self._build_log:
+                    if op == "remove":
+                        self._remove_from_index(index, chunk_id)
+                        removed.add(chunk_id)
+                    elif embedding is not None:
+                        # Skip adds whose rows were already read from the database.
+                        if chunk_id in removed or not np.isin(chunk_id, built_ids):
+                            self._add_to_index(index, chunk_id, embedding)
+                self.index = index
+                self._build_log = None
+                self._build_thread = None
+            logger.info(
+                f"✅ Swapped {previous_type} index for {index_type} index with "
+                f"{index.ntotal} embeddings in {time.perf_counter() - started:.1f}s."
+            )
+            self.save_snapshot()
+            # Purge any tombstones created while this build was running.
+            self._maybe_schedule_build()
+        except Exception as e:
+            logger.error(f"Error building {index_type} index: {e}")
+            with self._lock:
+                # Keep serving the current index; retrying on every add would only
+                # repeat the failure.
+                self.build_error = str(e)
+                self._build_log = None
+                self._build_thread = None
+
+    def _training_sample(self, nlist, ntotal):
+        """
+        Draw a random training sample of about ``TRAINING_POINTS_PER_LIST`` vectors
+        per IVF list while streaming embeddings from the database.
+        """
+        target = nlist * TRAINING_POINTS_PER_LIST
+        fraction = min(1.0, target / max(ntotal, 1))
+        rng = np.random.default_rng()
+        sample = []
+        for _, embeddings in self._iter_embeddings():
+            mask = rng.random(len(embeddings)) < fraction
+            sample.append(embeddings[mask])
+        return np.ascontiguousarray(np.concatenate(sample)[:target])
+
+    def wait_for_build(self, timeout=None):
+        """
+        Block until a running background build has finished.
+
+        Args:
+            timeout (float, optional): Maximum number of seconds to wait.
+        """
+        thread = self._build_thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def add_embedding(self, chunk_id, embedding):
         """
         Add a new embedding vector to the FAISS index.
 
         Args:
+            chunk_id (int): ID of the chunk the embedding belongs to.
             embedding (np.ndarray): A numpy array representing the embedding vector.
         """
+        if self.role == READER:
+            return
+        # Changes made before the index is loaded would be lost when it is swapped in.
+        self._loaded.wait()
         try:
-            self.index.add(np.array([embedding], dtype=np.float32))
-            logger.info("Embedding added to FAISS index.")
+            with self._lock:
+                self._add_to_index(self.index, chunk_id, embedding)
+                self._store_vectors(np.array([chunk_id], dtype=np.int64), embedding)
+                self._advance_watermark([chunk_id])
+                self._log_change("add", chunk_id, embedding)
+            logger.info(f"Embedding for chunk {chunk_id} added to FAISS index.")
+            self._maybe_schedule_build()
         except Exception as e:
             logger.error(f"Error adding embedding: {e}")
 
-    def search(self, query_embedding, k=5, threshold=0.5):
+    def add_embeddings(self, chunk_ids, embeddings):
+        """
+        Add a batch of embedding vectors to the FAISS index in a single call.
+
+        Args:
+            chunk_ids (list[int]): IDs of the chunks the embeddings belong to.
+            embeddings (np.ndarray): A ``(len(chunk_ids), dimension)`` array.
+        """
+        if len(chunk_ids) == 0 or self.role == READER:
+            # Readers serve what the writer publishes; it picks these chunks up
+            # from the database.
+            return
+        self._loaded.wait()
+        try:
+            ids = np.asarray(chunk_ids, dtype=np.int64)
+            vectors = np.ascontiguousarray(embeddings, dtype=np.float32)
+            with self._lock:
+                if not index_factory.supports_removal(self.active_type):
+                    # Tombstoned IDs are re-added by the next background rebuild.
+                    keep = np.array([i not in self._tombstones for i in ids.tolist()])
+                    self.index.add_with_ids(vectors[keep], ids[keep])
+                else:
+                    self.index.add_with_ids(vectors, ids)
+                self._store_vectors(ids, vectors)
+                self._advance_watermark(ids)
+                self._log_changes("add", ids.tolist(), list(vectors))
+            logger.info(f"{len(ids)} embeddings added to FAISS index.")
+            self._maybe_schedule_build()
+        except Exception as e:
+            logger.error(f"Error adding embeddings: {e}")
+
+    def _store_vectors(self, ids, embeddings):
+        """
+        Keep added vectors in the vector storage, so rebuilds find them even if
+        the database pass that would have stored them has already gone past.
+        The lock must be held.
+
+        A re-added (updated) chunk replaces its stored vector. The storage is
+        only extended above its watermark while it holds every chunk of the
+        index; otherwise the next rebuild reads the missing ones from the
+        database first.
+        """
+        self.vectors.replace(ids, embeddings)
+        self.vectors.append(ids, embeddings, extend=self.vectors.watermark >= self.watermark)
+
+    def remove_embedding(self, chunk_id):
+        """
+        Remove the embedding of a chunk from the FAISS index.
+
+        Args:
+            chunk_id (int): ID of the chunk to remove.
+
+        Returns:
+            bool: True if an embedding was removed, False otherwise.
+        """
+        if self.role == READER:
+            return False
+        self._loaded.wait()
+        try:
+            with self._lock:
+                removed = self._remove_from_index(self.index, chunk_id)
+                # Rebuilds stream the stored vectors; they must not bring it back.
+                self.vectors.delete([chunk_id])
+                if removed:
+                    self._log_change("remove", chunk_id)
+            logger.info(f"Removed {removed} embedding(s) for chunk {chunk_id}.")
+            self._maybe_schedule_build()
+            return removed > 0
+        except Exception as e:
+            logger.error(f"Error removing embedding: {e}")
+            return False
+
+    def update_embedding(self, chunk_id, embedding):
+        """
+        Replace the embedding of a chunk in the FAISS index.
+
+        Args:
+            chunk_id (int): ID of the chunk to update.
+            embedding (np.ndarray): The new embedding vector.
+        """
+        with self._lock:
+            self.remove_embedding(chunk_id)
+            self.add_embedding(chunk_id, embedding)
+
+    def set_search_params(self, nprobe=None, ef_search=None):
+        """
+        Tune the default recall/latency trade-off of the serving index.
+
+        Higher values visit more of the index per query: better recall, slower
+        queries. Settings that do not apply to the active index type are kept
+        and applied once a matching index is swapped in.
+
+        Args:
+            nprobe (int, optional): IVF lists visited per query.
+            ef_search (int, optional): HNSW candidate list size per query.
+        """
+        with self._lock:
+            if nprobe is not None:
+                self.nprobe = int(nprobe)
+            if ef_search is not None:
+                self.ef_search = int(ef_search)
+            index_factory.set_search_params(
+                self.index, self.active_type, self.nprobe, self.ef_search
+            )
+
+    def index_info(self):
+        """
+        Describe the serving index and the settings that drive recall and latency.
+
+        Returns:
+            dict: Configured and active index type, size, training state, whether a
+            background build is running and the query-time parameters.
+        """
+        with self._lock:
+            info = index_factory.describe_index(self.index, self.active_type)
+            info.update(
+                {
+                    "configured_type": self.index_type,
+                    "building": self._build_thread is not None,
+                    "train_threshold": FAISS_TRAIN_THRESHOLD,
+                    "tombstones": len(self._tombstones),
+                    "build_error": self.build_error,
+                    "role": self.role,
+                    "snapshot_version": self.snapshot_version,
+                }
+            )
+        return info
+
+    def evaluate(self, query_embeddings, k=10, nprobe=None, ef_search=None):
+        """
+        Measure recall@k and latency of the serving index against exact search.
+
+        Ground truth is computed with a brute-force scan over the embeddings in the
+        database, so this is meant for offline tuning rather than request paths.
+
+        Args:
+            query_embeddings (np.ndarray): Matrix of query vectors, one per row.
+            k (int, optional): Number of neighbours to compare. Defaults to 10.
+            nprobe (int, optional): IVF lists visited per query for this run.
+            ef_search (int, optional): HNSW candidate list size for this run.
+
+        Returns:
+            dict: ``recall_at_k``, ``latency_ms`` (mean per query) for the serving
+            index, ``exact_latency_ms`` for brute force, and the index description.
+        """
+        queries = np.ascontiguousarray(query_embeddings, dtype=np.float32)
+        exact = index_factory.create_index(index_factory.FLAT, self.dimension, self.metric)
+        for ids, embeddings in self._iter_embeddings():
+            exact.add_with_ids(embeddings, ids)
+
+        started = time.perf_counter()
+        _, expected = exact.search(queries, k)
+        exact_ms = (time.perf_counter() - started) * 1000 / len(queries)
+
+        params = index_factory.search_parameters(self.active_type, nprobe, ef_search)
+        with self._lock:
+            started = time.perf_counter()
+            _, found = self.index.search(queries, k, params=params)
+            latency_ms = (time.perf_counter() - started) * 1000 / len(queries)
+
+        hits = sum(
+            len(set(row_found[row_found != -1]) & set(row_expected[row_expected != -1]))
+            for row_found, row_expected in zip(found, expected)
+        )
+        total = int((expected != -1).sum()) or 1
+        return {
+            "recall_at_k": hits / total,
+            "latency_ms": latency_ms,
+            "exact_latency_ms": exact_ms,
+            **self.index_info(),
+        }
+
+    def search(
+        self,
+        query_embedding,
+        k=5,
+        threshold=SIMILARITY_THRESHOLD,
+        nprobe=None,
+        ef_search=None,
+        allowed_ids=None,
+    ):
         """
         Perform a nearest neighbor search on the FAISS index.
 
+        When ``allowed_ids`` is given, only those chunks are searched. Subsets of
+        up to ``FAISS_EXACT_SEARCH_MAX_IDS`` chunks are scored exactly against
+        their stored vectors, so the cost depends on the subset and not on the
+        corpus; larger subsets are searched in the index with an ID selector
+        (see ``_search_selected``).
+
         Args:
             query_embedding (np.ndarray): The query embedding vector.
             k (int, optional): The number of nearest neighbors to retrieve. Defaults to 5.
-            threshold (float, optional): Minimum similarity score to consider a valid match.
+            threshold (float, optional): Minimum cosine similarity for a valid match.
+                Defaults to SIMILARITY_THRESHOLD.
+            nprobe (int, optional): IVF lists visited for this query only.
+            ef_search (int, optional): HNSW candidate list size for this query only.
+            allowed_ids (array-like of int, optional): Chunk IDs to restrict the
+                search to.
 
         Returns:
-            list: A list of indices of the closest matching embeddings.
+            list[int]: IDs of the chunks whose embeddings match best.
         """
+        return self.search_batch(
+            np.asarray(query_embedding, dtype=np.float32)[None, :],
+            k,
+            threshold,
+            nprobe=nprobe,
+            ef_search=ef_search,
+            allowed_ids=allowed_ids,
+        )[0]
+
+    def search_batch(
+        self,
+        query_embeddings,
+        k=5,
+        threshold=SIMILARITY_THRESHOLD,
+        nprobe=None,
+        ef_search=None,
+        allowed_ids=None,
+    ):
+        """
+        Search several queries at once with a single FAISS search call.
+
+        Same as ``search``, but for a matrix of queries; FAISS parallelizes the
+        search over the rows.
+
+        Args:
+            query_embeddings (np.ndarray): Matrix of query vectors, one per row.
+
+        Returns:
+            list[list[int]]: For each query, the IDs of the best matching chunks.
+
+        Raises:
+            Exception: If the search fails, after logging it, so that callers
+            can tell a failed search from one without matches.
+        """
+        self._ensure_refresher()
+        queries = np.ascontiguousarray(query_embeddings, dtype=np.float32)
         try:
             # Check total number of embeddings in FAISS.
             if self.index.ntotal == 0:
                 logger.warning(
                     "FAISS index is empty. No documents available for retrieval."
                 )
-                return []
-
-            distances, indices = self.index.search(
-                np.array([query_embedding], dtype=np.float32), k
-            )
+                return [[] for _ in range(len(queries))]
 
-            # Convert distances to similarity scores
-            similarities = 1 / (1 + distances)
+            with self._lock:
+                tombstones = set(self._tombstones)
+                if allowed_ids is not None:
+                    allowed = np.unique(np.asarray(allowed_ids, dtype=np.int64))
+                    if tombstones:
+                        allowed = allowed[
+                            ~np.isin(allowed, np.fromiter(tombstones, dtype=np.int64))
+                        ]
+                    if len(allowed) == 0:
+                        return [[] for _ in range(len(queries))]
+                    if len(allowed) <= FAISS_EXACT_SEARCH_MAX_IDS:
+                        scores, ids = self._search_subset(queries, allowed, k)
+                    else:
+                        scores, ids = self._search_selected(
+                            queries, allowed, k, nprobe, ef_search
+                        )
+                else:
+                    # Over-fetch so tombstoned vectors can be dropped without losing hits.
+                    fetch_k = k + min(len(tombstones), MAX_TOMBSTONE_OVERFETCH)
+                    params = index_factory.search_parameters(
+                        self.active_type, nprobe, ef_search
+                    )
+                    scores, ids = self.index.search(queries, fetch_k, params=params)
 
-            # Filter out low-similarity results
-            valid_indices = [
-                idx for sim, idx in zip(similarities[0], indices[0]) if sim >= threshold
+            # Filter out low-similarity results, tombstones and padding (-1) entries
+            return [
+                [
+                    int(chunk_id)
+                    for sim, chunk_id in zip(row_scores, row_ids)
+                    if chunk_id != -1 and chunk_id not in tombstones and sim >= threshold
+                ][:k]
+                for row_scores, row_ids in zip(scores, ids)
             ]
-
-            return valid_indices
         except Exception as e:
             logger.error(f"Error searching embeddings: {e}")
-            return []
+            raise
+
+    def _search_selected(self, queries, chunk_ids, k, nprobe=None, ef_search=None):
+        """
+        Search the index for the best of the given chunks with an ID selector.
+
+        Approximate indexes only look at part of the corpus per query (the
+        probed IVF lists, the visited HNSW candidates), which may hold few of
+        the selected chunks. The search effort is therefore raised in
+        proportion to how small the subset is, and queries that still come back
+        with fewer than ``k`` hits are scored exactly against the subset. Must
+        be called with the lock held.
+
+        Returns:
+            tuple: ``(scores, ids)`` shaped like the result of ``index.search``.
+        """
+        # Fraction of the corpus that is selected
+        selectivity = min(1.0, len(chunk_ids) / max(self.index.ntotal, 1))
+        if self.active_type in index_factory.TRAINED_INDEX_TYPES:
+            nlist = faiss.extract_index_ivf(self.index).nlist
+            nprobe = min(nlist, int(np.ceil((nprobe or self.nprobe) / selectivity)))
+        elif self.active_type == index_factory.HNSW:
+            ef_search = min(
+                MAX_SELECTIVE_EF_SEARCH,
+                max(k, int(np.ceil((ef_search or self.ef_search) / selectivity))),
+            )
+        params = index_factory.search_parameters(
+            self.active_type, nprobe, ef_search, selector=faiss.IDSelectorBatch(chunk_ids)
+        )
+        scores, ids = self.index.search(queries, k, params=params)
+
+        short = (ids == -1).any(axis=1)
+        if short.any():
+            logger.info(
+                f"Filtered search returned fewer than {k} hits for {int(short.sum())} "
+                "query(s); scoring the selected chunks exactly."
+            )
+            exact_scores, exact_ids = self._search_subset(queries[short], chunk_ids, k)
+            found = exact_ids.shape[1]
+            scores[short], ids[short] = -np.inf, -1
+            scores[np.ix_(short, np.arange(found))] = exact_scores
+            ids[np.ix_(short, np.arange(found))] = exact_ids
+        return scores, ids
+
+    def _search_subset(self, queries, chunk_ids, k):
+        """
+        Exactly score queries against the stored vectors of the given chunks.
+
+        Chunks not in the index yet (e.g. committed but not indexed) are skipped.
+        Must be called with the lock held.
+
+        Returns:
+            tuple: ``(scores, ids)`` shaped like the result of ``index.search``.
+        """
+        try:
+            vectors = self.index.reconstruct_batch(chunk_ids)
+        except RuntimeError:
+            present, rows = [], []
+            for chunk_id in chunk_ids:
+                try:
+                    rows.append(self.index.reconstruct(int(chunk_id)))
+                    present.append(chunk_id)
+                except RuntimeError:
+                    continue
+            if not present:
+                empty = (len(queries), 0)
+                return np.empty(empty, dtype=np.float32), np.empty(empty, dtype=np.int64)
+            chunk_ids = np.array(present, dtype=np.int64)
+            vectors = np.vstack(rows)
+
+        scores = queries @ vectors.T
+        top = np.argsort(-scores, axis=1)[:, :k]
+        return np.take_along_axis(scores, top, axis=1), chunk_ids[top]
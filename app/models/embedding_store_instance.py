@@ -1,5 +1,6 @@
 from app.models.embedding_store import EmbeddingStore
 
 # Global instance of EmbeddingStore to manage document embeddings.
+# Existing embeddings are loaded at application startup, not on import.
 
-embedding_store = EmbeddingStore()
+embedding_store = EmbeddingStore(load=False)
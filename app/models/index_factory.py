@@ -0,0 +1,178 @@
+import faiss
+from app.core.logging_config import logger
+
+# Supported values for the FAISS_INDEX_TYPE setting
+FLAT = "flat"
+IVF_FLAT = "ivf_flat"
+IVF_PQ = "ivf_pq"
+HNSW = "hnsw"
+INDEX_TYPES = (FLAT, IVF_FLAT, IVF_PQ, HNSW)
+
+# Index types that must be trained on a sample of the corpus before use
+TRAINED_INDEX_TYPES = (IVF_FLAT, IVF_PQ)
+
+
+def create_index(index_type, dimension, metric=faiss.METRIC_L2, params=None):
+    """
+    Create an empty FAISS index of the requested type, addressable by document ID.
+
+    IVF indexes store external IDs natively and get a hashtable direct map so
+    vectors can be removed and reconstructed by ID. Flat and HNSW indexes are
+    wrapped in an ``IndexIDMap2``.
+
+    Args:
+        index_type (str): One of ``flat``, ``ivf_flat``, ``ivf_pq`` or ``hnsw``.
+        dimension (int): The dimensionality of the embeddings.
+        metric (int, optional): FAISS metric type. Defaults to ``faiss.METRIC_L2``.
+        params (dict, optional): Build parameters (``nlist``, ``pq_m``, ``pq_nbits``,
+            ``hnsw_m``, ``ef_construction``, ``nprobe``, ``ef_search``).
+
+    Returns:
+        faiss.Index: The new, possibly untrained, index.
+    """
+    params = params or {}
+
+    if index_type == FLAT:
+        return faiss.IndexIDMap2(_flat_index(dimension, metric))
+
+    if index_type in TRAINED_INDEX_TYPES:
+        quantizer = _flat_index(dimension, metric)
+        if index_type == IVF_FLAT:
+            index = faiss.IndexIVFFlat(quantizer, dimension, params["nlist"], metric)
+        else:
+            index = faiss.IndexIVFPQ(
+                quantizer,
+                dimension,
+                params["nlist"],
+                params["pq_m"],
+                params["pq_nbits"],
+                metric,
+            )
+        index.set_direct_map_type(faiss.DirectMap.Hashtable)
+        index.nprobe = params["nprobe"]
+        return index
+
+    if index_type == HNSW:
+        hnsw = faiss.IndexHNSWFlat(dimension, params["hnsw_m"], metric)
+        hnsw.hnsw.efConstruction = params["ef_construction"]
+        hnsw.hnsw.efSearch = params["ef_search"]
+        return faiss.IndexIDMap2(hnsw)
+
+    raise ValueError(
+        f"Unsupported FAISS index type '{index_type}'. Expected one of {INDEX_TYPES}."
+    )
+
+
+def _flat_index(dimension, metric):
+    """
+    Create a brute-force index for the given metric.
+    """
+    if metric == faiss.METRIC_INNER_PRODUCT:
+        return faiss.IndexFlatIP(dimension)
+    return faiss.IndexFlatL2(dimension)
+
+
+def read_index(path, index_type, writable=True):
+    """
+    Load an index snapshot, memory-mapping it whenever the index type allows.
+
+    Memory-mapped IVF inverted lists are read-only, so writable IVF indexes are
+    read into memory instead. Read-only indexes map their vector storage straight
+    from the file (``IO_FLAG_MMAP_IFC`` where available), so processes serving the
+    same snapshot share its pages instead of each holding a private copy.
+
+    Args:
+        path (str): Path of the snapshot file.
+        index_type (str): Type recorded alongside the snapshot.
+        writable (bool, optional): Whether vectors will be added or removed later.
+
+    Returns:
+        faiss.Index: The loaded index.
+    """
+    if writable and index_type in TRAINED_INDEX_TYPES:
+        index = faiss.read_index(path)
+    else:
+        flags = faiss.IO_FLAG_MMAP
+        if not writable:
+            flags = getattr(faiss, "IO_FLAG_MMAP_IFC", flags) | faiss.IO_FLAG_READ_ONLY
+        index = faiss.read_index(path, flags)
+
+    if index_type in TRAINED_INDEX_TYPES and writable:
+        index.set_direct_map_type(faiss.DirectMap.Hashtable)
+    return index
+
+
+def supports_removal(index_type):
+    """
+    Return whether vectors can be removed from an index of this type in place.
+    """
+    return index_type != HNSW
+
+
+def set_search_params(index, index_type, nprobe=None, ef_search=None):
+    """
+    Apply query-time accuracy/speed knobs to an index.
+
+    Args:
+        index (faiss.Index): The index to tune.
+        index_type (str): The index type.
+        nprobe (int, optional): Number of IVF lists visited per query.
+        ef_search (int, optional): Size of the HNSW candidate list per query.
+    """
+    if index_type in TRAINED_INDEX_TYPES and nprobe is not None:
+        faiss.extract_index_ivf(index).nprobe = int(nprobe)
+    elif index_type == HNSW and ef_search is not None:
+        faiss.downcast_index(index.index).hnsw.efSearch = int(ef_search)
+
+
+def search_parameters(index_type, nprobe=None, ef_search=None, selector=None):
+    """
+    Build per-query FAISS search parameters for the given index type.
+
+    Returns:
+        faiss.SearchParameters or None: Parameters to pass to ``index.search``, or
+        None when the index defaults should be used.
+    """
+    if nprobe is None and ef_search is None and selector is None:
+        return None
+
+    if index_type in TRAINED_INDEX_TYPES:
+        params = faiss.SearchParametersIVF()
+        if nprobe is not None:
+            params.nprobe = int(nprobe)
+    elif index_type == HNSW:
+        params = faiss.SearchParametersHNSW()
+        if ef_search is not None:
+            params.efSearch = int(ef_search)
+    else:
+        params = faiss.SearchParameters()
+
+    if selector is not None:
+        params.sel = selector
+    return params
+
+
+def describe_index(index, index_type):
+    """
+    Summarize an index's type and the settings that drive recall and latency.
+
+    Returns:
+        dict: Index type, size, training state and query-time parameters.
+    """
+    info = {
+        "index_type": index_type,
+        "ntotal": int(index.ntotal),
+        "is_trained": bool(index.is_trained),
+    }
+    try:
+        if index_type in TRAINED_INDEX_TYPES:
+            ivf = faiss.extract_index_ivf(index)
+            info.update({"nlist": int(ivf.nlist), "nprobe": int(ivf.nprobe)})
+        elif index_type == HNSW:
+            hnsw = faiss.downcast_index(index.index).hnsw
+            info.update(
+                {"ef_search": int(hnsw.efSearch), "ef_construction": int(hnsw.efConstruction)}
+            )
+    except Exception as e:
+        logger.warning(f"Could not read FAISS index parameters: {e}")
+    return info
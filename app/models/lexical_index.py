@@ -0,0 +1,567 @@
+import glob
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+import numpy as np
+from sqlalchemy import select
+from app.core.config import (
+    BM25_B,
+    BM25_K1,
+    INDEX_REFRESH_INTERVAL,
+    INDEX_ROLE,
+    LEXICAL_INDEX_DIR,
+    LEXICAL_SNAPSHOT_INTERVAL,
+)
+from app.core.logging_config import logger
+from app.models.db_models import Chunk, SessionLocal
+
+# Number of rows fetched per round trip when reading chunk texts from the database
+LOAD_BATCH_SIZE = 1000
+
+# Words too common to help ranking; leaving them out keeps posting lists short
+STOPWORDS = frozenset(
+    """
+    a about above after again all am an and any are as at be been before being
+    below between both but by can could did do does doing down during each few
+    for from further had has have having he her here hers him his how i if in
+    into is it its itself just me more most my no nor not of off on once only or
+    other our ours out over own same she should so some such than that the their
+    theirs them then there these they this those through to too under until up
+    very was we were what when where which while who whom why will with would
+    you your yours
+    """.split()
+)
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+# Term frequencies are stored as uint16 and capped at its maximum
+MAX_FREQUENCY = np.iinfo(np.uint16).max
+
+# Chunk IDs skipped by a newer chunk (their transaction had not committed yet,
+# or rolled back) are looked up again by database syncs for this many seconds
+GAP_RETRY_SECONDS = 300
+
+# At most this many skipped IDs are tracked per newly indexed chunk
+MAX_GAP_IDS = 10000
+
+# Posting arrays saved as raw .npy files, memory-mapped when loaded
+CSR_ARRAYS = ("offsets", "docs", "freqs")
+
+
+def tokenize(text):
+    """
+    Split text into lowercased word tokens, dropping stopwords.
+
+    Identifiers such as error codes are kept whole as long as they consist of
+    word characters (``E1234``, ``user_id``); other punctuation splits tokens.
+    """
+    return [
+        token for token in _TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS
+    ]
+
+
+class LexicalIndex:
+    """
+    An in-process BM25 inverted index over chunk texts.
+
+    Posting lists are stored compactly as two parallel arrays per term, the
+    internal document numbers (int32) and term frequencies (uint16), in a
+    CSR layout: one offsets array points into the concatenated postings of all
+    terms. Chunks added since the last snapshot go to a small in-memory delta
+    that is searched alongside and merged into the CSR arrays when a snapshot
+    is written in the background.
+
+    Snapshots are written by standalone and writer processes every
+    ``LEXICAL_SNAPSHOT_INTERVAL`` added chunks. On startup the snapshot is
+    loaded and only chunks above its watermark (highest chunk ID) are read from
+    the database. Readers keep their own copy current by reading chunks above
+    the watermark at most every ``INDEX_REFRESH_INTERVAL`` seconds.
+
+    The posting arrays of a snapshot are raw ``.npy`` files that are
+    memory-mapped read-only, so worker processes share one copy of them in the
+    page cache. Each snapshot gets new versioned files and is published by
+    atomically replacing ``bm25.meta.json``, like the FAISS snapshots.
+
+    Chunks are not always committed or indexed in ID order, e.g. with
+    concurrent uploads. Every chunk not indexed yet is added whatever its ID,
+    and IDs below the watermark that were skipped (gaps) are looked up again by
+    database syncs for ``GAP_RETRY_SECONDS``.
+
+    Attributes:
+        index_dir (str): Directory holding the snapshot.
+        role (str): ``standalone``, ``writer`` or ``reader``.
+        watermark (int): Highest chunk ID in the index.
+    """
+
+    def __init__(self, index_dir=LEXICAL_INDEX_DIR, role=INDEX_ROLE, load=True):
+        """
+        Initialize an empty index and load existing chunks.
+
+        Args:
+            index_dir (str, optional): Directory for the snapshot.
+            role (str, optional): Serving role. Defaults to INDEX_ROLE.
+            load (bool, optional): Load existing chunks now. When False, call
+                ``load_existing`` later (e.g. at application startup).
+        """
+        self.index_dir = index_dir
+        self.role = role
+        self.meta_path = os.path.join(index_dir, "bm25.meta.json")
+        # Single-file snapshot written before the posting arrays were mapped
+        self.legacy_path = os.path.join(index_dir, "bm25.npz")
+        self.snapshot_version = 0
+        self._lock = threading.RLock()
+        self._sync_lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._save_thread = None
+        self._last_sync = 0.0
+        self.watermark = 0
+        # Chunk IDs in the index, and skipped IDs -> when they were first seen missing
+        self._indexed = set()
+        self._gaps = {}
+        # Term -> term number
+        self._terms = {}
+        # Merged postings: offsets[t]:offsets[t + 1] slices docs and freqs of term t
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._docs = np.empty(0, dtype=np.int32)
+        self._freqs = np.empty(0, dtype=np.uint16)
+        # Postings added since the merge: term number -> ([docs], [freqs])
+        self._delta = {}
+        # Per document number: chunk ID and length in tokens
+        self._chunk_ids = np.empty(1024, dtype=np.int64)
+        self._lengths = np.empty(1024, dtype=np.uint32)
+        self._count = 0
+        self._total_length = 0
+        self._unsaved = 0
+        if load:
+            self.load_existing()
+
+    @property
+    def size(self):
+        """
+        Number of chunks in the index.
+        """
+        return self._count
+
+    def load_existing(self):
+        """
+        Load the snapshot, if any, then add chunks committed after it.
+        """
+        try:
+            if os.path.exists(self.meta_path) or os.path.exists(self.legacy_path):
+                self._load_snapshot()
+            added = self.sync_from_database()
+            logger.info(f"✅ Loaded BM25 index with {self._count} chunks ({added} new).")
+            if added and self.role != "reader":
+                self.save_snapshot()
+        except Exception as e:
+            logger.error(f"Error loading BM25 index: {e}")
+
+    def _snapshot_path(self, version, name):
+        """
+        Return the path of one file of a snapshot version: a posting array
+        (``.npy``) or ``tables``, the terms and document table (``.npz``).
+        """
+        extension = "npz" if name == "tables" else "npy"
+        return os.path.join(self.index_dir, f"bm25.{version}.{name}.{extension}")
+
+    def _load_snapshot(self):
+        """
+        Map the merged postings and read the document table of the snapshot.
+        """
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                version = int(json.load(f)["version"])
+            postings = [
+                np.load(self._snapshot_path(version, name), mmap_mode="r")
+                for name in CSR_ARRAYS
+            ]
+            tables_path = self._snapshot_path(version, "tables")
+        else:
+            version = 0
+            with np.load(self.legacy_path) as data:
+                postings = [data[name] for name in CSR_ARRAYS]
+            tables_path = self.legacy_path
+        with np.load(tables_path) as data:
+            encoded = data["terms"].tobytes().decode("utf-8")
+            terms = encoded.split("\n") if encoded else []
+            with self._lock:
+                self._terms = {term: number for number, term in enumerate(terms)}
+                self._offsets, self._docs, self._freqs = postings
+                self._delta = {}
+                self.snapshot_version = version
+                self._chunk_ids = data["chunk_ids"].copy()
+                self._lengths = data["lengths"].copy()
+                self._count = len(self._chunk_ids)
+                self._total_length = int(self._lengths.sum())
+                self.watermark = int(data["watermark"])
+                self._indexed = set(self._chunk_ids.tolist())
+                # Snapshots written before gaps were tracked have none
+                gaps = data["gaps"].tolist() if "gaps" in data.files else []
+                now = time.monotonic()
+                self._gaps = {int(chunk_id): now for chunk_id in gaps}
+                self._unsaved = 0
+
+    def _iter_texts(self, min_id=0, gap_ids=()):
+        """
+        Stream ``(ids, texts)`` batches for chunks with ``id > min_id`` or whose
+        ID is in ``gap_ids``.
+        """
+        db = SessionLocal()
+        try:
+            for start in range(0, len(gap_ids), LOAD_BATCH_SIZE):
+                rows = db.execute(
+                    select(Chunk.id, Chunk.text).where(
+                        Chunk.id.in_(gap_ids[start : start + LOAD_BATCH_SIZE])
+                    )
+                ).all()
+                if rows:
+                    yield [row.id for row in rows], [row.text for row in rows]
+            result = db.execute(
+                select(Chunk.id, Chunk.text)
+                .where(Chunk.id > min_id)
+                .order_by(Chunk.id)
+                .execution_options(yield_per=LOAD_BATCH_SIZE)
+            )
+            for rows in result.partitions():
+                yield [row.id for row in rows], [row.text for row in rows]
+        finally:
+            db.close()
+
+    def sync_from_database(self):
+        """
+        Add chunks committed to the database above the watermark, and chunks in
+        gaps below it that have been committed since.
+
+        Returns:
+            int: Number of chunks added.
+        """
+        added = 0
+        with self._sync_lock:
+            with self._lock:
+                self._expire_gaps()
+                gap_ids = list(self._gaps)
+                watermark = self.watermark
+            for ids, texts in self._iter_texts(min_id=watermark, gap_ids=gap_ids):
+                added += self.add_texts(ids, texts)
+            self._last_sync = time.monotonic()
+        return added
+
+    def _expire_gaps(self):
+        """
+        Stop looking up gaps older than ``GAP_RETRY_SECONDS``; their chunks were
+        rolled back. The lock must be held.
+        """
+        expired = time.monotonic() - GAP_RETRY_SECONDS
+        # Gaps are recorded in time order
+        while self._gaps:
+            chunk_id, seen = next(iter(self._gaps.items()))
+            if seen > expired:
+                break
+            del self._gaps[chunk_id]
+
+    def _maybe_sync(self):
+        """
+        In reader processes, pick up chunks stored by other workers, at most
+        every ``INDEX_REFRESH_INTERVAL`` seconds. Searches arriving while one
+        search syncs do not wait for it.
+        """
+        if (
+            self.role != "reader"
+            or self._sync_lock.locked()
+            or time.monotonic() - self._last_sync < INDEX_REFRESH_INTERVAL
+        ):
+            return
+        try:
+            self.sync_from_database()
+        except Exception as e:
+            logger.error(f"Error syncing BM25 index: {e}")
+
+    def add_texts(self, chunk_ids, texts):
+        """
+        Index chunk texts. Chunks already in the index are skipped, so chunks
+        can be added in any order and more than once.
+
+        Args:
+            chunk_ids (list[int]): The chunk IDs.
+            texts (list[str]): The chunk texts, in the same order.
+
+        Returns:
+            int: Number of chunks added.
+        """
+        added = 0
+        with self._lock:
+            for chunk_id, text in zip(chunk_ids, texts):
+                chunk_id = int(chunk_id)
+                if chunk_id in self._indexed:
+                    continue
+                tokens = tokenize(text or "")
+                document = self._count
+                if document == len(self._chunk_ids):
+                    capacity = max(1024, 2 * document)
+                    self._chunk_ids = np.resize(self._chunk_ids, capacity)
+                    self._lengths = np.resize(self._lengths, capacity)
+                self._chunk_ids[document] = chunk_id
+                self._lengths[document] = len(tokens)
+                self._count += 1
+                self._total_length += len(tokens)
+                for term, freq in Counter(tokens).items():
+                    number = self._terms.setdefault(term, len(self._terms))
+                    docs, freqs = self._delta.setdefault(number, ([], []))
+                    docs.append(document)
+                    freqs.append(min(freq, MAX_FREQUENCY))
+                self._indexed.add(chunk_id)
+                if chunk_id > self.watermark:
+                    self._record_gaps(chunk_id)
+                    self.watermark = chunk_id
+                else:
+                    self._gaps.pop(chunk_id, None)
+                added += 1
+            self._unsaved += added
+        if added:
+            self._maybe_schedule_save()
+        return added
+
+    def _record_gaps(self, chunk_id):
+        """
+        Record the IDs between the watermark and a new highest chunk that are not
+        indexed. The lock must be held.
+        """
+        self._expire_gaps()
+        if chunk_id - self.watermark > 1:
+            now = time.monotonic()
+            start = max(self.watermark + 1, chunk_id - MAX_GAP_IDS)
+            for gap in range(start, chunk_id):
+                if gap not in self._indexed:
+                    self._gaps[gap] = now
+
+    def _postings(self, number):
+        """
+        Return the document numbers and frequencies of a term. The lock must be held.
+        """
+        docs = freqs = None
+        if number + 1 < len(self._offsets):
+            start, end = self._offsets[number], self._offsets[number + 1]
+            docs, freqs = self._docs[start:end], self._freqs[start:end]
+        delta = self._delta.get(number)
+        if delta is not None:
+            delta_docs = np.array(delta[0], dtype=np.int32)
+            delta_freqs = np.array(delta[1], dtype=np.uint16)
+            if docs is None:
+                return delta_docs, delta_freqs
+            return np.concatenate([docs, delta_docs]), np.concatenate([freqs, delta_freqs])
+        if docs is None:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.uint16)
+        return docs, freqs
+
+    def search(self, query_text, k=5, allowed_ids=None):
+        """
+        Rank chunks by BM25 score against a query.
+
+        Args:
+            query_text (str): The query.
+            k (int, optional): Number of chunks to return. Defaults to 5.
+            allowed_ids (array-like of int, optional): Chunk IDs to restrict the
+                search to.
+
+        Returns:
+            list[int]: IDs of the best matching chunks, best first. Chunks that
+            share no term with the query are never returned.
+        """
+        self._maybe_sync()
+        terms = set(tokenize(query_text))
+        with self._lock:
+            count = self._count
+            if not terms or count == 0:
+                return []
+            average_length = self._total_length / count or 1.0
+            postings = [
+                self._postings(self._terms[term]) for term in terms if term in self._terms
+            ]
+            lengths = self._lengths[:count]
+            chunk_ids = self._chunk_ids[:count]
+
+        all_docs, all_scores = [], []
+        for docs, freqs in postings:
+            if len(docs) == 0:
+                continue
+            idf = math.log(1 + (count - len(docs) + 0.5) / (len(docs) + 0.5))
+            freqs = freqs.astype(np.float32)
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[docs] / average_length)
+            all_docs.append(docs)
+            all_scores.append(idf * freqs * (BM25_K1 + 1) / (freqs + norm))
+        if not all_docs:
+            return []
+
+        docs, inverse = np.unique(np.concatenate(all_docs), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(all_scores))
+        ids = chunk_ids[docs]
+        if allowed_ids is not None:
+            keep = np.isin(ids, np.asarray(allowed_ids, dtype=np.int64))
+            ids, scores = ids[keep], scores[keep]
+        if len(ids) > k:
+            top = np.argpartition(-scores, k)[:k]
+            ids, scores = ids[top], scores[top]
+        return [int(chunk_id) for chunk_id in ids[np.argsort(-scores, kind="stable")]]
+
+    def _maybe_schedule_save(self):
+        """
+        Write a snapshot in the background once enough chunks were added.
+        """
+        if self.role == "reader" or self._unsaved < LEXICAL_SNAPSHOT_INTERVAL:
+            return
+        with self._lock:
+            if self._save_thread is not None:
+                return
+            self._save_thread = threading.Thread(
+                target=self.save_snapshot, name="bm25-snapshot", daemon=True
+            )
+            self._save_thread.start()
+
+    def save_snapshot(self):
+        """
+        Merge the delta into the posting arrays and write them to disk.
+
+        The merge runs on a copy without holding the lock, so searches and adds
+        continue meanwhile; postings added during the merge stay in the delta.
+        The file is replaced atomically.
+        """
+        if self.role == "reader":
+            return
+        try:
+            with self._save_lock:
+                self._write_snapshot()
+        except Exception as e:
+            logger.error(f"Error saving BM25 snapshot: {e}")
+        finally:
+            with self._lock:
+                if self._save_thread is threading.current_thread():
+                    self._save_thread = None
+
+    def _write_snapshot(self):
+        """
+        Merge and write one snapshot. The save lock must be held.
+        """
+        with self._lock:
+            offsets, docs, freqs = self._offsets, self._docs, self._freqs
+            merged = {number: len(delta[0]) for number, delta in self._delta.items()}
+            delta = {
+                number: (self._delta[number][0][:size], self._delta[number][1][:size])
+                for number, size in merged.items()
+            }
+            terms = list(self._terms)
+            count = self._count
+            chunk_ids = self._chunk_ids[:count].copy()
+            lengths = self._lengths[:count].copy()
+            watermark = self.watermark
+            gaps = np.fromiter(self._gaps, dtype=np.int64)
+            unsaved = self._unsaved
+
+        postings = self._merge(offsets, docs, freqs, delta, len(terms))
+
+        os.makedirs(self.index_dir, exist_ok=True)
+        version = self.snapshot_version + 1
+        for name, array in zip(CSR_ARRAYS, postings):
+            self._write_file(self._snapshot_path(version, name), np.save, array)
+        self._write_file(
+            self._snapshot_path(version, "tables"),
+            np.savez,
+            # Terms never contain newlines, so they are stored as one string
+            terms=np.frombuffer("\n".join(terms).encode("utf-8"), dtype=np.uint8),
+            chunk_ids=chunk_ids,
+            lengths=lengths,
+            watermark=np.int64(watermark),
+            gaps=gaps,
+        )
+        tmp_meta = f"{self.meta_path}.tmp"
+        with open(tmp_meta, "w", encoding="utf-8") as f:
+            json.dump({"version": version}, f)
+        os.replace(tmp_meta, self.meta_path)
+        self.snapshot_version = version
+        self._remove_old_snapshots(version)
+        # Serve the written arrays from the page cache instead of the heap
+        offsets, docs, freqs = [
+            np.load(self._snapshot_path(version, name), mmap_mode="r") for name in CSR_ARRAYS
+        ]
+
+        with self._lock:
+            self._offsets, self._docs, self._freqs = offsets, docs, freqs
+            for number, size in merged.items():
+                remaining = self._delta[number]
+                del remaining[0][:size], remaining[1][:size]
+                if not remaining[0]:
+                    del self._delta[number]
+            self._unsaved -= unsaved
+        logger.info(f"Saved BM25 snapshot with {count} chunks and {len(terms)} terms.")
+
+    @staticmethod
+    def _write_file(path, save, *args, **kwargs):
+        """
+        Write a file with ``save`` (``np.save`` or ``np.savez``) and move it into
+        place atomically.
+        """
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            save(f, *args, **kwargs)
+        os.replace(tmp_path, path)
+
+    def _remove_old_snapshots(self, current):
+        """
+        Delete the files of snapshot versions other than ``current``. Readers
+        still mapping them keep their pages until they exit.
+        """
+        keep = {self._snapshot_path(current, name) for name in CSR_ARRAYS + ("tables",)}
+        paths = glob.glob(os.path.join(self.index_dir, "bm25.*.np[yz]"))
+        for path in paths + [self.legacy_path]:
+            if path not in keep and os.path.exists(path):
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    logger.warning(f"Could not remove old BM25 snapshot {path}: {e}")
+
+    @staticmethod
+    def _merge(offsets, docs, freqs, delta, term_count):
+        """
+        Merge delta postings into CSR posting arrays covering ``term_count`` terms.
+
+        Delta documents are numbered after every merged one, so each term's delta
+        postings go right after its existing ones. Every posting is moved to its
+        final position in one pass, without sorting.
+        """
+        old_counts = np.zeros(term_count, dtype=np.int64)
+        old_counts[: len(offsets) - 1] = np.diff(offsets)
+        delta_terms = np.array(sorted(delta), dtype=np.int64)
+        delta_counts = np.zeros(term_count, dtype=np.int64)
+        delta_counts[delta_terms] = [len(delta[number][0]) for number in delta_terms]
+
+        merged_offsets = np.zeros(term_count + 1, dtype=np.int64)
+        np.cumsum(old_counts + delta_counts, out=merged_offsets[1:])
+        merged_docs = np.empty(merged_offsets[-1], dtype=np.int32)
+        merged_freqs = np.empty(merged_offsets[-1], dtype=np.uint16)
+
+        # Existing postings shift by the number of delta postings of earlier terms
+        shift = np.cumsum(delta_counts) - delta_counts
+        positions = np.arange(len(docs), dtype=np.int64) + np.repeat(shift, old_counts)
+        merged_docs[positions] = docs
+        merged_freqs[positions] = freqs
+
+        # Delta postings follow the existing postings of their term
+        if len(delta_terms):
+            counts = delta_counts[delta_terms]
+            starts = merged_offsets[delta_terms] + old_counts[delta_terms]
+            firsts = np.cumsum(counts) - counts
+            positions = np.repeat(starts - firsts, counts) + np.arange(counts.sum())
+            merged_docs[positions] = np.fromiter(
+                (doc for number in delta_terms for doc in delta[number][0]),
+                dtype=np.int32,
+                count=len(positions),
+            )
+            merged_freqs[positions] = np.fromiter(
+                (freq for number in delta_terms for freq in delta[number][1]),
+                dtype=np.uint16,
+                count=len(positions),
+            )
+        return merged_offsets, merged_docs, merged_freqs
@@ -0,0 +1,6 @@
+from app.models.lexical_index import LexicalIndex
+
+# Global instance of LexicalIndex for keyword (BM25) retrieval.
+# Existing chunks are loaded at application startup, not on import.
+
+lexical_index = LexicalIndex(load=False)
@@ -0,0 +1,121 @@
+import os
+from app.core.config import ONNX_MODEL_DIR
+from app.core.logging_config import logger
+
+# Supported values for the EMBEDDING_BACKEND and GENERATION_BACKEND settings
+TORCH = "torch"
+TORCH_INT8 = "torch_int8"
+ONNX = "onnx"
+BACKENDS = (TORCH, TORCH_INT8, ONNX)
+
+
+def _check_backend(backend):
+    """
+    Reject unknown backend names.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(
+            f"Unsupported inference backend '{backend}'. Expected one of {BACKENDS}."
+        )
+
+
+def _quantize(model):
+    """
+    Apply int8 dynamic quantization to the linear layers of a PyTorch model.
+
+    Weights are stored as int8 and activations are quantized on the fly, which
+    speeds up CPU inference of transformer models and roughly quarters the
+    memory of their linear layers.
+    """
+    import torch
+
+    return torch.quantization.quantize_dynamic(
+        model, {torch.nn.Linear}, dtype=torch.qint8
+    )
+
+
+def _onnx_import_error(e):
+    """
+    Explain which optional packages the ONNX backend needs.
+    """
+    return RuntimeError(
+        "The onnx inference backend needs the optional 'optimum[onnxruntime]' "
+        f"package: {e}"
+    )
+
+
+def load_embedding_model(name, backend=TORCH):
+    """
+    Load a sentence embedding model for the requested backend.
+
+    Every backend returns a SentenceTransformer, so ``encode`` callers do not
+    change: ``onnx`` runs the model's ONNX export with onnxruntime (exported on
+    first use if the model repository does not ship one).
+
+    Args:
+        name (str): Hugging Face model name.
+        backend (str, optional): One of ``torch``, ``torch_int8`` or ``onnx``.
+
+    Returns:
+        SentenceTransformer: The loaded model.
+    """
+    _check_backend(backend)
+    from sentence_transformers import SentenceTransformer
+
+    if backend == ONNX:
+        try:
+            model = SentenceTransformer(name, backend="onnx")
+        except ImportError as e:
+            raise _onnx_import_error(e)
+    else:
+        model = SentenceTransformer(name)
+        if backend == TORCH_INT8:
+            model = _quantize(model)
+    logger.info(f"Loaded embedding model {name} with the {backend} backend.")
+    return model
+
+
+def load_generation_pipeline(name, backend=TORCH):
+    """
+    Load a text2text-generation pipeline for the requested backend.
+
+    Every backend returns a transformers pipeline whose ``model`` supports
+    ``generate``, so batched and streamed generation work unchanged. The ONNX
+    export of a model is written under ``ONNX_MODEL_DIR`` on first use and
+    reused afterwards.
+
+    Args:
+        name (str): Hugging Face model name.
+        backend (str, optional): One of ``torch``, ``torch_int8`` or ``onnx``.
+
+    Returns:
+        transformers.Pipeline: The loaded pipeline.
+    """
+    _check_backend(backend)
+    from transformers import pipeline
+
+    if backend == ONNX:
+        try:
+            from optimum.onnxruntime import ORTModelForSeq2SeqLM
+        except ImportError as e:
+            raise _onnx_import_error(e)
+        from transformers import AutoTokenizer
+
+        export_dir = os.path.join(ONNX_MODEL_DIR, name.replace("/", "--"))
+        if os.path.isdir(export_dir):
+            model = ORTModelForSeq2SeqLM.from_pretrained(export_dir)
+        else:
+            logger.info(f"Exporting {name} to ONNX in {export_dir}.")
+            model = ORTModelForSeq2SeqLM.from_pretrained(name, export=True)
+            model.save_pretrained(export_dir)
+        qa = pipeline(
+            "text2text-generation",
+            model=model,
+            tokenizer=AutoTokenizer.from_pretrained(name),
+        )
+    else:
+        qa = pipeline("text2text-generation", model=name)
+        if backend == TORCH_INT8:
+            qa.model = _quantize(qa.model)
+    logger.info(f"Loaded generation model {name} with the {backend} backend.")
+    return qa
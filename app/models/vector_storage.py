@@ -0,0 +1,531 @@
+import glob
+import json
+import os
+import threading
+import numpy as np
+from app.core.config import EMBEDDING_MODEL, VECTOR_STORAGE_DIR, VECTOR_STORAGE_DTYPE
+from app.core.logging_config import logger
+
+# Supported element types of stored vectors (the VECTOR_STORAGE_DTYPE setting)
+FLOAT32 = "float32"
+FLOAT16 = "float16"
+INT8 = "int8"
+DTYPES = (FLOAT32, FLOAT16, INT8)
+
+# Largest magnitude of an int8 quantized component
+INT8_MAX = 127
+
+# Number of vectors returned per batch when reading the storage
+READ_BATCH_SIZE = 65536
+
+# File name prefixes of the sorted rows and of the overflow of late chunks
+MAIN = ""
+OVERFLOW = "overflow_"
+
+
+class VectorStorage:
+    """
+    Append-only copy of chunk embeddings in contiguous memory-mapped files.
+
+    Vectors are stored row by row in ``vectors.bin`` with their chunk IDs in
+    ``ids.bin``, in increasing ID order, so a range of chunks is a contiguous
+    slice of both files. ``meta.json`` records the embedding model, dimension,
+    element type, row counts, highest ID (the watermark) and the IDs of deleted
+    chunks; it is replaced atomically after each change, so rows of an
+    interrupted append are ignored. Removed chunks are only marked as deleted
+    and skipped when reading, and updated chunks have their row overwritten in
+    place, so a rebuild from the storage never brings back a stale vector.
+
+    Chunks are not always committed in ID order, e.g. with concurrent uploads.
+    Chunks at or below the watermark that are not stored yet go to a small
+    unsorted overflow segment (``overflow_*.bin``). ``compact`` merges it into
+    the sorted rows and drops the rows of deleted chunks, writing a new
+    generation of the files.
+
+    Vectors can be kept as float32, or scalar quantized to float16 or int8. In
+    int8 every vector has its own scale factor (its largest absolute component
+    divided by 127), stored in ``scales.bin``. float32 vectors are read as views
+    of the mapped file, without copying; quantized ones are decoded per batch.
+
+    Attributes:
+        storage_dir (str): Directory holding the files.
+        dimension (int): The dimension of the vectors.
+        model_name (str): Name of the model that produced the vectors.
+        dtype (str): ``float32``, ``float16`` or ``int8``.
+        count (int): Number of vectors in the sorted rows.
+        overflow_count (int): Number of vectors in the overflow segment.
+        watermark (int): Highest chunk ID appended, 0 when empty.
+        deleted (set[int]): IDs of chunks that have been removed.
+        generation (int): Generation of the files, increased by ``compact``.
+    """
+
+    def __init__(
+        self,
+        storage_dir=VECTOR_STORAGE_DIR,
+        dimension=384,
+        model_name=EMBEDDING_MODEL,
+        dtype=VECTOR_STORAGE_DTYPE,
+    ):
+        """
+        Initialize the storage. Files are read by ``open``.
+
+        Args:
+            storage_dir (str, optional): Directory for the files.
+            dimension (int, optional): The dimension of the vectors. Defaults to 384.
+            model_name (str, optional): Model that produced the vectors. Defaults
+                to EMBEDDING_MODEL.
+            dtype (str, optional): Element type. Defaults to VECTOR_STORAGE_DTYPE.
+        """
+        if dtype not in DTYPES:
+            raise ValueError(
+                f"Unsupported vector storage type '{dtype}'. Expected one of {DTYPES}."
+            )
+        self.storage_dir = storage_dir
+        self.dimension = dimension
+        self.model_name = model_name
+        self.dtype = dtype
+        self.count = 0
+        self.overflow_count = 0
+        self.watermark = 0
+        self.deleted = set()
+        self.generation = 0
+        self.meta_path = os.path.join(storage_dir, "meta.json")
+        # IDs of the overflow rows, in row order
+        self._overflow_ids = np.empty(0, dtype=np.int64)
+        self._lock = threading.Lock()
+
+    def _path(self, name, generation=None):
+        """
+        Return the path of a data file (``ids``, ``vectors``, ``scales``, each
+        optionally prefixed with ``overflow_``) of the current or given generation.
+
+        Files of the first generation have no generation number in their name.
+        """
+        generation = self.generation if generation is None else generation
+        suffix = f".{generation}.bin" if generation else ".bin"
+        return os.path.join(self.storage_dir, f"{name}{suffix}")
+
+    def open(self):
+        """
+        Read the metadata of existing files.
+
+        Files written for another model, dimension or element type are
+        discarded, since their vectors cannot be used with the current index.
+        """
+        with self._lock:
+            self._clear()
+            if not os.path.exists(self.meta_path):
+                return
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if (
+                meta.get("model") != self.model_name
+                or meta.get("dimension") != self.dimension
+                or meta.get("dtype") != self.dtype
+            ):
+                logger.warning("Vector storage layout changed; discarding stored vectors.")
+                self._reset()
+                return
+            self.count = int(meta["count"])
+            self.watermark = int(meta["watermark"])
+            self.deleted = set(meta.get("deleted", []))
+            # Storage written before the overflow segment existed has none
+            self.generation = int(meta.get("generation", 0))
+            self.overflow_count = int(meta.get("overflow_count", 0))
+            if self.overflow_count:
+                self._overflow_ids = np.fromfile(
+                    self._path(f"{OVERFLOW}ids"), dtype=np.int64, count=self.overflow_count
+                )
+        logger.info(
+            f"Opened vector storage with {self.count + self.overflow_count} "
+            f"{self.dtype} vectors."
+        )
+
+    def _clear(self):
+        """
+        Reset the in-memory state to an empty storage. The lock must be held.
+        """
+        self.count, self.overflow_count, self.watermark = 0, 0, 0
+        self.deleted = set()
+        self.generation = 0
+        self._overflow_ids = np.empty(0, dtype=np.int64)
+
+    def _reset(self):
+        """
+        Delete the storage files. The lock must be held.
+        """
+        for path in [self.meta_path] + glob.glob(os.path.join(self.storage_dir, "*.bin")):
+            if os.path.exists(path):
+                os.remove(path)
+        self._clear()
+
+    def _write_meta(self):
+        """
+        Atomically replace the metadata file. The lock must be held.
+        """
+        os.makedirs(self.storage_dir, exist_ok=True)
+        tmp_path = f"{self.meta_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "model": self.model_name,
+                    "dimension": self.dimension,
+                    "dtype": self.dtype,
+                    "count": self.count,
+                    "overflow_count": self.overflow_count,
+                    "generation": self.generation,
+                    "watermark": self.watermark,
+                    "deleted": sorted(self.deleted),
+                },
+                f,
+            )
+        os.replace(tmp_path, self.meta_path)
+
+    def _quantize(self, vectors):
+        """
+        Convert float32 vectors to the storage type.
+
+        Returns:
+            tuple: ``(data, scales)``; scales is None unless the type is int8.
+        """
+        if self.dtype == FLOAT32:
+            return vectors, None
+        if self.dtype == FLOAT16:
+            return vectors.astype(np.float16), None
+        scales = np.abs(vectors).max(axis=1) / INT8_MAX
+        scales[scales == 0] = 1.0
+        data = np.rint(vectors / scales[:, None]).astype(np.int8)
+        return data, scales.astype(np.float32)
+
+    def _decode(self, data, scales):
+        """
+        Convert stored rows back to float32.
+        """
+        if self.dtype == FLOAT32:
+            return data
+        if self.dtype == FLOAT16:
+            return data.astype(np.float32)
+        return data.astype(np.float32) * scales[:, None]
+
+    def _write_rows(self, segment, count, ids, data, scales, generation=None):
+        """
+        Append quantized rows to a segment holding ``count`` rows. The lock must
+        be held.
+        """
+        os.makedirs(self.storage_dir, exist_ok=True)
+        files = [("ids", ids), ("vectors", data)]
+        if scales is not None:
+            files.append(("scales", scales))
+        for name, array in files:
+            # Cut off rows of an interrupted append before writing after them
+            row_bytes = array.itemsize * (array.shape[1] if array.ndim > 1 else 1)
+            with open(self._path(f"{segment}{name}", generation), "ab") as f:
+                f.truncate(count * row_bytes)
+                f.write(np.ascontiguousarray(array).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+    def append(self, ids, embeddings, extend=True):
+        """
+        Store the embeddings of chunks that are not stored yet.
+
+        Chunks above the watermark are appended to the sorted rows, but only if
+        ``extend`` is true: reads start from the database above the watermark,
+        so callers must only extend when no chunk below these IDs is missing.
+        Chunks at or below the watermark go to the overflow segment. Stored
+        chunks are skipped, so appending the same rows again is harmless.
+
+        Args:
+            ids (np.ndarray): Chunk IDs.
+            embeddings (np.ndarray): A ``(len(ids), dimension)`` float32 array.
+            extend (bool, optional): Append chunks above the watermark. Defaults
+                to True.
+
+        Returns:
+            int: Number of vectors stored.
+        """
+        ids, first = np.unique(np.asarray(ids, dtype=np.int64), return_index=True)
+        vectors = np.asarray(embeddings, dtype=np.float32).reshape(-1, self.dimension)[first]
+        with self._lock:
+            main_rows, overflow_rows = self._locate(ids)
+            new = (main_rows < 0) & (overflow_rows < 0)
+            late = new & (ids <= self.watermark)
+            above = new & (ids > self.watermark) & extend
+            if not late.any() and not above.any():
+                return 0
+            if late.any():
+                data, scales = self._quantize(vectors[late])
+                self._write_rows(OVERFLOW, self.overflow_count, ids[late], data, scales)
+                self.overflow_count += int(late.sum())
+                self._overflow_ids = np.concatenate([self._overflow_ids, ids[late]])
+            if above.any():
+                # np.unique returned the IDs sorted
+                data, scales = self._quantize(vectors[above])
+                self._write_rows(MAIN, self.count, ids[above], data, scales)
+                self.count += int(above.sum())
+                self.watermark = int(ids[above][-1])
+            self._write_meta()
+        return int(late.sum() + above.sum())
+
+    def delete(self, ids):
+        """
+        Mark chunks as deleted, so they are skipped when reading.
+
+        Chunks that are not stored yet are marked too, so callers streaming
+        newer chunks from the database can skip them (see ``is_deleted``).
+
+        Args:
+            ids (array-like of int): Chunk IDs.
+
+        Returns:
+            int: Number of chunks newly marked as deleted.
+        """
+        with self._lock:
+            marked = {int(chunk_id) for chunk_id in ids} - self.deleted
+            if marked:
+                self.deleted |= marked
+                self._write_meta()
+        return len(marked)
+
+    def is_deleted(self, ids):
+        """
+        Return a boolean mask of which of ``ids`` are marked as deleted.
+        """
+        with self._lock:
+            if not self.deleted:
+                return np.zeros(len(ids), dtype=bool)
+            return np.isin(ids, np.fromiter(self.deleted, dtype=np.int64))
+
+    def replace(self, ids, embeddings):
+        """
+        Overwrite the stored vectors of chunks and clear their deleted marks.
+
+        IDs that are not stored are only unmarked; use ``append`` to store them.
+
+        Args:
+            ids (array-like of int): Chunk IDs.
+            embeddings (np.ndarray): A ``(len(ids), dimension)`` float32 array.
+
+        Returns:
+            int: Number of stored vectors overwritten.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        vectors = np.asarray(embeddings, dtype=np.float32).reshape(-1, self.dimension)
+        with self._lock:
+            unmarked = self.deleted & {int(chunk_id) for chunk_id in ids}
+            main_rows, overflow_rows = self._locate(ids)
+            overwritten = 0
+            for segment, count, rows in (
+                (MAIN, self.count, main_rows),
+                (OVERFLOW, self.overflow_count, overflow_rows),
+            ):
+                found = rows >= 0
+                if found.any():
+                    self._overwrite(segment, count, rows[found], vectors[found])
+                    overwritten += int(found.sum())
+            if not overwritten and not unmarked:
+                return 0
+            self.deleted -= unmarked
+            self._write_meta()
+        return overwritten
+
+    def _overwrite(self, segment, count, rows, vectors):
+        """
+        Write float32 vectors over the given rows of a segment. The lock must be held.
+        """
+        data, scales = self._quantize(vectors)
+        files = [("vectors", data, (count, self.dimension))]
+        if scales is not None:
+            files.append(("scales", scales, (count,)))
+        for name, array, shape in files:
+            mapped = np.memmap(
+                self._path(f"{segment}{name}"), dtype=array.dtype, mode="r+", shape=shape
+            )
+            mapped[rows] = array
+            mapped.flush()
+            del mapped
+
+    def _locate(self, ids):
+        """
+        Find the rows of chunks in the sorted rows and in the overflow segment.
+        The lock must be held.
+
+        Returns:
+            tuple: ``(main_rows, overflow_rows)``, -1 where a chunk is not stored.
+        """
+        main_rows = np.full(len(ids), -1, dtype=np.int64)
+        overflow_rows = np.full(len(ids), -1, dtype=np.int64)
+        if len(ids) == 0:
+            return main_rows, overflow_rows
+        if self.count:
+            stored_ids = np.memmap(
+                self._path(f"{MAIN}ids"), dtype=np.int64, mode="r", shape=(self.count,)
+            )
+            rows = np.minimum(np.searchsorted(stored_ids, ids), self.count - 1)
+            found = stored_ids[rows] == ids
+            main_rows[found] = rows[found]
+        if self.overflow_count:
+            order = np.argsort(self._overflow_ids, kind="stable")
+            sorted_ids = self._overflow_ids[order]
+            positions = np.minimum(np.searchsorted(sorted_ids, ids), self.overflow_count - 1)
+            found = sorted_ids[positions] == ids
+            overflow_rows[found] = order[positions[found]]
+        return main_rows, overflow_rows
+
+    def _map(self, segment, count, generation=None):
+        """
+        Map the ``(ids, data, scales)`` of a segment read-only. The lock must be held.
+        """
+        ids = np.memmap(
+            self._path(f"{segment}ids", generation), dtype=np.int64, mode="r", shape=(count,)
+        )
+        data = np.memmap(
+            self._path(f"{segment}vectors", generation),
+            dtype=np.dtype(self.dtype),
+            mode="r",
+            shape=(count, self.dimension),
+        )
+        scales = None
+        if self.dtype == INT8:
+            scales = np.memmap(
+                self._path(f"{segment}scales", generation),
+                dtype=np.float32,
+                mode="r",
+                shape=(count,),
+            )
+        return ids, data, scales
+
+    def iter_batches(self, min_id=0, batch_size=READ_BATCH_SIZE):
+        """
+        Stream ``(ids, embeddings)`` batches for stored chunks with ``id > min_id``.
+
+        The sorted rows come first, in ID order, then the overflow segment.
+        float32 batches of the sorted rows are read-only views of the mapped
+        files, which FAISS can add to an index without a copy; quantized
+        batches are decoded to float32. Deleted chunks are left out.
+        """
+        with self._lock:
+            deleted = np.fromiter(self.deleted, dtype=np.int64)
+            # Mapped while locked, so ``compact`` cannot swap the files in between
+            main = self._map(MAIN, self.count) if self.count else None
+            overflow = (
+                self._map(OVERFLOW, self.overflow_count) if self.overflow_count else None
+            )
+        if main is not None:
+            ids, data, scales = main
+            start = int(np.searchsorted(ids, min_id, side="right"))
+            for begin in range(start, len(ids), batch_size):
+                end = min(begin + batch_size, len(ids))
+                batch = self._live_rows(
+                    ids[begin:end],
+                    self._decode(data[begin:end], None if scales is None else scales[begin:end]),
+                    deleted,
+                )
+                if batch is not None:
+                    yield batch
+        if overflow is not None:
+            ids, data, scales = overflow
+            rows = np.flatnonzero(np.asarray(ids) > min_id)
+            for begin in range(0, len(rows), batch_size):
+                batch_rows = rows[begin : begin + batch_size]
+                batch = self._live_rows(
+                    np.asarray(ids[batch_rows]),
+                    self._decode(
+                        np.asarray(data[batch_rows]),
+                        None if scales is None else np.asarray(scales[batch_rows]),
+                    ),
+                    deleted,
+                )
+                if batch is not None:
+                    yield batch
+
+    @staticmethod
+    def _live_rows(ids, vectors, deleted):
+        """
+        Drop the rows of deleted chunks from a batch; None if none is left.
+        """
+        if len(deleted):
+            keep = ~np.isin(ids, deleted)
+            if not keep.all():
+                ids, vectors = ids[keep], vectors[keep]
+        return (ids, vectors) if len(ids) else None
+
+    def compact(self):
+        """
+        Merge the overflow segment into the sorted rows and drop the rows of
+        deleted chunks, along with their deleted marks.
+
+        The merged rows are written to files of the next generation, which are
+        published by replacing the metadata file; the previous files are then
+        deleted. Batches already mapped by ``iter_batches`` stay readable.
+        Marks of chunks that are not stored are kept.
+
+        Returns:
+            int: Number of rows dropped.
+        """
+        with self._lock:
+            marked = np.fromiter(self.deleted, dtype=np.int64)
+            main_rows, overflow_rows = self._locate(marked)
+            dropped = marked[(main_rows >= 0) | (overflow_rows >= 0)]
+            if not self.overflow_count and not len(dropped):
+                return 0
+
+            generation = self.generation + 1
+            count = 0
+            for ids, data, scales in self._merged_rows():
+                keep = ~np.isin(ids, dropped)
+                if scales is not None:
+                    scales = scales[keep]
+                self._write_rows(MAIN, count, ids[keep], data[keep], scales, generation)
+                count += int(keep.sum())
+
+            previous = self.generation
+            self.generation = generation
+            self.count = count
+            self.overflow_count = 0
+            self._overflow_ids = np.empty(0, dtype=np.int64)
+            self.deleted -= set(dropped.tolist())
+            self._write_meta()
+            for segment in (MAIN, OVERFLOW):
+                for name in ("ids", "vectors", "scales"):
+                    path = self._path(f"{segment}{name}", previous)
+                    if os.path.exists(path):
+                        os.remove(path)
+        logger.info(f"Compacted vector storage to {count} vectors, dropping {len(dropped)}.")
+        return len(dropped)
+
+    def _merged_rows(self):
+        """
+        Stream the quantized ``(ids, data, scales)`` rows of both segments in ID
+        order. The lock must be held.
+
+        The overflow segment is small, so it is sorted in memory and its rows are
+        merged into the batch of sorted rows they fall in.
+        """
+        overflow = [None, None, None]
+        if self.overflow_count:
+            mapped = self._map(OVERFLOW, self.overflow_count)
+            order = np.argsort(mapped[0], kind="stable")
+            overflow = [None if part is None else np.asarray(part)[order] for part in mapped]
+        taken = 0
+        if self.count:
+            main = self._map(MAIN, self.count)
+            for begin in range(0, self.count, READ_BATCH_SIZE):
+                end = min(begin + READ_BATCH_SIZE, self.count)
+                batch = [None if part is None else np.asarray(part[begin:end]) for part in main]
+                if overflow[0] is not None:
+                    limit = len(overflow[0])
+                    if end < self.count:
+                        limit = int(np.searchsorted(overflow[0], main[0][end]))
+                    if limit > taken:
+                        merged = [
+                            None if part is None else np.concatenate([part, extra[taken:limit]])
+                            for part, extra in zip(batch, overflow)
+                        ]
+                        order = np.argsort(merged[0], kind="stable")
+                        batch = [None if part is None else part[order] for part in merged]
+                        taken = limit
+                yield batch
+        if overflow[0] is not None and taken < len(overflow[0]):
+            # Only when there are no sorted rows, e.g. after all were dropped
+            yield [None if part is None else part[taken:] for part in overflow]
@@ -0,0 +1,118 @@
+import io
+import json
+import tarfile
+import zipfile
+from app.core.logging_config import logger
+
+# Extensions accepted by the bulk upload endpoint
+TEXT_EXTENSIONS = (".txt",)
+ZIP_EXTENSIONS = (".zip",)
+TAR_EXTENSIONS = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+JSONL_EXTENSIONS = (".jsonl",)
+
+
+def iter_documents(filename, fileobj):
+    """
+    Stream the documents contained in an uploaded file, one at a time.
+
+    ``.txt`` files are a single document. Zip and tar archives yield one document
+    per ``.txt`` member, and JSONL files one document per line (its ``text``
+    field). Archives are read member by member and tar archives as a forward-only
+    stream, so the whole upload is never held in memory.
+
+    Args:
+        filename (str): Name of the uploaded file, used to pick the format.
+        fileobj (file): Binary file object with the upload's content.
+
+    Yields:
+        tuple: ``(name, text, error)`` where ``name`` identifies the document,
+        ``text`` is its stripped content (None on failure) and ``error`` is a
+        message describing why it was rejected (None on success).
+    """
+    lower = filename.lower()
+    try:
+        if lower.endswith(TEXT_EXTENSIONS):
+            yield _decode(filename, fileobj.read())
+        elif lower.endswith(ZIP_EXTENSIONS):
+            yield from _iter_zip(filename, fileobj)
+        elif lower.endswith(TAR_EXTENSIONS):
+            yield from _iter_tar(filename, fileobj)
+        elif lower.endswith(JSONL_EXTENSIONS):
+            yield from _iter_jsonl(filename, fileobj)
+        else:
+            yield filename, None, "Unsupported file type."
+    except (zipfile.BadZipFile, tarfile.TarError) as e:
+        logger.error(f"Could not read archive {filename}: {e}")
+        yield filename, None, "Archive is corrupt or unreadable."
+
+
+def _decode(name, content):
+    """
+    Decode a document as UTF-8 and reject empty ones.
+    """
+    try:
+        text = content.decode("utf-8").strip()
+    except UnicodeDecodeError:
+        return name, None, "File encoding must be UTF-8."
+    if not text:
+        return name, None, "Uploaded document is empty."
+    return name, text, None
+
+
+def _iter_zip(filename, fileobj):
+    """
+    Yield the ``.txt`` members of a zip archive.
+    """
+    with zipfile.ZipFile(fileobj) as archive:
+        for info in archive.infolist():
+            if info.is_dir():
+                continue
+            name = f"{filename}/{info.filename}"
+            if not info.filename.lower().endswith(TEXT_EXTENSIONS):
+                yield name, None, "Unsupported file type."
+                continue
+            with archive.open(info) as member:
+                yield _decode(name, member.read())
+
+
+def _iter_tar(filename, fileobj):
+    """
+    Yield the ``.txt`` members of a (possibly compressed) tar archive as a stream.
+    """
+    with tarfile.open(fileobj=fileobj, mode="r|*") as archive:
+        for info in archive:
+            if not info.isfile():
+                continue
+            name = f"{filename}/{info.name}"
+            if not info.name.lower().endswith(TEXT_EXTENSIONS):
+                yield name, None, "Unsupported file type."
+                continue
+            yield _decode(name, archive.extractfile(info).read())
+
+
+def _iter_jsonl(filename, fileobj):
+    """
+    Yield one document per line of a JSONL file, taken from its ``text`` field.
+    """
+    lines = io.TextIOWrapper(fileobj, encoding="utf-8", errors="strict")
+    try:
+        for line_number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            name = f"{filename}:{line_number}"
+            try:
+                record = json.loads(line)
+                text = record["text"].strip() if isinstance(record, dict) else None
+            except (ValueError, KeyError, AttributeError):
+                text = None
+            if text is None:
+                yield name, None, "Line must be a JSON object with a 'text' string."
+            elif not text:
+                yield name, None, "Uploaded document is empty."
+            else:
+                yield name, text, None
+    except UnicodeDecodeError:
+        yield filename, None, "File encoding must be UTF-8."
+    finally:
+        # Leave the underlying upload open for FastAPI to clean up.
+        lines.detach()
@@ -0,0 +1,221 @@
+import hashlib
+import sys
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from app.core.config import (
+    CACHE_ENABLED,
+    CACHE_MAX_ENTRIES,
+    CACHE_MAX_MB,
+    CACHE_TTL_SECONDS,
+)
+from app.core.logging_config import logger
+
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache with a time-to-live and a memory budget.
+
+    Entries expire ``ttl`` seconds after they were stored. When either the number
+    of entries or their estimated size exceeds its limit, the least recently used
+    entries are evicted first.
+
+    Attributes:
+        name (str): Name of the cache, used in logs and statistics.
+        hits (int): Number of lookups answered from the cache.
+        misses (int): Number of lookups that found nothing or an expired entry.
+        evictions (int): Number of entries dropped to respect the limits.
+    """
+
+    def __init__(self, name, max_entries, max_bytes, ttl):
+        """
+        Initialize an empty cache.
+
+        Args:
+            name (str): Name of the cache.
+            max_entries (int): Maximum number of entries.
+            max_bytes (int): Maximum estimated size of all values, in bytes.
+            ttl (float): Seconds an entry stays valid.
+        """
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Look up a key, refreshing its recency.
+
+        Returns:
+            The cached value, or None if absent or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, size, expires_at = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._pop(key)
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        """
+        Store a value, evicting least recently used entries if over the limits.
+        Values larger than the whole memory budget are not cached.
+        """
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+            self._entries[key] = (value, size, time.monotonic() + self.ttl)
+            self._size += size
+            while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+                self._pop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        """
+        Drop all entries. Counters are kept.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        """
+        Return the cache's counters and current usage.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+    def _pop(self, key):
+        """
+        Remove an entry and release its size. The lock must be held.
+        """
+        _, size, _ = self._entries.pop(key)
+        self._size -= size
+
+
+def estimate_size(value):
+    """
+    Estimate the memory used by a cached value, in bytes.
+    """
+    if isinstance(value, np.ndarray):
+        return value.nbytes + sys.getsizeof(value)
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_size(item) for item in value)
+    return sys.getsizeof(value)
+
+
+def normalize_question(question):
+    """
+    Normalize a question for the embedding cache: collapse whitespace and
+    lowercase it (the embedding model is uncased).
+    """
+    return " ".join(question.split()).lower()
+
+
+def embedding_key(embedding):
+    """
+    Hash a query embedding into a compact cache key.
+    """
+    return hashlib.sha256(np.ascontiguousarray(embedding).tobytes()).hexdigest()
+
+
+def prompt_key(prompt, **params):
+    """
+    Hash a prompt and the generation parameters into a compact cache key.
+    """
+    parts = [prompt] + [f"{name}={params[name]}" for name in sorted(params)]
+    return hashlib.sha256("\x00".join(parts).encode("utf-8")).hexdigest()
+
+
+_max_bytes = int(CACHE_MAX_MB * 1024 * 1024)
+
+# Normalized question -> query embedding
+embedding_cache = LRUCache("embedding", CACHE_MAX_ENTRIES, _max_bytes, CACHE_TTL_SECONDS)
+
+# (embedding hash, selection key, k, threshold, corpus and index versions)
+# -> (chunk IDs, message)
+retrieval_cache = LRUCache("retrieval", CACHE_MAX_ENTRIES, _max_bytes, CACHE_TTL_SECONDS)
+
+# Prompt hash -> generated answer
+answer_cache = LRUCache("answer", CACHE_MAX_ENTRIES, _max_bytes, CACHE_TTL_SECONDS)
+
+# Passage text hash -> token IDs of the generation model's tokenizer
+token_cache = LRUCache("tokenization", CACHE_MAX_ENTRIES, _max_bytes, CACHE_TTL_SECONDS)
+
+# Chunk ID -> (document ID, text) of retrieved chunks; chunks never change, so
+# uploads leave these entries valid
+text_cache = LRUCache("chunk_text", CACHE_MAX_ENTRIES, _max_bytes, CACHE_TTL_SECONDS)
+
+_version = 0
+_version_lock = threading.Lock()
+
+
+def corpus_version():
+    """
+    Return a counter that changes whenever the cache is invalidated.
+
+    Retrieval keys include it, so a result computed before an upload but stored
+    after the invalidation can never be served.
+    """
+    return _version
+
+
+def invalidate(reason):
+    """
+    Drop cached retrievals and answers after the corpus changed.
+
+    Query embeddings, passage tokenizations and chunk texts do not depend on
+    the rest of the corpus and stay cached. Selections need no invalidation
+    since retrieval keys include the selection.
+
+    Args:
+        reason (str): What changed, for the logs.
+    """
+    global _version
+    with _version_lock:
+        _version += 1
+    retrieval_cache.clear()
+    answer_cache.clear()
+    logger.info(f"Invalidated retrieval and answer caches: {reason}.")
+
+
+def cache_stats():
+    """
+    Return hit and miss counters of every cache layer.
+    """
+    return {
+        "enabled": CACHE_ENABLED,
+        "layers": {
+            cache.name: cache.stats()
+            for cache in (
+                embedding_cache,
+                retrieval_cache,
+                answer_cache,
+                token_cache,
+                text_cache,
+            )
+        },
+    }
@@ -0,0 +1,88 @@
+import re
+from app.core.config import CHUNK_STRATEGY, CHUNK_SIZE, CHUNK_OVERLAP
+from app.core.logging_config import logger
+
+# Splits text after sentence-ending punctuation followed by whitespace
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+")
+
+
+def chunk_text(text, strategy=CHUNK_STRATEGY, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
+    """
+    Split a document into overlapping chunks for embedding and retrieval.
+
+    Sizes are measured in whitespace-separated tokens, which keeps chunks well
+    under the 256 word-piece limit of the embedding model at the default size.
+
+    Args:
+        text (str): The document text.
+        strategy (str, optional): ``tokens`` for fixed-size token windows or
+            ``sentences`` for windows of whole sentences. Defaults to CHUNK_STRATEGY.
+        chunk_size (int, optional): Maximum number of tokens per chunk.
+        overlap (int, optional): Number of tokens shared by consecutive chunks.
+
+    Returns:
+        list[str]: The non-empty chunks, in document order.
+    """
+    if overlap >= chunk_size:
+        raise ValueError("Chunk overlap must be smaller than the chunk size.")
+
+    if strategy == "tokens":
+        chunks = _token_windows(text.split(), chunk_size, overlap)
+    elif strategy == "sentences":
+        chunks = _sentence_windows(text, chunk_size, overlap)
+    else:
+        raise ValueError(f"Unsupported chunking strategy '{strategy}'.")
+
+    logger.info(f"Split document into {len(chunks)} chunk(s) using '{strategy}'.")
+    return chunks
+
+
+def _token_windows(tokens, chunk_size, overlap):
+    """
+    Slide a fixed-size window over the tokens, stepping by ``chunk_size - overlap``.
+    """
+    step = chunk_size - overlap
+    chunks = []
+    for start in range(0, len(tokens), step):
+        chunks.append(" ".join(tokens[start : start + chunk_size]))
+        if start + chunk_size >= len(tokens):
+            break
+    return chunks
+
+
+def _sentence_windows(text, chunk_size, overlap):
+    """
+    Group whole sentences into chunks of at most ``chunk_size`` tokens.
+
+    Each chunk starts with the trailing sentences of the previous one, up to
+    ``overlap`` tokens. Sentences longer than a chunk are split by tokens.
+    """
+    sentences = []
+    for sentence in SENTENCE_BOUNDARY.split(text):
+        tokens = sentence.split()
+        if len(tokens) > chunk_size:
+            sentences.extend(
+                window.split() for window in _token_windows(tokens, chunk_size, overlap)
+            )
+        elif tokens:
+            sentences.append(tokens)
+
+    chunks = []
+    window = []
+    for tokens in sentences:
+        if window and sum(map(len, window)) + len(tokens) > chunk_size:
+            chunks.append(" ".join(" ".join(s) for s in window))
+            # Carry over trailing sentences that fit in the overlap budget.
+            carried = []
+            for previous in reversed(window):
+                if sum(map(len, carried)) + len(previous) > overlap:
+                    break
+                carried.insert(0, previous)
+            window = carried
+            if sum(map(len, window)) + len(tokens) > chunk_size:
+                window = []
+        window.append(tokens)
+
+    if window:
+        chunks.append(" ".join(" ".join(s) for s in window))
+    return chunks
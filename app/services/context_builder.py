@@ -0,0 +1,192 @@
+import asyncio
+import hashlib
+import re
+import threading
+import numpy as np
+from fastapi import HTTPException
+from app.core.config import CONTEXT_DEDUP_THRESHOLD, GENERATION_MODEL
+from app.core.logging_config import logger
+from app.services.cache import token_cache
+from app.services.generation_service import input_token_limit
+
+# Prompt template; the question comes last so it is never cut off
+PROMPT_TEMPLATE = (
+    "Based on the given information, provide a concise answer to the question."
+    "\n\nInformation:\n{context}\n\nQuestion: {question}"
+)
+
+# Passages are joined with this separator in the prompt
+SEPARATOR = "\n\n"
+
+# Word n-grams compared to detect near-duplicate passages
+SHINGLE_SIZE = 3
+
+_tokenizer = None
+_tokenizer_lock = threading.Lock()
+
+
+class QuestionTooLongError(HTTPException):
+    """
+    Raised when a question alone does not fit in the model's input limit.
+
+    It is an HTTPException, so handlers that re-raise HTTPExceptions turn it
+    into a 400 response.
+    """
+
+    def __init__(self):
+        super().__init__(
+            status_code=400,
+            detail="Question is too long for the model's input limit.",
+        )
+
+
+def get_tokenizer():
+    """
+    Return the tokenizer of the generation model, loading it on first use.
+
+    Only the tokenizer is loaded, so prompts can be measured in processes that
+    leave the model itself to generation workers.
+    """
+    global _tokenizer
+    if _tokenizer is None:
+        with _tokenizer_lock:
+            if _tokenizer is None:
+                from transformers import AutoTokenizer
+
+                _tokenizer = AutoTokenizer.from_pretrained(GENERATION_MODEL)
+    return _tokenizer
+
+
+def token_ids(text):
+    """
+    Tokenize a passage without special tokens, caching the result by text so
+    frequently retrieved passages are only tokenized once.
+
+    Returns:
+        np.ndarray: The token IDs as int32.
+    """
+    key = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    ids = token_cache.get(key)
+    if ids is None:
+        ids = np.asarray(
+            get_tokenizer()(text, add_special_tokens=False)["input_ids"], dtype=np.int32
+        )
+        token_cache.set(key, ids)
+    return ids
+
+
+def _shingles(text):
+    """
+    Return the set of lowercased word n-grams of a passage.
+    """
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < SHINGLE_SIZE:
+        return {tuple(words)}
+    return {tuple(words[i : i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def _is_near_duplicate(shingles, kept):
+    """
+    Return whether a passage's shingles overlap any kept passage's by at least
+    ``CONTEXT_DEDUP_THRESHOLD`` (Jaccard similarity).
+    """
+    for other in kept:
+        union = len(shingles | other)
+        if union and len(shingles & other) / union >= CONTEXT_DEDUP_THRESHOLD:
+            return True
+    return False
+
+
+def build_prompt(question, chunks):
+    """
+    Build the generation prompt for a question from its retrieved chunks.
+
+    Chunks are taken in retrieval order (best match first). Near-duplicates of
+    a passage already taken are skipped, and passages are packed greedily into
+    the model's input limit as counted by its tokenizer, after reserving room
+    for the template and the question. A passage that does not fit is skipped
+    in favour of shorter ones further down, except the best one, which is
+    truncated rather than left out.
+
+    Passages are counted one by one, and tokens can merge or split where they
+    are joined, so the finished prompt is counted once more and its last
+    passage trimmed until it fits. The question is never cut.
+
+    Tokenization is CPU-bound; use build_prompt_async from request handlers.
+
+    Args:
+        question (str): The user's question.
+        chunks (list[RetrievedChunk]): The retrieved chunks, best match first.
+
+    Returns:
+        str or None: The prompt, or None if the chunks contain no text.
+
+    Raises:
+        QuestionTooLongError: If the question leaves no room for any passage.
+    """
+    tokenizer = get_tokenizer()
+    limit = input_token_limit(tokenizer)
+    # Room left for passages once the template, the question and the special
+    # tokens are counted
+    budget = limit - len(
+        tokenizer(PROMPT_TEMPLATE.format(context="", question=question))["input_ids"]
+    )
+    if budget <= 0:
+        raise QuestionTooLongError()
+    separator_tokens = len(token_ids(SEPARATOR))
+
+    passages, kept_shingles = [], []
+    for chunk in chunks:
+        text = chunk.text.strip()
+        if not text:
+            continue
+        shingles = _shingles(text)
+        if _is_near_duplicate(shingles, kept_shingles):
+            continue
+
+        ids = token_ids(text)
+        cost = len(ids) + (separator_tokens if passages else 0)
+        if cost <= budget:
+            passages.append(text)
+        elif not passages:
+            passages.append(tokenizer.decode(ids[:budget], skip_special_tokens=True))
+            cost = budget
+        else:
+            continue
+        kept_shingles.append(shingles)
+        budget -= cost
+
+    while passages:
+        prompt = PROMPT_TEMPLATE.format(context=SEPARATOR.join(passages), question=question)
+        excess = len(tokenizer(prompt)["input_ids"]) - limit
+        if excess <= 0:
+            logger.info(
+                f"Packed {len(passages)} of {len(chunks)} retrieved chunks into the prompt."
+            )
+            return prompt
+        # Trim the least relevant passage, dropping it if nothing would be left
+        ids = token_ids(passages[-1])
+        trimmed = tokenizer.decode(ids[: len(ids) - excess], skip_special_tokens=True).strip()
+        if len(ids) > excess and trimmed and len(token_ids(trimmed)) < len(ids):
+            passages[-1] = trimmed
+        else:
+            passages.pop()
+    return None
+
+
+async def build_prompt_async(question, chunks):
+    """
+    Build the generation prompt in a worker thread, so tokenizing (and loading
+    the tokenizer on first use) does not block the event loop.
+
+    Raises:
+        QuestionTooLongError: If the question leaves no room for any passage.
+    """
+    return await asyncio.to_thread(build_prompt, question, chunks)
+
+
+def warm_up_tokenizer():
+    """
+    Load the generation model's tokenizer before the first request.
+    """
+    token_ids(SEPARATOR)
@@ -1,24 +1,166 @@
-from sentence_transformers import SentenceTransformer
+import asyncio
+import queue
+import threading
+import numpy as np
+from app.core.config import (
+    EMBEDDING_BACKEND,
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_MODEL,
+    EMBEDDING_MAX_WAIT_MS,
+    EMBEDDING_QUEUE_SIZE,
+)
 from app.core.logging_config import logger
+from app.models.model_backends import load_embedding_model
+from app.services.inference_executor import InferenceOverloadedError
+from app.services.micro_batcher import MicroBatcher
 
-# Load the pre-trained sentence embedding model
-model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
+# Loaded on first use or during warm-up, so importing this module stays cheap
+_model = None
+_model_lock = threading.Lock()
+
+
+def get_model():
+    """
+    Return the sentence embedding model, loading it on first use.
+
+    Returns:
+        SentenceTransformer: The shared embedding model, run with the
+        ``EMBEDDING_BACKEND`` inference backend.
+    """
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                _model = load_embedding_model(EMBEDDING_MODEL, EMBEDDING_BACKEND)
+    return _model
+
+
+def _encode_batch(texts):
+    """
+    Encode a micro-batch of texts in a single forward pass.
+
+    Embeddings are L2-normalized so that inner product equals cosine similarity.
+    """
+    embeddings = get_model().encode(
+        texts, batch_size=EMBEDDING_BATCH_SIZE, normalize_embeddings=True
+    )
+    logger.info(f"Encoded micro-batch of {len(texts)} text(s).")
+    return embeddings
+
+
+def warm_up_embedding():
+    """
+    Load the embedding model and run one encode so the first request does not
+    pay for lazy initialization.
+    """
+    get_model().encode(["warm up"], normalize_embeddings=True)
+
+
+# Shared engine that merges concurrent embedding requests into micro-batches
+embedding_batcher = MicroBatcher(
+    _encode_batch,
+    max_batch_size=EMBEDDING_BATCH_SIZE,
+    max_wait_ms=EMBEDDING_MAX_WAIT_MS,
+    max_queue_size=EMBEDDING_QUEUE_SIZE,
+    name="embedding-batcher",
+)
 
 
 def generate_embedding(text):
     """
     Generate an embedding vector for the given text using the SentenceTransformer model.
 
+    The text is encoded together with other concurrent requests by the shared
+    micro-batching engine. Embeddings are L2-normalized so that inner product
+    equals cosine similarity.
+
+    Args:
+        text (str): The input text to be converted into an embedding.
+    Returns:
+        np.ndarray or None: The generated embedding vector as a NumPy array if successful,
+        otherwise None in case of an error.
+    Raises:
+        InferenceOverloadedError: If the embedding queue is full.
+    """
+    try:
+        embedding = embedding_batcher.submit(text, block=False).result()
+        logger.info("Generated embedding successfully.")
+        return embedding
+    except queue.Full:
+        raise InferenceOverloadedError()
+    except Exception as e:
+        logger.error(f"Error generating embedding: {e}")
+        return None
+
+
+async def generate_embedding_async(text):
+    """
+    Generate an embedding vector without blocking the event loop.
+
     Args:
         text (str): The input text to be converted into an embedding.
     Returns:
         np.ndarray or None: The generated embedding vector as a NumPy array if successful,
         otherwise None in case of an error.
+    Raises:
+        InferenceOverloadedError: If the embedding queue is full.
     """
     try:
-        embedding = model.encode(text)
+        future = embedding_batcher.submit(text, block=False)
+        embedding = await asyncio.wrap_future(future)
         logger.info("Generated embedding successfully.")
         return embedding
+    except queue.Full:
+        raise InferenceOverloadedError()
     except Exception as e:
         logger.error(f"Error generating embedding: {e}")
         return None
+
+
+def generate_embeddings(texts):
+    """
+    Generate embedding vectors for several texts through the micro-batching engine.
+
+    Bulk callers wait for room in the queue rather than being rejected.
+
+    Args:
+        texts (list[str]): The input texts to be converted into embeddings.
+    Returns:
+        np.ndarray or None: A ``(len(texts), dimension)`` array of L2-normalized
+        embeddings if successful, otherwise None in case of an error.
+    """
+    try:
+        futures = embedding_batcher.submit_many(texts)
+        embeddings = np.vstack([future.result() for future in futures])
+        logger.info(f"Generated {len(texts)} embeddings successfully.")
+        return embeddings
+    except Exception as e:
+        logger.error(f"Error generating embeddings: {e}")
+        return None
+
+
+async def generate_embeddings_async(texts):
+    """
+    Generate embedding vectors for several texts without blocking the event loop.
+
+    The texts go through the micro-batching engine like single requests, so
+    they share its bounded queue and worker with concurrent requests.
+
+    Args:
+        texts (list[str]): The input texts to be converted into embeddings.
+    Returns:
+        np.ndarray or None: A ``(len(texts), dimension)`` array of L2-normalized
+        embeddings if successful, otherwise None in case of an error.
+    Raises:
+        InferenceOverloadedError: If the embedding queue has no room for the texts.
+    """
+    try:
+        futures = embedding_batcher.submit_many(texts, block=False)
+        embeddings = await asyncio.gather(*map(asyncio.wrap_future, futures))
+        logger.info(f"Generated {len(texts)} embeddings successfully.")
+        return np.vstack(embeddings).astype(np.float32, copy=False)
+    except queue.Full:
+        raise InferenceOverloadedError()
+    except Exception as e:
+        logger.error(f"Error generating embeddings: {e}")
+        return None
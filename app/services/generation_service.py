@@ -0,0 +1,399 @@
+import asyncio
+import threading
+import weakref
+from app.core.config import (
+    GENERATION_BACKEND,
+    GENERATION_BATCH_SIZE,
+    GENERATION_EARLY_STOPPING,
+    GENERATION_EXECUTOR,
+    GENERATION_MAX_INPUT_TOKENS,
+    GENERATION_MAX_NEW_TOKENS,
+    GENERATION_MAX_PENDING,
+    GENERATION_MAX_TIME,
+    GENERATION_MODEL,
+    GENERATION_NUM_BEAMS,
+    GENERATION_ROUTE_MAX_TOKENS,
+    GENERATION_SMALL_MODEL,
+    GENERATION_WORKERS,
+)
+from app.core.logging_config import logger
+from app.models.model_backends import load_generation_pipeline
+from app.services.inference_executor import InferenceExecutor
+
+# Pipelines used by this process, by model name; worker processes load their own
+_pipelines = {}
+_pipeline_lock = threading.Lock()
+
+
+def get_qa_pipeline(model_name=GENERATION_MODEL):
+    """
+    Return the LLM pipeline of a generation model, loading it on first use.
+
+    Args:
+        model_name (str, optional): The model, ``GENERATION_MODEL`` by default.
+
+    Returns:
+        transformers.Pipeline: The text2text-generation pipeline of this process,
+        run with the ``GENERATION_BACKEND`` inference backend.
+    """
+    qa = _pipelines.get(model_name)
+    if qa is None:
+        with _pipeline_lock:
+            qa = _pipelines.get(model_name)
+            if qa is None:
+                qa = load_generation_pipeline(model_name, GENERATION_BACKEND)
+                _pipelines[model_name] = qa
+    return qa
+
+
+def _load_pipeline():
+    """
+    Load the pipelines in a generation worker; returns nothing so it can run in
+    (and warm up) worker processes.
+    """
+    get_qa_pipeline()
+    if GENERATION_SMALL_MODEL:
+        get_qa_pipeline(GENERATION_SMALL_MODEL)
+
+
+def input_token_limit(tokenizer):
+    """
+    Return the number of prompt tokens a model accepts.
+
+    Tokenizers without a limit report a huge ``model_max_length``, so the limit
+    is capped at ``GENERATION_MAX_INPUT_TOKENS``.
+    """
+    return min(tokenizer.model_max_length, GENERATION_MAX_INPUT_TOKENS)
+
+
+def route_prompt(prompt):
+    """
+    Choose the model that answers a prompt.
+
+    Prompts of at most ``GENERATION_ROUTE_MAX_TOKENS`` tokens go to
+    ``GENERATION_SMALL_MODEL`` when one is configured, all others to
+    ``GENERATION_MODEL``.
+
+    Returns:
+        str: The name of the model to use.
+    """
+    if not GENERATION_SMALL_MODEL:
+        return GENERATION_MODEL
+    tokenizer = get_qa_pipeline(GENERATION_SMALL_MODEL).tokenizer
+    if len(tokenizer(prompt)["input_ids"]) <= GENERATION_ROUTE_MAX_TOKENS:
+        return GENERATION_SMALL_MODEL
+    return GENERATION_MODEL
+
+
+def decoding_kwargs(max_new_tokens=None, max_time=None):
+    """
+    Build the ``generate`` arguments for the configured decoding strategy and a
+    request's budget.
+
+    Args:
+        max_new_tokens (int, optional): Maximum answer length in tokens.
+            Defaults to ``GENERATION_MAX_NEW_TOKENS``.
+        max_time (float, optional): Seconds after which generation stops and
+            returns what it has. Defaults to ``GENERATION_MAX_TIME`` (0 for none).
+
+    Returns:
+        dict: Keyword arguments for ``model.generate``.
+    """
+    kwargs = {
+        "max_new_tokens": max_new_tokens or GENERATION_MAX_NEW_TOKENS,
+        # 1 beam is greedy decoding
+        "num_beams": GENERATION_NUM_BEAMS,
+        "do_sample": False,
+    }
+    if GENERATION_NUM_BEAMS > 1:
+        kwargs["early_stopping"] = GENERATION_EARLY_STOPPING
+    max_time = max_time or GENERATION_MAX_TIME
+    if max_time:
+        kwargs["max_time"] = max_time
+    return kwargs
+
+
+def _encode(qa, prompts):
+    """
+    Tokenize prompts for ``model.generate``, truncated to the model's input limit
+    and padded to the longest prompt.
+    """
+    inputs = qa.tokenizer(
+        prompts,
+        return_tensors="pt",
+        padding=True,
+        truncation=True,
+        max_length=input_token_limit(qa.tokenizer),
+    )
+    return {name: tensor.to(qa.model.device) for name, tensor in inputs.items()}
+
+
+def _generate(qa, prompts, max_new_tokens=None, max_time=None):
+    """
+    Generate answers for a batch of prompts with one model.
+    """
+    output_ids = qa.model.generate(
+        **_encode(qa, prompts), **decoding_kwargs(max_new_tokens, max_time)
+    )
+    return [
+        answer.strip()
+        for answer in qa.tokenizer.batch_decode(output_ids, skip_special_tokens=True)
+    ]
+
+
+def generate_answer(prompt, max_new_tokens=None, max_time=None):
+    """
+    Generate an answer for the prompt with the LLM.
+
+    The prompt is truncated to the model's input limit and answered by the
+    model chosen by route_prompt. This call blocks for the whole generation and
+    must not run on the event loop; use generate_answer_async from request
+    handlers.
+
+    Args:
+        prompt (str): The full prompt, including the retrieved context.
+        max_new_tokens (int, optional): Maximum length of the answer in tokens.
+        max_time (float, optional): Generation time budget in seconds.
+
+    Returns:
+        str: The generated answer, stripped of surrounding whitespace.
+    """
+    model_name = route_prompt(prompt)
+    answer = _generate(get_qa_pipeline(model_name), [prompt], max_new_tokens, max_time)[0]
+    logger.info(f"Response from {model_name}: {answer}")
+    return answer
+
+
+def generate_answers(prompts, max_new_tokens=None, max_time=None):
+    """
+    Generate answers for several prompts in batches.
+
+    Prompts are routed to their model, sorted by token length and cut into
+    batches of ``GENERATION_BATCH_SIZE``, so each batch holds prompts of similar
+    length and little compute is spent on padding. If a batch fails, its
+    prompts are retried one by one so a single bad prompt only fails its own
+    answer. ``max_time`` applies to each batch.
+
+    Args:
+        prompts (list[str]): The full prompts, including the retrieved context.
+        max_new_tokens (int, optional): Maximum length of each answer in tokens.
+        max_time (float, optional): Generation time budget per batch in seconds.
+
+    Returns:
+        list[str or None]: The answers in the order of ``prompts``; None where
+        generation failed.
+    """
+    by_model = {}
+    for position, prompt in enumerate(prompts):
+        by_model.setdefault(route_prompt(prompt), []).append(position)
+
+    answers = [None] * len(prompts)
+    for model_name, positions in by_model.items():
+        qa = get_qa_pipeline(model_name)
+        lengths = qa.tokenizer(
+            [prompts[position] for position in positions],
+            truncation=True,
+            max_length=input_token_limit(qa.tokenizer),
+        )["input_ids"]
+        order = [
+            position
+            for _, position in sorted(zip(map(len, lengths), positions), key=lambda p: p[0])
+        ]
+        for start in range(0, len(order), GENERATION_BATCH_SIZE):
+            bucket = order[start : start + GENERATION_BATCH_SIZE]
+            try:
+                outputs = _generate(
+                    qa, [prompts[position] for position in bucket], max_new_tokens, max_time
+                )
+                for position, answer in zip(bucket, outputs):
+                    answers[position] = answer
+            except Exception as e:
+                logger.error(f"Batched generation failed, retrying one by one: {e}")
+                for position in bucket:
+                    try:
+                        answers[position] = _generate(
+                            qa, [prompts[position]], max_new_tokens, max_time
+                        )[0]
+                    except Exception as item_error:
+                        logger.error(f"Error generating answer: {item_error}")
+    logger.info(f"Generated {len(prompts)} answers in batches of {GENERATION_BATCH_SIZE}.")
+    return answers
+
+
+def generate_answer_streaming(prompt, max_new_tokens, max_time, on_text, cancelled):
+    """
+    Generate an answer, passing each decoded piece of text to ``on_text`` as
+    soon as the model produces it.
+
+    Generation stops early once ``cancelled`` is set, freeing the worker for
+    other requests.
+
+    Args:
+        prompt (str): The full prompt, including the retrieved context.
+        max_new_tokens (int): Maximum length of the answer in tokens.
+        max_time (float): Generation time budget in seconds.
+        on_text (callable): Called with each new piece of the answer.
+        cancelled (threading.Event): Set when the client is gone.
+    """
+    import torch
+    from transformers import StoppingCriteria, StoppingCriteriaList, TextStreamer
+
+    class _CallbackStreamer(TextStreamer):
+        def on_finalized_text(self, text, stream_end=False):
+            if text:
+                on_text(text)
+
+    class _StopWhenCancelled(StoppingCriteria):
+        def __call__(self, input_ids, scores, **kwargs):
+            return torch.full(
+                (input_ids.shape[0],),
+                cancelled.is_set(),
+                dtype=torch.bool,
+                device=input_ids.device,
+            )
+
+    qa = get_qa_pipeline(route_prompt(prompt))
+    qa.model.generate(
+        **_encode(qa, [prompt]),
+        **decoding_kwargs(max_new_tokens, max_time),
+        streamer=_CallbackStreamer(qa.tokenizer, skip_prompt=True, skip_special_tokens=True),
+        stopping_criteria=StoppingCriteriaList([_StopWhenCancelled()]),
+    )
+
+
+# Bounded pool that keeps generation off the event loop
+generation_executor = InferenceExecutor(
+    GENERATION_EXECUTOR,
+    max_workers=GENERATION_WORKERS,
+    max_pending=GENERATION_MAX_PENDING,
+    name="generation",
+    initializer=_load_pipeline if GENERATION_EXECUTOR == "process" else None,
+)
+
+
+def warm_up_generation():
+    """
+    Load the generation models in the generation pool before the first request.
+
+    In thread mode this loads the model shared by this process's workers; in
+    process mode it starts a worker process, which loads its own copy.
+    """
+    generation_executor.submit(_load_pipeline).result()
+
+
+async def generate_answer_async(prompt, max_new_tokens=None, max_time=None):
+    """
+    Generate an answer on the generation executor without blocking the event loop.
+
+    Raises:
+        InferenceOverloadedError: If the generation queue is full.
+    """
+    return await generation_executor.run(generate_answer, prompt, max_new_tokens, max_time)
+
+
+async def generate_answers_async(prompts, max_new_tokens=None, max_time=None):
+    """
+    Generate answers for several prompts on the generation executor, as one job.
+
+    Raises:
+        InferenceOverloadedError: If the generation queue is full.
+    """
+    return await generation_executor.run(generate_answers, prompts, max_new_tokens, max_time)
+
+
+class AnswerStream:
+    """
+    An answer being generated on the generation executor, iterated asynchronously
+    piece by piece.
+
+    A slot on the generation executor is reserved when the stream is created,
+    so a full queue is reported before any response is sent, but generation
+    only starts once iteration does. A client that disconnects before the
+    response starts streaming therefore costs no generation, and its slot is
+    given back when the stream is closed or garbage collected. Leaving the
+    iteration early (e.g. because the client disconnected) stops the
+    generation.
+
+    In process executor mode the model cannot call back into this process, so
+    the whole answer arrives as a single piece.
+    """
+
+    _END = object()
+
+    def __init__(self, prompt, max_new_tokens=None, max_time=None):
+        """
+        Reserve a slot for the generation.
+
+        Raises:
+            InferenceOverloadedError: If the generation queue is full.
+        """
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._args = (prompt, max_new_tokens, max_time)
+        self.cancelled = threading.Event()
+        self._future = None
+        generation_executor.reserve()
+        # Gives the slot back if the stream is dropped without being started
+        self._reservation = weakref.finalize(self, generation_executor.cancel_reservation)
+
+    def _start(self):
+        """
+        Schedule the generation on the reserved slot.
+        """
+        self._reservation.detach()
+        if GENERATION_EXECUTOR == "process":
+            self._future = generation_executor.submit_reserved(generate_answer, *self._args)
+        else:
+            self._future = generation_executor.submit_reserved(
+                generate_answer_streaming, *self._args, self._push, self.cancelled
+            )
+        self._future.add_done_callback(self._finish)
+
+    def close(self):
+        """
+        Stop the generation, or give back its slot if it has not started.
+        """
+        self.cancelled.set()
+        self._reservation()
+        if self._future is not None:
+            self._future.cancel()
+
+    def _push(self, item):
+        """
+        Hand an item to the event loop; called from the generation worker.
+        """
+        try:
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, item)
+        except RuntimeError:
+            # The event loop is gone; nobody is listening anymore.
+            self.cancelled.set()
+
+    def _finish(self, future):
+        """
+        Forward the final answer (process mode) and mark the end of the stream.
+        """
+        if GENERATION_EXECUTOR == "process" and not future.cancelled():
+            if future.exception() is None and future.result():
+                self._push(future.result())
+        self._push(self._END)
+
+    async def __aiter__(self):
+        """
+        Start the generation and yield pieces of the answer as they are generated.
+
+        Raises:
+            Exception: Any error raised by the generation.
+        """
+        try:
+            if self.cancelled.is_set():
+                return
+            self._start()
+            while True:
+                item = await self._queue.get()
+                if item is self._END:
+                    break
+                yield item
+            if not self._future.cancelled() and self._future.exception() is not None:
+                raise self._future.exception()
+        finally:
+            self.close()
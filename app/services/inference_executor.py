@@ -0,0 +1,166 @@
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from fastapi import HTTPException
+from app.core.config import INFERENCE_RETRY_AFTER
+from app.core.logging_config import logger
+
+
+class InferenceOverloadedError(HTTPException):
+    """
+    Raised when an inference queue is full.
+
+    It is an HTTPException, so handlers that re-raise HTTPExceptions turn it
+    into a 503 response with a Retry-After header.
+    """
+
+    def __init__(self, retry_after=INFERENCE_RETRY_AFTER):
+        super().__init__(
+            status_code=503,
+            detail="Server is busy, please retry later.",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+
+class InferenceExecutor:
+    """
+    A bounded worker pool that runs blocking model inference off the event loop.
+
+    At most ``max_workers`` calls run at once and at most ``max_pending`` more
+    may wait. Further submissions are rejected immediately with
+    InferenceOverloadedError instead of queuing without bound.
+
+    Attributes:
+        kind (str): ``thread`` or ``process``.
+        max_workers (int): Number of concurrent inference calls.
+        max_pending (int): Number of calls allowed to wait for a worker.
+    """
+
+    def __init__(self, kind, max_workers, max_pending, name, initializer=None):
+        """
+        Initialize the executor. The pool itself is created on first use.
+
+        Args:
+            kind (str): ``thread`` for a thread pool, ``process`` for a process pool.
+            max_workers (int): Number of workers.
+            max_pending (int): Number of queued calls accepted beyond the workers.
+            name (str): Name used for worker threads and logs.
+            initializer (callable, optional): Run once in each worker process,
+                e.g. to load a model there.
+        """
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unsupported executor kind '{kind}'.")
+        self.kind = kind
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.name = name
+        self.initializer = initializer
+        self._slots = threading.BoundedSemaphore(max_workers + max_pending)
+        self._in_flight = 0
+        self._counter_lock = threading.Lock()
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def _get_pool(self):
+        """
+        Create the worker pool on first use.
+        """
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    if self.kind == "process":
+                        # Spawned workers avoid inheriting torch state through fork.
+                        self._pool = ProcessPoolExecutor(
+                            max_workers=self.max_workers,
+                            mp_context=multiprocessing.get_context("spawn"),
+                            initializer=self.initializer,
+                        )
+                    else:
+                        self._pool = ThreadPoolExecutor(
+                            max_workers=self.max_workers, thread_name_prefix=self.name
+                        )
+                    logger.info(
+                        f"Started {self.name} {self.kind} pool with {self.max_workers} worker(s)."
+                    )
+        return self._pool
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Schedule ``fn(*args, **kwargs)`` on the pool.
+
+        Returns:
+            concurrent.futures.Future: The pending result.
+
+        Raises:
+            InferenceOverloadedError: If all workers and queue slots are taken.
+        """
+        self.reserve()
+        return self.submit_reserved(fn, *args, **kwargs)
+
+    def reserve(self):
+        """
+        Take a worker or queue slot for a call that is submitted later with
+        ``submit_reserved``, or given back with ``cancel_reservation``.
+
+        Raises:
+            InferenceOverloadedError: If all workers and queue slots are taken.
+        """
+        if not self._slots.acquire(blocking=False):
+            logger.warning(f"{self.name} executor saturated; rejecting request.")
+            raise InferenceOverloadedError()
+
+    def cancel_reservation(self):
+        """
+        Give back a slot taken with ``reserve`` that will not be used.
+        """
+        self._slots.release()
+
+    def submit_reserved(self, fn, *args, **kwargs):
+        """
+        Schedule ``fn(*args, **kwargs)`` on the pool using a slot taken with
+        ``reserve``.
+
+        Returns:
+            concurrent.futures.Future: The pending result.
+        """
+        try:
+            future = self._get_pool().submit(fn, *args, **kwargs)
+        except Exception:
+            self._slots.release()
+            raise
+        with self._counter_lock:
+            self._in_flight += 1
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, _future):
+        """
+        Free the slot held by a finished call.
+        """
+        with self._counter_lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    async def run(self, fn, *args, **kwargs):
+        """
+        Run ``fn(*args, **kwargs)`` on the pool and await its result.
+
+        Raises:
+            InferenceOverloadedError: If all workers and queue slots are taken.
+        """
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def stats(self):
+        """
+        Report pool capacity and current load.
+
+        Returns:
+            dict: Executor kind, worker and queue limits, and calls in flight.
+        """
+        return {
+            "kind": self.kind,
+            "max_workers": self.max_workers,
+            "max_pending": self.max_pending,
+            "in_flight": self._in_flight,
+        }
@@ -0,0 +1,417 @@
+import os
+import queue
+import shutil
+import threading
+import uuid
+from sqlalchemy import insert, update
+from app.core.config import (
+    INDEX_ROLE,
+    INGEST_BATCH_SIZE,
+    INGEST_QUEUE_DEPTH,
+    INGEST_SPOOL_DIR,
+)
+from app.core.logging_config import logger
+from app.models.db_models import SessionLocal, IngestionJob, IngestionJobItem
+from app.models.embedding_store_instance import embedding_store
+from app.models.lexical_index_instance import lexical_index
+from app.services.archive_reader import iter_documents
+from app.services.cache import invalidate
+from app.services.chunking_service import chunk_text
+from app.services.embedding_service import generate_embeddings
+from app.services.ingestion_service import (
+    content_hash,
+    new_documents,
+    store_documents,
+)
+
+# Marks the end of a stage's output
+_END = object()
+
+# Job states that still have work to do
+PENDING_STATUSES = ("queued", "running")
+
+
+class _StageFailed(Exception):
+    """
+    Raised in a pipeline stage when another stage has already failed.
+    """
+
+
+class IngestionWorker:
+    """
+    Runs bulk ingestion jobs in the background as a pipeline of stages.
+
+    Each job is processed by four stages connected by bounded queues, so they
+    run concurrently without buffering more than ``queue_depth`` batches:
+
+    - decode: stream documents out of the spooled uploads and group them into
+      batches, skipping documents already committed by an earlier run;
+    - chunk: split each document into chunks, skipping documents whose
+      content is already stored;
+    - embed: embed all chunks of a batch through the micro-batching engine;
+    - index: store documents, chunks, per-document results and the job's new
+      committed offset in one transaction, then add the chunks to the index.
+
+    Jobs left queued or running by a crash are resumed when the worker starts.
+    Reader processes (``INDEX_ROLE=reader``) only record jobs; the index writer
+    process runs them, picking up new ones with ``enqueue_pending``.
+    """
+
+    def __init__(self, batch_size=INGEST_BATCH_SIZE, queue_depth=INGEST_QUEUE_DEPTH):
+        """
+        Initialize the worker. Its thread starts on ``start`` or the first job.
+
+        Args:
+            batch_size (int, optional): Documents per batch. Defaults to INGEST_BATCH_SIZE.
+            queue_depth (int, optional): Batches buffered between stages.
+                Defaults to INGEST_QUEUE_DEPTH.
+        """
+        self.batch_size = batch_size
+        self.queue_depth = queue_depth
+        self._jobs = queue.Queue()
+        self._enqueued = set()
+        self._enqueued_lock = threading.Lock()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        """
+        Start the worker thread and resume unfinished jobs.
+        """
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(
+                target=self._run, name="ingestion-worker", daemon=True
+            )
+            self._thread.start()
+        self.enqueue_pending()
+
+    def enqueue_pending(self):
+        """
+        Queue the jobs recorded in the database that still have work to do and
+        are not queued in this worker yet.
+        """
+        db = SessionLocal()
+        try:
+            pending = (
+                db.query(IngestionJob.id)
+                .filter(IngestionJob.status.in_(PENDING_STATUSES))
+                .order_by(IngestionJob.created_at)
+                .all()
+            )
+        finally:
+            db.close()
+        for row in pending:
+            if self._enqueue(row.id):
+                logger.info(f"Picked up ingestion job {row.id}.")
+
+    def _enqueue(self, job_id):
+        """
+        Queue a job unless it is already queued or running. Returns True if queued.
+        """
+        with self._enqueued_lock:
+            if job_id in self._enqueued:
+                return False
+            self._enqueued.add(job_id)
+        self._jobs.put(job_id)
+        return True
+
+    def submit(self, files):
+        """
+        Spool uploaded files to disk and queue a job to ingest them.
+
+        Args:
+            files (list[UploadFile]): The uploaded files.
+
+        Returns:
+            str: The ID of the new job.
+        """
+        job_id = uuid.uuid4().hex
+        source_path = os.path.join(INGEST_SPOOL_DIR, job_id)
+        os.makedirs(source_path, exist_ok=True)
+        for number, upload in enumerate(files):
+            # The prefix keeps the upload order and avoids name clashes.
+            name = f"{number:05d}_{os.path.basename(upload.filename)}"
+            with open(os.path.join(source_path, name), "wb") as spooled:
+                shutil.copyfileobj(upload.file, spooled)
+
+        db = SessionLocal()
+        try:
+            db.add(IngestionJob(id=job_id, status="queued", source_path=source_path))
+            db.commit()
+        finally:
+            db.close()
+
+        # In reader processes the index writer process picks the job up.
+        if INDEX_ROLE != "reader":
+            if self._thread is None:
+                self.start()
+            else:
+                self._enqueue(job_id)
+        logger.info(f"Queued ingestion job {job_id} for {len(files)} file(s).")
+        return job_id
+
+    def _run(self):
+        """
+        Worker loop: process queued jobs one after another.
+        """
+        while True:
+            job_id = self._jobs.get()
+            try:
+                self._process(job_id)
+            except Exception as e:
+                logger.error(f"Ingestion job {job_id} failed: {e}")
+                self._set_status(job_id, "failed", error=str(e))
+            finally:
+                with self._enqueued_lock:
+                    self._enqueued.discard(job_id)
+
+    def _process(self, job_id):
+        """
+        Run one job through the decode, chunk, embed and index stages.
+        """
+        db = SessionLocal()
+        try:
+            job = db.get(IngestionJob, job_id)
+            if job is None or job.status not in PENDING_STATUSES:
+                return
+            source_path, offset = job.source_path, job.committed_offset
+        finally:
+            db.close()
+
+        self._set_status(job_id, "running")
+        logger.info(f"Running ingestion job {job_id} from document {offset}.")
+
+        failed = threading.Event()
+        errors = []
+        decoded = queue.Queue(maxsize=self.queue_depth)
+        chunked = queue.Queue(maxsize=self.queue_depth)
+        embedded = queue.Queue(maxsize=self.queue_depth)
+        stages = [
+            threading.Thread(
+                target=self._stage,
+                args=(
+                    lambda _: self._decode(source_path, offset, decoded, failed),
+                    None,
+                    None,
+                    failed,
+                    errors,
+                ),
+                name=f"ingest-decode-{job_id[:8]}",
+            ),
+            threading.Thread(
+                target=self._stage,
+                args=(self._chunk, decoded, chunked, failed, errors),
+                name=f"ingest-chunk-{job_id[:8]}",
+            ),
+            threading.Thread(
+                target=self._stage,
+                args=(self._embed, chunked, embedded, failed, errors),
+                name=f"ingest-embed-{job_id[:8]}",
+            ),
+        ]
+        for stage in stages:
+            stage.start()
+
+        # The index stage runs on the worker thread itself.
+        self._stage(lambda batch: self._index(job_id, batch), embedded, None, failed, errors)
+        for stage in stages:
+            stage.join()
+
+        if errors:
+            raise errors[0]
+
+        self._set_status(job_id, "completed")
+        shutil.rmtree(source_path, ignore_errors=True)
+        logger.info(f"Ingestion job {job_id} completed.")
+
+    def _stage(self, work, inbox, outbox, failed, errors):
+        """
+        Apply ``work`` to every batch of ``inbox`` and pass results to ``outbox``.
+
+        The decode stage has no inbox; it produces its own batches. On failure the
+        shared ``failed`` event stops the other stages.
+        """
+        try:
+            if inbox is None:
+                work(None)
+            else:
+                while True:
+                    batch = self._get(inbox, failed)
+                    if batch is _END:
+                        break
+                    result = work(batch)
+                    if outbox is not None:
+                        self._put(outbox, result, failed)
+        except _StageFailed:
+            pass
+        except Exception as e:
+            errors.append(e)
+            failed.set()
+        finally:
+            if outbox is not None:
+                try:
+                    self._put(outbox, _END, failed)
+                except _StageFailed:
+                    pass
+
+    @staticmethod
+    def _put(outbox, item, failed):
+        """
+        Put an item on a bounded queue, giving up if another stage has failed.
+        """
+        while True:
+            if failed.is_set():
+                raise _StageFailed()
+            try:
+                outbox.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    @staticmethod
+    def _get(inbox, failed):
+        """
+        Take an item from a queue, giving up if another stage has failed.
+        """
+        while True:
+            if failed.is_set():
+                raise _StageFailed()
+            try:
+                return inbox.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+    def _decode(self, source_path, offset, outbox, failed):
+        """
+        Stream documents from the spooled files into batches of ``batch_size``.
+
+        Each entry is ``(position, name, text, error)``; rejected documents are
+        kept so their results are recorded in order with the rest of the batch.
+        """
+        batch = []
+        position = 0
+        for filename in sorted(os.listdir(source_path)):
+            original_name = filename.split("_", 1)[1]
+            with open(os.path.join(source_path, filename), "rb") as fileobj:
+                for name, text, error in iter_documents(original_name, fileobj):
+                    if position >= offset:
+                        batch.append((position, name, text, error))
+                        if len(batch) >= self.batch_size:
+                            self._put(outbox, {"entries": batch}, failed)
+                            batch = []
+                    position += 1
+        if batch:
+            self._put(outbox, {"entries": batch}, failed)
+        self._put(outbox, _END, failed)
+
+    @staticmethod
+    def _chunk(batch):
+        """
+        Split every accepted document of the batch into chunks, except those
+        whose content is already stored, which need no embedding.
+        """
+        entries = batch["entries"]
+        accepted = [i for i, (_, _, text, _) in enumerate(entries) if text]
+        batch["hashes"] = {i: content_hash(entries[i][2]) for i in accepted}
+        db = SessionLocal()
+        try:
+            new = new_documents(db, [batch["hashes"][i] for i in accepted])
+        finally:
+            db.close()
+        new = {accepted[position] for position in new}
+        batch["chunks"] = [
+            chunk_text(text) if i in new else [] for i, (_, _, text, _) in enumerate(entries)
+        ]
+        return batch
+
+    @staticmethod
+    def _embed(batch):
+        """
+        Embed all chunks of the batch together.
+        """
+        texts = [chunk for chunks in batch["chunks"] for chunk in chunks]
+        embeddings = generate_embeddings(texts) if texts else []
+        if embeddings is None:
+            raise RuntimeError("Error generating embeddings.")
+        batch["embeddings"] = embeddings
+        return batch
+
+    def _index(self, job_id, batch):
+        """
+        Commit a batch together with its results and the job's new offset, then
+        add its new chunks to the FAISS and BM25 indexes. Documents already
+        stored are recorded with the existing document's ID.
+        """
+        entries = batch["entries"]
+        accepted = [i for i, (_, _, text, _) in enumerate(entries) if text]
+
+        db = SessionLocal()
+        try:
+            result = store_documents(
+                db,
+                [entries[i][2] for i in accepted],
+                [batch["chunks"][i] for i in accepted],
+                batch["embeddings"],
+                [batch["hashes"][i] for i in accepted],
+            )
+            stored = dict(zip(accepted, result.document_ids))
+            db.execute(
+                insert(IngestionJobItem),
+                [
+                    {
+                        "job_id": job_id,
+                        "position": position,
+                        "filename": name,
+                        "status": "error" if error else "ok",
+                        "document_id": stored.get(i),
+                        "detail": error,
+                    }
+                    for i, (position, name, _, error) in enumerate(entries)
+                ],
+            )
+            db.execute(
+                update(IngestionJob)
+                .where(IngestionJob.id == job_id)
+                .values(
+                    committed_offset=entries[-1][0] + 1,
+                    succeeded=IngestionJob.succeeded + len(accepted),
+                    failed=IngestionJob.failed + len(entries) - len(accepted),
+                )
+            )
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        if result.chunk_ids:
+            embedding_store.add_embeddings(result.chunk_ids, result.embeddings)
+            lexical_index.add_texts(result.chunk_ids, result.chunk_texts)
+            invalidate("documents uploaded")
+        logger.info(
+            f"Ingestion job {job_id} committed {len(entries)} document(s) "
+            f"up to position {entries[-1][0]}."
+        )
+
+    @staticmethod
+    def _set_status(job_id, status, error=None):
+        """
+        Update a job's status.
+        """
+        db = SessionLocal()
+        try:
+            db.execute(
+                update(IngestionJob)
+                .where(IngestionJob.id == job_id)
+                .values(status=status, error=error)
+            )
+            db.commit()
+        finally:
+            db.close()
+
+
+# Global worker that processes bulk ingestion jobs
+ingestion_worker = IngestionWorker()
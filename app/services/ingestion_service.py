@@ -0,0 +1,260 @@
+import hashlib
+import unicodedata
+from typing import NamedTuple
+import numpy as np
+from sqlalchemy import insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from app.models.db_models import Document, Chunk, SessionLocal
+from app.models.embedding_store_instance import embedding_store
+from app.models.lexical_index_instance import lexical_index
+from app.services.cache import invalidate
+from app.services.chunking_service import chunk_text
+from app.services.embedding_service import generate_embeddings
+from app.core.logging_config import logger
+
+# INSERT constructs supporting ON CONFLICT DO NOTHING, by database backend
+CONFLICT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def ingest_document(document_text):
+    """
+    Split a document into chunks, embed them in batches, store and index them.
+
+    Meant to run in a worker thread: embedding and indexing are CPU-bound, so
+    the document is stored with its own synchronous session.
+
+    Args:
+        document_text (str): The non-empty document text.
+
+    Returns:
+        int or None: The ID of the stored document (the existing one if the same
+        content was uploaded before), or None if embedding failed.
+    """
+    db = SessionLocal()
+    try:
+        document_ids = ingest_documents(db, [document_text])
+    finally:
+        db.close()
+    return document_ids[0] if document_ids else None
+
+
+class StoredDocuments(NamedTuple):
+    """
+    Result of store_documents.
+
+    Attributes:
+        document_ids (list[int]): ID of each input document, existing or new.
+        chunk_ids (list[int]): IDs of the inserted chunks.
+        chunk_texts (list[str]): Texts of the inserted chunks.
+        embeddings (np.ndarray): Embeddings of the inserted chunks.
+    """
+
+    document_ids: list
+    chunk_ids: list
+    chunk_texts: list
+    embeddings: np.ndarray
+
+
+def content_hash(text):
+    """
+    Return the SHA-256 hex digest of a document's normalized text.
+
+    Text is Unicode NFC-normalized and its whitespace collapsed, so copies of a
+    document that only differ in line endings or spacing hash the same.
+    """
+    normalized = " ".join(unicodedata.normalize("NFC", text).split())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def find_documents(db, hashes):
+    """
+    Look up stored documents by content hash.
+
+    Args:
+        db (Session): The database session.
+        hashes (Iterable[str]): Content hashes.
+
+    Returns:
+        dict: Content hash -> document ID, for the hashes already stored.
+    """
+    hashes = set(hashes)
+    if not hashes:
+        return {}
+    rows = db.execute(
+        select(Document.content_hash, Document.id).where(
+            Document.content_hash.in_(hashes)
+        )
+    )
+    return {row.content_hash: row.id for row in rows}
+
+
+def new_documents(db, hashes):
+    """
+    Return the positions of the documents that need embedding: those whose
+    content is neither stored yet nor repeated earlier in ``hashes``.
+    """
+    seen = set(find_documents(db, hashes))
+    positions = []
+    for position, digest in enumerate(hashes):
+        if digest not in seen:
+            seen.add(digest)
+            positions.append(position)
+    return positions
+
+
+def ingest_documents(db, document_texts):
+    """
+    Chunk, embed, store and index a batch of documents.
+
+    Documents whose content is already stored are not embedded again: their
+    existing IDs are returned. The other chunks of the batch are embedded
+    together, documents and chunks are written with one bulk insert each, and
+    the FAISS and BM25 indexes are updated once.
+
+    Args:
+        db (Session): The database session used to store the documents.
+        document_texts (list[str]): Non-empty document texts.
+
+    Returns:
+        list[int] or None: IDs of the documents in input order, or None if
+        embedding failed.
+    """
+    hashes = [content_hash(text) for text in document_texts]
+    new = set(new_documents(db, hashes))
+    chunked = [
+        chunk_text(text) if position in new else []
+        for position, text in enumerate(document_texts)
+    ]
+    texts = [chunk for document_chunks in chunked for chunk in document_chunks]
+    embeddings = generate_embeddings(texts) if texts else np.empty((0, 0), np.float32)
+    if embeddings is None:
+        return None
+    if len(new) < len(document_texts):
+        logger.info(
+            f"Skipped embedding {len(document_texts) - len(new)} already stored document(s)."
+        )
+
+    try:
+        stored = store_documents(db, document_texts, chunked, embeddings, hashes)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    if stored.chunk_ids:
+        embedding_store.add_embeddings(stored.chunk_ids, stored.embeddings)
+        lexical_index.add_texts(stored.chunk_ids, stored.chunk_texts)
+        invalidate("documents uploaded")
+    return stored.document_ids
+
+
+def insert_documents(db, texts, hashes):
+    """
+    Insert documents, skipping those whose content hash is stored already.
+
+    On PostgreSQL and SQLite the insert ends with ``ON CONFLICT (content_hash)
+    DO NOTHING``: when a concurrent upload of the same content commits first,
+    the conflicting row is skipped instead of failing the whole transaction.
+
+    Args:
+        db (Session): The database session.
+        texts (list[str]): Document texts.
+        hashes (list[str]): Their distinct content hashes.
+
+    Returns:
+        dict: Content hash -> new document ID, for the inserted documents.
+    """
+    backend = db.get_bind().dialect.name
+    if backend in CONFLICT_INSERTS:
+        statement = CONFLICT_INSERTS[backend](Document).on_conflict_do_nothing(
+            index_elements=[Document.content_hash]
+        )
+    else:
+        statement = insert(Document)
+    rows = db.execute(
+        statement.returning(Document.content_hash, Document.id),
+        [{"text": text, "content_hash": digest} for text, digest in zip(texts, hashes)],
+    )
+    return {row.content_hash: row.id for row in rows}
+
+
+def store_documents(db, document_texts, chunked, embeddings, hashes):
+    """
+    Bulk insert new documents and their chunks without committing.
+
+    Documents whose content hash is already stored, or repeated earlier in the
+    batch, are not inserted; they resolve to the existing document's ID. The
+    lookup happens here, right before the insert, so documents stored since
+    the caller chose what to embed are not inserted twice, and documents a
+    concurrent transaction stores between the lookup and the insert are
+    skipped by the insert itself (see insert_documents). The caller commits
+    (possibly together with other changes) and then adds the inserted chunks to
+    the FAISS and BM25 indexes.
+
+    Args:
+        db (Session): The database session used to store the documents.
+        document_texts (list[str]): Document texts.
+        chunked (list[list[str]]): The chunks of each document (may be empty
+            for documents known to be stored already).
+        embeddings (np.ndarray): One embedding per chunk, in document order.
+        hashes (list[str]): The content hash of each document.
+
+    Returns:
+        StoredDocuments: IDs of all documents and the inserted chunks.
+    """
+    known = find_documents(db, hashes)
+    new_texts, new_hashes = [], []
+    for text, digest in zip(document_texts, hashes):
+        if digest not in known:
+            known[digest] = None  # resolved to the new ID after the insert
+            new_texts.append(text)
+            new_hashes.append(digest)
+
+    inserted = {}
+    if new_texts:
+        inserted = insert_documents(db, new_texts, new_hashes)
+        known.update(inserted)
+        if len(inserted) < len(new_hashes):
+            # A concurrent upload stored the same content since the lookup.
+            known.update(
+                find_documents(db, [digest for digest in new_hashes if digest not in inserted])
+            )
+    stored_count = len(inserted)
+
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    chunk_rows, chunk_texts, keep = [], [], []
+    start = 0
+    for digest, document_chunks in zip(hashes, chunked):
+        end = start + len(document_chunks)
+        document_id = inserted.pop(digest, None)
+        if document_id is not None:
+            keep.extend(range(start, end))
+            for position, text in enumerate(document_chunks):
+                chunk_rows.append(
+                    {
+                        "document_id": document_id,
+                        "position": position,
+                        "text": text,
+                        "embedding": vectors[start + position].tobytes(),
+                    }
+                )
+                chunk_texts.append(text)
+        start = end
+    vectors = vectors[keep] if keep else np.empty((0, vectors.shape[-1]), np.float32)
+
+    chunk_ids = []
+    if chunk_rows:
+        chunk_ids = list(
+            db.scalars(
+                insert(Chunk).returning(Chunk.id, sort_by_parameter_order=True),
+                chunk_rows,
+            ).all()
+        )
+
+    logger.info(
+        f"Stored {stored_count} new document(s) with {len(chunk_ids)} chunk(s); "
+        f"{len(document_texts) - stored_count} already stored."
+    )
+    return StoredDocuments(
+        [known[digest] for digest in hashes], chunk_ids, chunk_texts, vectors
+    )
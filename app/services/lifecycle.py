@@ -0,0 +1,129 @@
+import threading
+import time
+from app.core.config import INDEX_ROLE, RERANK_ENABLED, RETRIEVAL_MODE, WARMUP_MODE
+from app.core.logging_config import logger
+
+
+class Startup:
+    """
+    Runs the application's startup steps and records how long each one took.
+
+    Steps run in order: database tables, the FAISS index, the BM25 index (in
+    hybrid retrieval mode), the bulk ingestion worker and, unless
+    ``WARMUP_MODE`` is ``lazy``, the embedding and generation models, the
+    tokenizer used to build prompts and (if enabled) the re-ranking model. In
+    ``background`` mode they run in a thread so the server accepts connections
+    right away and reports ready once they are done; in ``blocking`` mode the
+    server only starts listening afterwards.
+
+    Attributes:
+        status (str): ``starting``, ``ready`` or ``failed``.
+        timings (dict): Seconds taken by each completed step.
+        error (str): The failed step and its error, if any.
+    """
+
+    def __init__(self, mode=WARMUP_MODE):
+        if mode not in ("background", "blocking", "lazy"):
+            raise ValueError(
+                f"Unsupported warm-up mode '{mode}'. "
+                "Expected 'background', 'blocking' or 'lazy'."
+            )
+        self.mode = mode
+        self.status = "starting"
+        self.timings = {}
+        self.error = None
+        self._done = threading.Event()
+        self._thread = None
+
+    def record(self, component, seconds):
+        """
+        Record the time taken by a startup component.
+        """
+        self.timings[component] = round(seconds, 3)
+        logger.info(f"Startup: {component} took {seconds:.3f}s.")
+
+    def _steps(self):
+        """
+        Return the ``(component, callable)`` startup steps for this process.
+        """
+        from app.models.db_models import init_db
+        from app.models.embedding_store_instance import embedding_store
+        from app.models.lexical_index_instance import lexical_index
+        from app.services.context_builder import warm_up_tokenizer
+        from app.services.embedding_service import warm_up_embedding
+        from app.services.generation_service import warm_up_generation
+        from app.services.ingestion_pipeline import ingestion_worker
+        from app.services.reranking_service import warm_up_reranker
+
+        steps = [
+            ("database", init_db),
+            ("index", embedding_store.load_existing_embeddings),
+        ]
+        if RETRIEVAL_MODE == "hybrid":
+            steps.append(("lexical_index", lexical_index.load_existing))
+        # Reader workers leave bulk jobs to the index writer process.
+        if INDEX_ROLE != "reader":
+            steps.append(("ingestion_worker", ingestion_worker.start))
+        if self.mode != "lazy":
+            steps.append(("embedding_model", warm_up_embedding))
+            steps.append(("generation_model", warm_up_generation))
+            steps.append(("tokenizer", warm_up_tokenizer))
+            if RERANK_ENABLED:
+                steps.append(("reranking_model", warm_up_reranker))
+        return steps
+
+    def run(self):
+        """
+        Run every startup step, stopping at the first failure.
+        """
+        started = time.perf_counter()
+        try:
+            for component, step in self._steps():
+                step_started = time.perf_counter()
+                try:
+                    step()
+                except Exception as e:
+                    self.error = f"{component}: {e}"
+                    self.status = "failed"
+                    logger.error(f"Startup step {component} failed: {e}")
+                    return
+                self.record(component, time.perf_counter() - step_started)
+            self.status = "ready"
+            self.record("total", time.perf_counter() - started)
+        finally:
+            self._done.set()
+
+    def start(self):
+        """
+        Run the startup steps in the background or inline, depending on the mode.
+        """
+        if self.mode == "blocking":
+            self.run()
+            return
+        self._thread = threading.Thread(target=self.run, name="startup", daemon=True)
+        self._thread.start()
+
+    def wait(self, timeout=None):
+        """
+        Block until startup has finished.
+
+        Returns:
+            bool: True if the application is ready.
+        """
+        self._done.wait(timeout)
+        return self.status == "ready"
+
+    def report(self):
+        """
+        Return the startup status, per-component timings and error, if any.
+        """
+        return {
+            "status": self.status,
+            "mode": self.mode,
+            "timings": dict(self.timings),
+            "error": self.error,
+        }
+
+
+# Startup state of this process
+startup = Startup()
@@ -0,0 +1,146 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from app.core.logging_config import logger
+
+
+class MicroBatcher:
+    """
+    Groups concurrent single-item requests into batches for one worker thread.
+
+    Callers submit items and receive a future. The worker takes the first
+    waiting item, keeps collecting until the batch is full or ``max_wait_ms``
+    has passed, runs ``process_batch`` once on the whole batch and resolves
+    each caller's future with its own result.
+
+    Attributes:
+        max_batch_size (int): Maximum number of items processed together.
+        max_wait_ms (float): Longest time the first item waits for others to join.
+    """
+
+    def __init__(self, process_batch, max_batch_size, max_wait_ms, max_queue_size, name):
+        """
+        Initialize the batcher. The worker thread starts on the first submission.
+
+        Args:
+            process_batch (callable): Maps a list of items to a same-length sequence
+                of results.
+            max_batch_size (int): Maximum number of items per batch.
+            max_wait_ms (float): Maximum time to wait for a batch to fill up.
+            max_queue_size (int): Maximum number of items waiting to be processed.
+            name (str): Name of the worker thread, used in logs.
+        """
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.name = name
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, item, block=True):
+        """
+        Queue one item for processing.
+
+        Args:
+            item: The input to process.
+            block (bool, optional): Wait for room when the queue is full instead of
+                raising. Defaults to True.
+
+        Returns:
+            concurrent.futures.Future: Resolves to the item's result.
+
+        Raises:
+            queue.Full: If ``block`` is False and the queue is full.
+        """
+        self._ensure_started()
+        future = Future()
+        self._queue.put((item, future), block=block)
+        return future
+
+    def submit_many(self, items, block=True):
+        """
+        Queue several items; they may be split across or merged into batches.
+
+        Without ``block``, either all items are queued or none: items are
+        rejected up front if the queue lacks room for all of them, and if it
+        fills up part way anyway, the items already queued are cancelled.
+
+        Returns:
+            list[concurrent.futures.Future]: One future per item, in order.
+
+        Raises:
+            queue.Full: If ``block`` is False and the queue is full.
+        """
+        maxsize = self._queue.maxsize
+        if not block and maxsize and self.pending() + len(items) > maxsize:
+            raise queue.Full
+        futures = []
+        try:
+            for item in items:
+                futures.append(self.submit(item, block=block))
+        except queue.Full:
+            for future in futures:
+                future.cancel()
+            raise
+        return futures
+
+    def pending(self):
+        """
+        Return the approximate number of items waiting to be processed.
+        """
+        return self._queue.qsize()
+
+    def _ensure_started(self):
+        """
+        Start the worker thread if it is not running yet.
+        """
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name=self.name, daemon=True
+                )
+                self._thread.start()
+
+    def _collect_batch(self):
+        """
+        Block for the first item, then gather more until the batch is full or the
+        wait budget is spent.
+        """
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        """
+        Worker loop: process batches until the process exits.
+        """
+        while True:
+            batch = self._collect_batch()
+            # Drop requests whose callers have already given up.
+            batch = [
+                (item, future)
+                for item, future in batch
+                if future.set_running_or_notify_cancel()
+            ]
+            if not batch:
+                continue
+            try:
+                results = self.process_batch([item for item, _ in batch])
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                logger.error(f"Error processing {self.name} batch: {e}")
+                for _, future in batch:
+                    future.set_exception(e)
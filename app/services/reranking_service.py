@@ -0,0 +1,146 @@
+import threading
+import time
+import numpy as np
+from app.core.config import (
+    RERANK_BATCH_SIZE,
+    RERANK_CANDIDATES,
+    RERANK_ENABLED,
+    RERANK_MODEL,
+    RERANK_TIME_BUDGET_MS,
+    RERANK_WORKERS,
+)
+from app.core.logging_config import logger
+from app.services.inference_executor import InferenceExecutor, InferenceOverloadedError
+
+# Loaded on first use or during warm-up, so importing this module stays cheap
+_model = None
+_model_lock = threading.Lock()
+
+
+def get_reranker():
+    """
+    Return the cross-encoder used to re-rank retrieved chunks, loading it on
+    first use.
+
+    Returns:
+        CrossEncoder: The shared ``RERANK_MODEL`` cross-encoder.
+    """
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                from sentence_transformers import CrossEncoder
+
+                _model = CrossEncoder(RERANK_MODEL)
+                logger.info(f"Loaded re-ranking model {RERANK_MODEL}.")
+    return _model
+
+
+def warm_up_reranker():
+    """
+    Load the cross-encoder and score one pair so the first request does not
+    pay for lazy initialization.
+    """
+    get_reranker().predict([("warm up", "warm up")])
+
+
+def candidate_count(k):
+    """
+    Return how many chunks to retrieve for a question that needs ``k``: the
+    re-ranking candidates if re-ranking is enabled, else ``k``.
+    """
+    return max(k, RERANK_CANDIDATES) if RERANK_ENABLED else k
+
+
+def _rerank(questions, candidate_lists, top_m, deadline):
+    """
+    Score every (question, chunk) pair with the cross-encoder and keep the best
+    ``top_m`` chunks of each question.
+
+    Pairs of all questions are scored together in batches of
+    ``RERANK_BATCH_SIZE``, best retrieved candidates first. Once ``deadline``
+    (a ``time.monotonic`` value) has passed no further batches are scored: the
+    scored chunks of a question are ordered by score and followed by the
+    unscored ones in retrieval order.
+    """
+    pairs = [
+        (question, chunk.text, position, rank)
+        for position, (question, chunks) in enumerate(zip(questions, candidate_lists))
+        for rank, chunk in enumerate(chunks)
+    ]
+    # Interleave by rank, so a cut-off batch leaves every question's best
+    # candidates scored
+    pairs.sort(key=lambda pair: pair[3])
+
+    scores = [np.full(len(chunks), -np.inf) for chunks in candidate_lists]
+    scored = 0
+    model = get_reranker()
+    for start in range(0, len(pairs), RERANK_BATCH_SIZE):
+        if time.monotonic() > deadline:
+            logger.warning(
+                f"Re-ranking time budget exhausted after {scored} of {len(pairs)} pairs."
+            )
+            break
+        batch = pairs[start : start + RERANK_BATCH_SIZE]
+        batch_scores = model.predict(
+            [(question, text) for question, text, _, _ in batch],
+            batch_size=RERANK_BATCH_SIZE,
+        )
+        for (_, _, position, rank), score in zip(batch, batch_scores):
+            scores[position][rank] = score
+        scored += len(batch)
+
+    reranked = []
+    for chunks, chunk_scores in zip(candidate_lists, scores):
+        # Stable sort: unscored chunks (-inf) keep their retrieval order
+        order = np.argsort(-chunk_scores, kind="stable")[:top_m]
+        reranked.append([chunks[i] for i in order])
+    return reranked
+
+
+# Bounded pool without a wait queue: when every worker is busy, re-ranking is
+# skipped instead of delaying the answer
+reranking_executor = InferenceExecutor(
+    "thread", max_workers=RERANK_WORKERS, max_pending=0, name="reranking"
+)
+
+
+async def rerank_batch_async(questions, candidate_lists, top_m):
+    """
+    Re-rank the retrieved chunks of several questions with the cross-encoder.
+
+    Re-ranking is best effort: if it is disabled, all re-ranking workers are
+    busy, or it fails, the first ``top_m`` chunks in retrieval order are
+    returned; within the time budget (``RERANK_TIME_BUDGET_MS``) only the
+    pairs scored so far are re-ordered.
+
+    Args:
+        questions (list[str]): The questions.
+        candidate_lists (list[list]): The retrieved chunks of each question, best
+            first.
+        top_m (int): Number of chunks to keep per question.
+
+    Returns:
+        list[list]: The best ``top_m`` chunks of each question, best first.
+    """
+    fallback = [chunks[:top_m] for chunks in candidate_lists]
+    if not RERANK_ENABLED or not any(len(chunks) > 1 for chunks in candidate_lists):
+        return fallback
+    deadline = time.monotonic() + RERANK_TIME_BUDGET_MS / 1000
+    try:
+        return await reranking_executor.run(
+            _rerank, questions, candidate_lists, top_m, deadline
+        )
+    except InferenceOverloadedError:
+        logger.warning("Re-ranking workers busy; using retrieval order.")
+    except Exception as e:
+        logger.error(f"Error re-ranking chunks: {e}")
+    return fallback
+
+
+async def rerank_async(question, chunks, top_m):
+    """
+    Re-rank the retrieved chunks of one question; see rerank_batch_async.
+    """
+    reranked = await rerank_batch_async([question], [chunks], top_m)
+    return reranked[0]
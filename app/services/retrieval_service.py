@@ -1,67 +1,278 @@
+import asyncio
+from typing import NamedTuple
+import numpy as np
+from sqlalchemy import select
 from app.models.embedding_store_instance import embedding_store
+from app.models.lexical_index_instance import lexical_index
+from app.core.config import (
+    CACHE_ENABLED,
+    HYBRID_CANDIDATES,
+    RETRIEVAL_MODE,
+    RRF_K,
+    SIMILARITY_THRESHOLD,
+)
 from app.core.logging_config import logger
-from app.models.db_models import Document, SessionLocal
-from app.api.document_selection import selected_docs_store
+from app.models.db_models import Chunk
+from app.services.cache import (
+    corpus_version,
+    embedding_key,
+    normalize_question,
+    retrieval_cache,
+    text_cache,
+)
 
 
-def retrieve_relevant_docs(query_embedding, k=5):
+class RetrievedChunk(NamedTuple):
     """
-    Retrieve relevant documents based on selected documents or all documents.
+    The columns of a chunk that answering a question needs.
+    """
+
+    id: int
+    document_id: int
+    text: str
+
+
+def reciprocal_rank_fusion(rankings, k, rrf_k=RRF_K):
+    """
+    Fuse several rankings of chunk IDs with reciprocal rank fusion.
+
+    Each chunk scores ``1 / (rrf_k + rank)`` in every ranking it appears in
+    (ranks start at 1), so chunks ranked well by several retrievers come first
+    without having to compare their raw scores.
+
+    Args:
+        rankings (list[list[int]]): Chunk IDs, best first, one list per retriever.
+        k (int): Number of chunk IDs to return.
+        rrf_k (int, optional): Damping constant. Defaults to RRF_K.
+
+    Returns:
+        list[int]: The best ``k`` chunk IDs, best first.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking, start=1):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(scores, key=scores.get, reverse=True)[:k]
+
+
+async def retrieve_relevant_docs(
+    db, query_embedding, k=5, threshold=None, selection=None, query_text=None
+):
+    """
+    Retrieve the most relevant document chunks, from selected documents or all documents.
 
     Args:
+        db (AsyncSession): The async database session used to load the chunks.
         query_embedding (numpy.ndarray): Vector representation of the query text.
-        k (int, optional): Retrieves top k closest matching documents. Defaults to 5.
+        k (int, optional): Retrieves top k closest matching chunks. Defaults to 5.
+        threshold (float, optional): Minimum cosine similarity for a chunk to be
+            considered relevant. Defaults to SIMILARITY_THRESHOLD.
+        selection (Selection, optional): The session's selected documents.
+        query_text (str, optional): The query text, for keyword search in
+            ``hybrid`` retrieval mode.
 
     Returns:
         tuple: A tuple containing:
-            - list[Document]: A list of relevant Document objects.
-            - str: A string indicating the source of the retrieved documents.
+            - list[RetrievedChunk]: The relevant chunks, best match first.
+            - str: A string indicating the source of the retrieved chunks.
                Possible values: "Answer is based on selected documents.",
                "No documents selected. Answer is based on all available documents.",
                "No relevant documents found.", "Error retrieving documents."
 
     If documents are selected, only search within those.
     If no documents are selected, search all and return a message.
+    In ``hybrid`` mode, the FAISS results are fused with BM25 keyword results
+    by reciprocal rank fusion, so chunks matching rare query terms (IDs, error
+    codes, names) are found even when they are not among the nearest
+    embeddings. Keyword matches are held to the same similarity threshold.
+    The ranked chunk IDs are cached per query embedding, selection, k and
+    threshold until the corpus or the selection changes.
+    """
+    retrieved = await retrieve_relevant_docs_batch(
+        db,
+        [query_embedding],
+        k,
+        threshold,
+        selection,
+        query_texts=None if query_text is None else [query_text],
+    )
+    return retrieved[0]
+
+
+async def retrieve_relevant_docs_batch(
+    db, query_embeddings, k=5, threshold=None, selection=None, query_texts=None
+):
+    """
+    Retrieve the most relevant document chunks for several queries at once.
+
+    Cached queries are answered from the retrieval cache; the others are
+    searched with a single FAISS search over the matrix of their embeddings
+    (and, in ``hybrid`` mode, with BM25 per query) in a worker thread, and the
+    chunks of all queries are loaded with a single async database query.
+
+    Args:
+        db (AsyncSession): The async database session used to load the chunks.
+        query_embeddings (sequence of numpy.ndarray): One query vector per query.
+        k (int, optional): Retrieves top k closest matching chunks per query.
+        threshold (float, optional): Minimum cosine similarity for a chunk to be
+            considered relevant. Defaults to SIMILARITY_THRESHOLD.
+        selection (Selection, optional): The session's selected documents.
+        query_texts (list[str], optional): The query texts, for keyword search
+            in ``hybrid`` mode. Without them only FAISS is searched.
+
+    Returns:
+        list[tuple]: For each query, in order, the ``(chunks, message)`` pair
+        described in retrieve_relevant_docs. If the search fails, every query
+        gets ``([], "Error retrieving documents.")`` and nothing is cached.
     """
     try:
-        # Uses FAISS to find k nearest neighbors. Returns indices of matching document embeddings.
-        doc_indices = embedding_store.search(query_embedding, k)
-
-        if not doc_indices:  # If no valid results
-            logger.info("No relevant documents found.")
-            return [], "No relevant documents found."
-
-        # Convert FAISS indices to actual document IDs stored in the database.
-        document_ids = [int(doc_id) for doc_id in doc_indices]
-
-        db = SessionLocal()
-        if selected_docs_store:
-            # Filter search results to only include selected documents
-            documents = (
-                db.query(Document)
-                .filter(
-                    Document.id.in_(document_ids), Document.id.in_(selected_docs_store)
-                )
-                .all()
-            )
+        if threshold is None:
+            threshold = SIMILARITY_THRESHOLD
+
+        if selection is not None:
+            # Restrict the search itself to the chunks of the selected documents
+            allowed_ids = selection.chunk_ids
             message = "Answer is based on selected documents."
         else:
-            documents = db.query(Document).filter(Document.id.in_(document_ids)).all()
+            allowed_ids = None
             message = (
                 "No documents selected. Answer is based on all available documents."
             )
 
-        db.close()
+        hybrid = RETRIEVAL_MODE == "hybrid" and query_texts is not None
+        ranked = [None] * len(query_embeddings)
+        cache_keys = [None] * len(query_embeddings)
+        if CACHE_ENABLED:
+            for position, query_embedding in enumerate(query_embeddings):
+                cache_keys[position] = (
+                    embedding_key(query_embedding),
+                    selection.key if selection is not None else None,
+                    k,
+                    threshold,
+                    corpus_version(),
+                    # Changes when a reader swaps in a snapshot published by the writer.
+                    embedding_store.snapshot_version,
+                    normalize_question(query_texts[position]) if hybrid else None,
+                    # Grows with every chunk added, in whatever ID order.
+                    lexical_index.size if hybrid else None,
+                )
+                ranked[position] = retrieval_cache.get(cache_keys[position])
+
+        misses = [position for position, cached in enumerate(ranked) if cached is None]
+        searched = set(misses)
+        if misses:
+            # The searches are CPU-bound, so they run off the event loop
+            results = await asyncio.to_thread(
+                _search,
+                [query_embeddings[position] for position in misses],
+                k,
+                threshold,
+                allowed_ids,
+                [query_texts[position] for position in misses] if hybrid else None,
+            )
+            for position, chunk_ids in zip(misses, results):
+                ranked[position] = (chunk_ids, message)
 
-        if not documents:
-            logger.info("No relevant documents found after filtering.")
-            return [], "No relevant documents found."
+        # One database round trip for the chunks of every query
+        chunks_by_id = await _fetch_chunks(
+            db, {chunk_id for chunk_ids, _ in ranked for chunk_id in chunk_ids}
+        )
 
-        logger.info(f"Retrieved {len(documents)} relevant documents.")
-        # Remove duplicate documents by using a dictionary with doc.id as a key.
-        unique_documents = list({doc.id: doc for doc in documents}.values())
-        return unique_documents, message
+        retrieved = []
+        for position, (chunk_ids, query_message) in enumerate(ranked):
+            chunks = [
+                chunks_by_id[chunk_id] for chunk_id in chunk_ids if chunk_id in chunks_by_id
+            ]
+            if not chunks:
+                logger.info("No relevant documents found.")
+                result = ([], "No relevant documents found.")
+            else:
+                logger.info(f"Retrieved {len(chunks)} relevant chunks.")
+                result = (chunks, query_message)
+            if position in searched and cache_keys[position] is not None:
+                retrieval_cache.set(
+                    cache_keys[position], ([chunk.id for chunk in result[0]], result[1])
+                )
+            retrieved.append(result)
+        return retrieved
 
     except Exception as e:
         logger.error(f"Error retrieving documents: {e}")
-        return [], "Error retrieving documents."
+        return [([], "Error retrieving documents.") for _ in query_embeddings]
+
+
+def _search(query_embeddings, k, threshold, allowed_ids, query_texts):
+    """
+    Rank chunk IDs for queries: FAISS alone, or fused with BM25 if query texts
+    are given.
+
+    Returns:
+        list[list[int]]: The best ``k`` chunk IDs of each query, best first.
+    """
+    # Uses FAISS to find the nearest neighbors of every query at once.
+    candidates = max(k, HYBRID_CANDIDATES) if query_texts is not None else k
+    results = embedding_store.search_batch(
+        np.vstack(query_embeddings), candidates, threshold, allowed_ids=allowed_ids
+    )
+    if query_texts is None:
+        return results
+    fused = []
+    for query_embedding, chunk_ids, text in zip(query_embeddings, results, query_texts):
+        keyword_ids = lexical_index.search(text, candidates, allowed_ids=allowed_ids)
+        fused.append(
+            reciprocal_rank_fusion(
+                [chunk_ids, _above_threshold(query_embedding, keyword_ids, chunk_ids, threshold)],
+                k,
+            )
+        )
+    return fused
+
+
+def _above_threshold(query_embedding, keyword_ids, vector_ids, threshold):
+    """
+    Keep the keyword matches whose cosine similarity to the query reaches the
+    threshold, so hybrid results honour it like vector results do.
+
+    Matches also found by FAISS already passed it; the others are scored
+    exactly against their stored vectors.
+    """
+    found = set(vector_ids)
+    unscored = [chunk_id for chunk_id in keyword_ids if chunk_id not in found]
+    if unscored:
+        found.update(
+            embedding_store.search(
+                query_embedding, len(unscored), threshold, allowed_ids=unscored
+            )
+        )
+    return [chunk_id for chunk_id in keyword_ids if chunk_id in found]
+
+
+async def _fetch_chunks(db, chunk_ids):
+    """
+    Load the ID, document ID and text of chunks.
+
+    Only these columns are selected, so neither embeddings nor ORM objects are
+    loaded. Chunks are immutable once stored, so their texts are kept in the
+    ``chunk_text`` cache and frequently retrieved chunks skip the database.
+
+    Returns:
+        dict: Chunk ID -> RetrievedChunk, for the chunks that still exist.
+    """
+    chunks, missing = {}, []
+    for chunk_id in chunk_ids:
+        cached = text_cache.get(chunk_id) if CACHE_ENABLED else None
+        if cached is None:
+            missing.append(chunk_id)
+        else:
+            chunks[chunk_id] = RetrievedChunk(chunk_id, *cached)
+    if not missing:
+        return chunks
+
+    rows = await db.execute(
+        select(Chunk.id, Chunk.document_id, Chunk.text).where(Chunk.id.in_(missing))
+    )
+    for row in rows:
+        chunks[row.id] = RetrievedChunk(row.id, row.document_id, row.text)
+        if CACHE_ENABLED:
+            text_cache.set(row.id, (row.document_id, row.text))
+    return chunks
@@ -0,0 +1,209 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+import numpy as np
+from sqlalchemy import delete, select
+from app.core.config import (
+    SELECTION_BACKEND,
+    SELECTION_MAX_SESSIONS,
+    SELECTION_TTL_SECONDS,
+)
+from app.core.logging_config import logger
+from app.models.db_models import Chunk, SelectionSession, SessionLocal, utc_now
+
+# Session used by clients that do not send a session header
+DEFAULT_SESSION = "default"
+
+# Seconds between deletions of expired selections from the database
+PURGE_INTERVAL_SECONDS = 60
+
+
+class Selection:
+    """
+    The documents selected by one session, with their chunk IDs precomputed.
+
+    Attributes:
+        document_ids (np.ndarray): Sorted int64 IDs of the selected documents.
+        chunk_ids (np.ndarray): Sorted int64 IDs of all their chunks, ready to
+            restrict a vector search.
+        key (str): Fingerprint of the selected documents, used in cache keys.
+    """
+
+    def __init__(self, document_ids, chunk_ids):
+        self.document_ids = np.unique(np.asarray(document_ids, dtype=np.int64))
+        self.chunk_ids = np.unique(np.asarray(chunk_ids, dtype=np.int64))
+        self.key = hashlib.sha256(self.document_ids.tobytes()).hexdigest()
+
+    @classmethod
+    async def resolve(cls, db, document_ids):
+        """
+        Build a selection, looking up the chunks of the given documents.
+
+        Args:
+            db (AsyncSession): The async database session.
+            document_ids (Iterable[int]): IDs of existing documents.
+
+        Returns:
+            Selection: The selection.
+        """
+        document_ids = list(document_ids)
+        chunk_ids = await db.scalars(
+            select(Chunk.id).where(Chunk.document_id.in_(document_ids))
+        )
+        return cls(document_ids, chunk_ids.all())
+
+
+class MemorySelectionStore:
+    """
+    Keeps selections in this process, evicting the least recently used sessions.
+
+    Selections are not shared between worker processes; use the database backend
+    when running more than one worker.
+    """
+
+    def __init__(self, max_sessions=SELECTION_MAX_SESSIONS, ttl=SELECTION_TTL_SECONDS):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        """
+        Return the session's selection, or None if it has none or it expired.
+        """
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            selection, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._sessions[session_id]
+                return None
+            self._sessions.move_to_end(session_id)
+            return selection
+
+    def set(self, session_id, selection):
+        """
+        Replace the session's selection.
+        """
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            self._sessions[session_id] = (selection, time.monotonic() + self.ttl)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def clear(self, session_id):
+        """
+        Remove the session's selection.
+        """
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+
+class DatabaseSelectionStore:
+    """
+    Keeps selections in the ``selection_sessions`` table, shared by all workers.
+
+    Each lookup is a single primary key query; the chunk IDs are stored with
+    the selection so retrieval needs no further queries. Expired selections are
+    deleted when selections are set, at most every ``PURGE_INTERVAL_SECONDS``.
+    """
+
+    def __init__(self, ttl=SELECTION_TTL_SECONDS):
+        self.ttl = ttl
+        self._last_purge = float("-inf")
+
+    def get(self, session_id):
+        """
+        Return the session's selection, or None if it has none or it expired.
+        """
+        db = SessionLocal()
+        try:
+            row = db.get(SelectionSession, session_id)
+            if row is None:
+                return None
+            updated_at = row.updated_at
+            if updated_at is not None and updated_at.tzinfo is None:
+                # SQLite returns naive datetimes.
+                updated_at = updated_at.replace(tzinfo=utc_now().tzinfo)
+            if updated_at is not None and updated_at < utc_now() - timedelta(
+                seconds=self.ttl
+            ):
+                return None
+            return Selection(
+                np.frombuffer(row.document_ids, dtype=np.int64),
+                np.frombuffer(row.chunk_ids, dtype=np.int64),
+            )
+        finally:
+            db.close()
+
+    def set(self, session_id, selection):
+        """
+        Replace the session's selection.
+        """
+        db = SessionLocal()
+        try:
+            db.merge(
+                SelectionSession(
+                    session_id=session_id,
+                    document_ids=selection.document_ids.tobytes(),
+                    chunk_ids=selection.chunk_ids.tobytes(),
+                    updated_at=utc_now(),
+                )
+            )
+            self._purge_expired(db)
+            db.commit()
+        finally:
+            db.close()
+
+    def _purge_expired(self, db):
+        """
+        Delete expired selections, unless that was done less than
+        ``PURGE_INTERVAL_SECONDS`` ago.
+        """
+        now = time.monotonic()
+        if now - self._last_purge < PURGE_INTERVAL_SECONDS:
+            return
+        self._last_purge = now
+        cutoff = utc_now() - timedelta(seconds=self.ttl)
+        purged = db.execute(
+            delete(SelectionSession).where(SelectionSession.updated_at < cutoff)
+        ).rowcount
+        if purged:
+            logger.info(f"Deleted {purged} expired document selection(s).")
+
+    def clear(self, session_id):
+        """
+        Remove the session's selection.
+        """
+        db = SessionLocal()
+        try:
+            db.query(SelectionSession).filter(
+                SelectionSession.session_id == session_id
+            ).delete()
+            db.commit()
+        finally:
+            db.close()
+
+
+def create_selection_store(backend=SELECTION_BACKEND):
+    """
+    Create the selection store for the configured backend.
+
+    Args:
+        backend (str): ``memory`` or ``database``.
+    """
+    if backend == "memory":
+        return MemorySelectionStore()
+    if backend == "database":
+        return DatabaseSelectionStore()
+    raise ValueError(
+        f"Unsupported selection backend '{backend}'. Expected 'memory' or 'database'."
+    )
+
+
+# Global store holding the document selection of every session
+selection_store = create_selection_store()
+logger.info(f"Using the {SELECTION_BACKEND} selection store.")
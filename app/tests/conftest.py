@@ -0,0 +1,33 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.main import app
+from app.models import db_models, embedding_store, lexical_index
+from app.services import selection_store
+from app.services.lifecycle import startup
+
+
+@pytest.fixture(scope="session")
+def started_app():
+    """
+    Run the application's startup once and wait until it is ready.
+
+    Requested by the API tests only; unit tests run without loading the models.
+    """
+    with TestClient(app):
+        assert startup.wait(timeout=600), startup.report()
+        yield
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """Give the test its own SQLite database in place of the application's."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    db_models.Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    # Modules bind SessionLocal on import, so each one is patched
+    for module in (db_models, embedding_store, lexical_index, selection_store):
+        monkeypatch.setattr(module, "SessionLocal", session_factory)
+    yield session_factory
+    engine.dispose()
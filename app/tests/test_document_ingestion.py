@@ -1,8 +1,18 @@
+import io
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+import pytest
 from fastapi.testclient import TestClient
 from app.main import app
+from app.services import ingestion_service
 
 client = TestClient(app)
 
+# Requests are served by the started application and its models
+pytestmark = pytest.mark.usefixtures("started_app")
+
 
 def test_upload_valid_document():
     """Test uploading a valid document."""
@@ -13,6 +23,42 @@ def test_upload_valid_document():
     assert "document_id" in response.json()
 
 
+def test_upload_duplicate_document():
+    """Test that re-uploading the same content returns the existing document."""
+    first = client.post("/upload/", files={"file": ("a.txt", "Duplicate  content here.")})
+    second = client.post("/upload/", files={"file": ("b.txt", "Duplicate content\nhere.")})
+    assert second.status_code == 200
+    assert second.json()["document_id"] == first.json()["document_id"]
+
+
+def test_concurrent_duplicate_uploads(monkeypatch):
+    """Test that two concurrent uploads of the same content return one document."""
+    content = "Concurrently uploaded content."
+    digest = ingestion_service.content_hash(content)
+    find_documents = ingestion_service.find_documents
+    stale_lookups = [4]  # two lookups per upload, made before either one commits
+    lock = threading.Lock()
+
+    def racing_find_documents(db, hashes):
+        hashes = list(hashes)
+        with lock:
+            if digest in hashes and stale_lookups[0] > 0:
+                stale_lookups[0] -= 1
+                return {}
+        return find_documents(db, hashes)
+
+    monkeypatch.setattr(ingestion_service, "find_documents", racing_find_documents)
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        responses = list(
+            pool.map(
+                lambda name: client.post("/upload/", files={"file": (name, content)}),
+                ["first.txt", "second.txt"],
+            )
+        )
+    assert [response.status_code for response in responses] == [200, 200]
+    assert responses[0].json()["document_id"] == responses[1].json()["document_id"]
+
+
 def test_upload_empty_document():
     """Test uploading an empty document."""
     response = client.post("/upload/", files={"file": ("empty.txt", "")})
@@ -31,3 +77,40 @@ def test_upload_no_file():
     """Test API behavior when no file is provided."""
     response = client.post("/upload/")
     assert response.status_code == 422  # FastAPI should return a validation error
+
+
+def test_bulk_upload_archive_and_jsonl():
+    """Test uploading a zip archive and a JSONL file in one request."""
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zf:
+        zf.writestr("first.txt", "First archived document")
+        zf.writestr("image.png", b"not text")
+    jsonl = '{"text": "A document from JSONL"}\n{"title": "missing text"}\n'
+
+    response = client.post(
+        "/upload/bulk/",
+        files=[
+            ("files", ("docs.zip", archive.getvalue())),
+            ("files", ("docs.jsonl", jsonl)),
+        ],
+    )
+    assert response.status_code == 202
+    job_id = response.json()["job_id"]
+
+    # The job runs in the background; poll until it finishes.
+    for _ in range(100):
+        body = client.get(f"/upload/jobs/{job_id}").json()
+        if body["status"] not in ("queued", "running"):
+            break
+        time.sleep(0.1)
+    assert body["status"] == "completed"
+    assert body["processed"] == 4
+    assert body["succeeded"] == 2
+    assert body["failed"] == 2
+    assert len(body["results"]) == 4
+
+
+def test_bulk_upload_unknown_job():
+    """Test polling a job that does not exist."""
+    response = client.get("/upload/jobs/unknown")
+    assert response.status_code == 404
@@ -1,8 +1,12 @@
+import pytest
 from fastapi.testclient import TestClient
 from app.main import app
 
 client = TestClient(app)
 
+# Requests are served by the started application and its models
+pytestmark = pytest.mark.usefixtures("started_app")
+
 
 def test_select_existing_documents():
     """Test selecting documents that exist in the database."""
@@ -21,3 +25,21 @@ def test_select_no_documents():
     """Test API behavior when no document IDs are provided."""
     response = client.post("/select_documents/", json={"doc_ids": []})
     assert response.status_code == 400  # Should fail if an empty list is invalid
+
+
+def test_selection_is_per_session():
+    """Test that sessions sent in the X-Session-ID header keep separate selections."""
+    upload = client.post("/upload/", files={"file": ("s.txt", "Session document")})
+    doc_id = upload.json()["document_id"]
+    response = client.post(
+        "/select_documents/",
+        json={"doc_ids": [doc_id]},
+        headers={"X-Session-ID": "session-a"},
+    )
+    assert response.status_code == 200
+    assert response.json()["session_id"] == "session-a"
+
+    own = client.get("/selected_documents/", headers={"X-Session-ID": "session-a"})
+    other = client.get("/selected_documents/", headers={"X-Session-ID": "session-b"})
+    assert own.json()["selected_documents"] == [doc_id]
+    assert other.json()["selected_documents"] == []
@@ -0,0 +1,256 @@
+import secrets
+import numpy as np
+import pytest
+from app.models import db_models
+from app.models.db_models import Chunk, Document
+from app.models import embedding_store as embedding_store_module
+from app.models.embedding_store import EmbeddingStore
+
+# Each test stores its chunks in a database of its own.
+pytestmark = pytest.mark.usefixtures("database")
+
+
+def random_vectors(count, seed):
+    """Return ``count`` random unit vectors."""
+    vectors = np.random.default_rng(seed).standard_normal((count, 384)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def store_chunks(vectors):
+    """Commit one document with a chunk per vector and return the chunk IDs."""
+    db = db_models.SessionLocal()
+    try:
+        document = Document(text="Embedding store test", content_hash=secrets.token_hex(32))
+        document.chunks = [
+            Chunk(position=i, text=f"Chunk {i}", embedding=vector.tobytes())
+            for i, vector in enumerate(vectors)
+        ]
+        db.add(document)
+        db.commit()
+        return [chunk.id for chunk in document.chunks]
+    finally:
+        db.close()
+
+
+def new_store(tmp_path, **kwargs):
+    """Create a standalone store with its own index and vector storage."""
+    kwargs.setdefault("role", "standalone")
+    return EmbeddingStore(
+        index_dir=str(tmp_path / "faiss"), vector_dir=str(tmp_path / "vectors"), **kwargs
+    )
+
+
+def test_removed_chunk_stays_removed_after_rebuild(tmp_path):
+    """Test that a background rebuild from the vector storage does not restore a removed chunk."""
+    vectors = random_vectors(3, seed=1)
+    chunk_ids = store_chunks(vectors)
+    store = new_store(tmp_path, index_type="hnsw")
+    assert store.search(vectors[0], k=1, threshold=0.99) == [chunk_ids[0]]
+
+    assert store.remove_embedding(chunk_ids[0])
+    store.wait_for_build()
+    assert store.index_info()["tombstones"] == 0
+    assert store.search(vectors[0], k=1, threshold=0.99) == []
+    assert store.search(vectors[1], k=1, threshold=0.99) == [chunk_ids[1]]
+
+    # A rebuild without a snapshot in another process reads the same storage.
+    rebuilt = EmbeddingStore(
+        index_dir=str(tmp_path / "rebuilt"),
+        vector_dir=str(tmp_path / "vectors"),
+        index_type="hnsw",
+        role="standalone",
+    )
+    assert rebuilt.search(vectors[0], k=1, threshold=0.99) == []
+
+
+def test_updated_chunk_keeps_new_vector_after_rebuild(tmp_path):
+    """Test that a background rebuild from the vector storage uses the updated vector."""
+    vectors = random_vectors(3, seed=2)
+    chunk_ids = store_chunks(vectors)
+    store = new_store(tmp_path, index_type="hnsw")
+    replacement = random_vectors(1, seed=3)[0]
+
+    store.update_embedding(chunk_ids[1], replacement)
+    store.wait_for_build()
+    assert store.search(replacement, k=1, threshold=0.99) == [chunk_ids[1]]
+    assert store.search(vectors[1], k=1, threshold=0.99) == []
+
+
+def test_trained_index_built_in_background(tmp_path, monkeypatch):
+    """Test that a trained index type is built once the corpus is large enough."""
+    monkeypatch.setattr(embedding_store_module, "FAISS_TRAIN_THRESHOLD", 400)
+    vectors = random_vectors(400, seed=13)
+    chunk_ids = store_chunks(vectors)
+    store = new_store(tmp_path, index_type="ivf_flat")
+    store.wait_for_build()
+    info = store.index_info()
+    assert info["configured_type"] == "ivf_flat" and store.active_type == "ivf_flat"
+    assert info["build_error"] is None and not info["building"]
+    assert store.search(vectors[7], k=1, threshold=0.99) == [chunk_ids[7]]
+
+    # The trained index is what the next process starts from.
+    assert new_store(tmp_path, index_type="ivf_flat").active_type == "ivf_flat"
+
+
+def set_embedding(chunk_id, vector):
+    """Store (or, with None, clear) the embedding of a chunk in the database."""
+    db = db_models.SessionLocal()
+    try:
+        chunk = db.get(Chunk, chunk_id)
+        chunk.embedding = None if vector is None else vector.tobytes()
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_late_chunk_kept_for_rebuild(tmp_path):
+    """Test that a chunk committed after a higher one is stored for rebuilds."""
+    vectors = random_vectors(2, seed=15)
+    late, early = store_chunks(vectors)
+    # The lower chunk's transaction has not committed yet.
+    set_embedding(late, None)
+    store = new_store(tmp_path, index_type="flat")
+    assert store.vectors.watermark >= early
+
+    set_embedding(late, vectors[0])
+    store.add_embedding(late, vectors[0])
+    rebuilt = EmbeddingStore(
+        index_dir=str(tmp_path / "rebuilt"),
+        vector_dir=str(tmp_path / "vectors"),
+        index_type="flat",
+        role="standalone",
+    )
+    assert rebuilt.search(vectors[0], k=1, threshold=0.99) == [late]
+
+
+def test_sync_picks_up_chunks_committed_out_of_order(tmp_path):
+    """Test that chunks committed below the watermark are found by syncs and restarts."""
+    writer = new_store(tmp_path, index_type="flat", role="writer")
+    vectors = random_vectors(3, seed=16)
+    first, second, highest = store_chunks(vectors)
+    # The two lower chunks' transactions have not committed yet.
+    set_embedding(first, None)
+    set_embedding(second, None)
+    assert writer.sync_from_database() == 1
+    assert writer.search(vectors[1], k=1, threshold=0.99) == []
+
+    set_embedding(second, vectors[1])
+    assert writer.sync_from_database() == 1
+    assert writer.search(vectors[1], k=1, threshold=0.99) == [second]
+
+    # The remaining gap is kept in the snapshot across a restart.
+    writer.save_snapshot()
+    set_embedding(first, vectors[0])
+    restarted = new_store(tmp_path, index_type="flat", role="writer")
+    assert restarted.search(vectors[0], k=1, threshold=0.99) == [first]
+    assert restarted.sync_from_database() == 0
+
+
+def exact_top_k(vectors, query, chunk_ids, k):
+    """Return the ``k`` of ``chunk_ids`` (1-based rows of ``vectors``) closest to ``query``."""
+    scores = vectors[chunk_ids - 1] @ query
+    return chunk_ids[np.argsort(-scores)[:k]].tolist()
+
+
+def test_selected_search_on_ivf_finds_k_hits(tmp_path, monkeypatch):
+    """Test that a selective search on an IVF index is not limited to the probed lists."""
+    monkeypatch.setattr(embedding_store_module, "FAISS_EXACT_SEARCH_MAX_IDS", 10)
+    vectors = random_vectors(10000, seed=4)
+    store = new_store(tmp_path, index_type="ivf_flat", load=False)
+    store.index = store._create_index("ivf_flat", len(vectors))
+    store.index.train(vectors)
+    store.index.add_with_ids(vectors, np.arange(1, len(vectors) + 1))
+    store.active_type = "ivf_flat"
+    store.set_search_params(nprobe=1)
+
+    allowed = np.random.default_rng(5).choice(np.arange(1, 10001), 50, replace=False)
+    query = random_vectors(1, seed=6)[0]
+    found = store.search(query, k=5, threshold=-1.0, allowed_ids=allowed)
+    assert len(found) == 5
+    assert set(found) <= set(allowed.tolist())
+    assert found[0] == exact_top_k(vectors, query, allowed, 1)[0]
+
+
+def test_selected_search_on_hnsw_finds_k_hits(tmp_path, monkeypatch):
+    """Test that a selective search on an HNSW index returns k hits."""
+    monkeypatch.setattr(embedding_store_module, "FAISS_EXACT_SEARCH_MAX_IDS", 10)
+    vectors = random_vectors(5000, seed=7)
+    store = new_store(tmp_path, index_type="hnsw", load=False)
+    store.index.add_with_ids(vectors, np.arange(1, len(vectors) + 1))
+    store.set_search_params(ef_search=8)
+
+    allowed = np.random.default_rng(8).choice(np.arange(1, 5001), 20, replace=False)
+    query = random_vectors(1, seed=9)[0]
+    found = store.search(query, k=5, threshold=-1.0, allowed_ids=allowed)
+    assert len(found) == 5
+    assert set(found) <= set(allowed.tolist())
+
+
+def test_added_chunks_are_searchable_and_removable(tmp_path):
+    """Test that chunks added one at a time or in a batch are found until removed."""
+    store = new_store(tmp_path, index_type="flat")
+    vectors = random_vectors(4, seed=10)
+    chunk_ids = store_chunks(vectors)
+    store.add_embedding(chunk_ids[0], vectors[0])
+    store.add_embeddings(chunk_ids[1:], vectors[1:])
+    assert store.search_batch(vectors, k=1, threshold=0.99) == [[i] for i in chunk_ids]
+
+    assert store.remove_embedding(chunk_ids[2])
+    assert not store.remove_embedding(chunk_ids[2])
+    assert store.search(vectors[2], k=1, threshold=0.99) == []
+    assert store.search(vectors[3], k=1, threshold=0.99) == [chunk_ids[3]]
+
+
+def test_snapshot_round_trip(tmp_path):
+    """Test that a store started from a saved snapshot serves the same index."""
+    vectors = random_vectors(3, seed=11)
+    chunk_ids = store_chunks(vectors)
+    store = new_store(tmp_path, index_type="flat")
+    assert store.snapshot_version == 1
+
+    reloaded = new_store(tmp_path, index_type="flat")
+    assert reloaded.snapshot_version == 1
+    assert reloaded.watermark == store.watermark
+    assert reloaded.index.ntotal == store.index.ntotal
+    assert reloaded.search_batch(vectors, k=1, threshold=0.99) == [[i] for i in chunk_ids]
+
+
+def test_delta_log_replayed_after_crash(tmp_path):
+    """Test that changes logged after the last snapshot survive a restart."""
+    vectors = random_vectors(3, seed=12)
+    chunk_ids = store_chunks(vectors[:2])
+    store = new_store(tmp_path, index_type="flat")
+    added = store_chunks(vectors[2:])[0]
+    store.add_embedding(added, vectors[2])
+    store.remove_embedding(chunk_ids[0])
+    assert store.has_unpublished_changes()
+
+    # The process dies before the next snapshot is written.
+    restarted = new_store(tmp_path, index_type="flat")
+    assert restarted.search(vectors[0], k=1, threshold=0.99) == []
+    assert restarted.search(vectors[1], k=1, threshold=0.99) == [chunk_ids[1]]
+    assert restarted.search(vectors[2], k=1, threshold=0.99) == [added]
+    assert not restarted.has_unpublished_changes()
+
+
+def test_reader_swaps_in_published_snapshot(tmp_path):
+    """Test that a reader serves the writer's chunks once a snapshot is published."""
+    vectors = random_vectors(2, seed=14)
+    first = store_chunks(vectors[:1])[0]
+    writer = new_store(tmp_path, index_type="flat", role="writer")
+    reader = new_store(tmp_path, index_type="flat", role="reader")
+    assert reader.snapshot_version == writer.snapshot_version
+    assert reader.search(vectors[0], k=1, threshold=0.99) == [first]
+
+    second = store_chunks(vectors[1:])[0]
+    writer.add_embedding(second, vectors[1])
+    assert not reader.refresh()
+    assert reader.search(vectors[1], k=1, threshold=0.99) == []
+
+    writer.save_snapshot()
+    assert reader.refresh()
+    assert reader.snapshot_version == writer.snapshot_version
+    assert reader.search(vectors[1], k=1, threshold=0.99) == [second]
+    # Readers leave the index to the writer.
+    assert not reader.remove_embedding(second)
+    assert reader.search(vectors[1], k=1, threshold=0.99) == [second]
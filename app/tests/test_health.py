@@ -0,0 +1,22 @@
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+
+client = TestClient(app)
+
+# Requests are served by the started application and its models
+pytestmark = pytest.mark.usefixtures("started_app")
+
+
+def test_liveness():
+    """Test that the liveness probe answers."""
+    response = client.get("/health/live")
+    assert response.status_code == 200
+
+
+def test_readiness_after_startup():
+    """Test that the readiness probe reports per-component startup timings."""
+    response = client.get("/health/ready")
+    assert response.status_code == 200
+    assert response.json()["status"] == "ready"
+    assert "index" in response.json()["timings"]
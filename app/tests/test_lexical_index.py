@@ -0,0 +1,70 @@
+import secrets
+import numpy as np
+import pytest
+from app.models import db_models
+from app.models.db_models import Chunk, Document
+from app.models.lexical_index import LexicalIndex
+
+pytestmark = pytest.mark.usefixtures("database")
+
+
+def test_out_of_order_adds(tmp_path):
+    """Test that chunks added below the highest indexed ID are still indexed."""
+    index = LexicalIndex(index_dir=str(tmp_path), role="standalone", load=False)
+    index.add_texts([3, 4], ["third chunk", "fourth chunk"])
+    index.add_texts([1, 2], ["errorcode E1234 here", "second chunk"])
+    assert index.search("E1234") == [1]
+    assert index.size == 4
+
+    # Adding the same chunks again changes nothing
+    assert index.add_texts([2, 4], ["second chunk", "fourth chunk"]) == 0
+    assert index.size == 4
+
+
+def test_sync_picks_up_gaps(tmp_path):
+    """Test that a database sync adds chunks committed below the watermark."""
+    db = db_models.SessionLocal()
+    try:
+        document = Document(text="Lexical index test", content_hash=secrets.token_hex(32))
+        document.chunks = [
+            Chunk(position=0, text="Late commit with code QX9931"),
+            Chunk(position=1, text="Indexed first"),
+        ]
+        db.add(document)
+        db.commit()
+        late, first = [chunk.id for chunk in document.chunks]
+    finally:
+        db.close()
+
+    index = LexicalIndex(index_dir=str(tmp_path), role="standalone", load=False)
+    index.add_texts([first], ["Indexed first"])
+    assert index.search("QX9931") == []
+    index.sync_from_database()
+    assert index.search("QX9931") == [late]
+
+
+def test_snapshot_postings_are_memory_mapped(tmp_path):
+    """Test that a loaded snapshot maps its posting arrays instead of copying them."""
+    index_dir = tmp_path / "bm25"
+    index = LexicalIndex(index_dir=str(index_dir), role="standalone", load=False)
+    index.add_texts([1, 2], ["disk quota exceeded", "printer out of paper"])
+    index.save_snapshot()
+
+    reader = LexicalIndex(index_dir=str(index_dir), role="reader")
+    assert all(
+        isinstance(array, np.memmap) for array in (reader._offsets, reader._docs, reader._freqs)
+    )
+    assert reader.search("quota") == [1]
+
+    index.add_texts([3], ["quota raised for the team"])
+    index.save_snapshot()
+    assert sorted(path.name for path in index_dir.iterdir()) == [
+        "bm25.2.docs.npy",
+        "bm25.2.freqs.npy",
+        "bm25.2.offsets.npy",
+        "bm25.2.tables.npz",
+        "bm25.meta.json",
+    ]
+    # Searches keep working on the unlinked files of the first snapshot.
+    assert reader.search("paper") == [2]
+    assert sorted(LexicalIndex(index_dir=str(index_dir)).search("quota")) == [1, 3]
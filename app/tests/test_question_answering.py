@@ -1,8 +1,14 @@
+import json
+import pytest
 from fastapi.testclient import TestClient
 from app.main import app
+from app.models import index_factory
 
 client = TestClient(app)
 
+# Requests are served by the started application and its models
+pytestmark = pytest.mark.usefixtures("started_app")
+
 
 def test_valid_question():
     """Test asking a valid question."""
@@ -25,7 +31,114 @@ def test_empty_question():
     assert response.status_code == 400  # Assuming empty questions are invalid
 
 
+def test_question_too_long():
+    """Test that a question that does not fit in the model's input is rejected."""
+    # The prompt is only built once there is a chunk to answer from.
+    client.post("/upload/", files={"file": ("why.txt", "Because the sky is blue.")})
+    response = client.post(
+        "/qa/",
+        json={"question": "why " * 1000, "min_similarity": -1.0},
+        headers={"X-Session-ID": "long-question"},
+    )
+    assert response.status_code == 400
+
+
 def test_no_question_field():
     """Test API behavior when 'question' field is missing."""
     response = client.post("/qa/", json={})
     assert response.status_code == 422  # FastAPI should return a validation error
+
+
+def test_invalid_k():
+    """Test that an out-of-range number of documents is rejected."""
+    response = client.post("/qa/", json={"question": "What is AI?", "k": 0})
+    assert response.status_code == 422  # FastAPI should return a validation error
+
+
+def test_repeated_question_hits_cache():
+    """Test that asking the same question again is served from the cache."""
+    client.post("/qa/", json={"question": "What is caching?"})
+    before = client.get("/qa/cache/").json()["layers"]["embedding"]["hits"]
+    client.post("/qa/", json={"question": "  what is   CACHING? "})
+    after = client.get("/qa/cache/").json()["layers"]["embedding"]["hits"]
+    assert after == before + 1
+
+
+def stream_meta(question, min_similarity):
+    """Return the retrieval metadata streamed for a question."""
+    response = client.post(
+        "/qa/stream/",
+        json={"question": question, "min_similarity": min_similarity},
+        headers={"X-Session-ID": "keyword-search"},
+    )
+    assert response.status_code == 200
+    return json.loads(response.text.split("event: meta\ndata: ")[1].split("\n")[0])
+
+
+def test_keyword_match_is_retrieved():
+    """Test that hybrid retrieval finds a chunk by a rare keyword."""
+    upload = client.post(
+        "/upload/", files={"file": ("codes.txt", "Error code ZX4417 means the disk is full.")}
+    )
+    meta = stream_meta("What does ZX4417 mean?", -1.0)
+    assert upload.json()["document_id"] in meta["document_ids"]
+
+
+def test_keyword_match_respects_min_similarity():
+    """Test that keyword matches below the requested similarity are left out."""
+    client.post(
+        "/upload/", files={"file": ("codes2.txt", "Error code QT2291 means the fan failed.")}
+    )
+    assert stream_meta("What does QT2291 mean?", 1.0)["chunk_ids"] == []
+
+
+def test_failed_search_is_not_cached(monkeypatch):
+    """Test that the empty result of a failed search is not served from the cache."""
+    client.post(
+        "/upload/", files={"file": ("codes3.txt", "Error code KV7730 means the pump stopped.")}
+    )
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("search failed")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(index_factory, "search_parameters", fail)
+        assert stream_meta("What does KV7730 mean?", -1.0)["chunk_ids"] == []
+    assert stream_meta("What does KV7730 mean?", -1.0)["chunk_ids"]
+
+
+def test_streamed_answer():
+    """Test that /qa/stream/ sends retrieval metadata first and ends with the answer."""
+    response = client.post("/qa/stream/", json={"question": "What is AI?"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [
+        block.split("\n")[0].removeprefix("event: ")
+        for block in response.text.strip().split("\n\n")
+    ]
+    assert events[0] == "meta"
+    assert events[-1] == "done"
+
+
+def test_streamed_empty_question():
+    """Test that an empty question is rejected before streaming starts."""
+    response = client.post("/qa/stream/", json={"question": ""})
+    assert response.status_code == 400
+
+
+def test_batch_questions():
+    """Test answering several questions in one request, in order, with per-item errors."""
+    questions = ["What is AI?", "", "What is machine learning?"]
+    response = client.post("/qa/batch/", json={"questions": questions})
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [result["question"] for result in results] == questions
+    assert results[1]["error"] == "Question cannot be empty."
+    assert results[0]["error"] is None and results[0]["answer"]
+    assert results[2]["error"] is None and results[2]["answer"]
+
+
+def test_batch_without_questions():
+    """Test that an empty batch is rejected."""
+    response = client.post("/qa/batch/", json={"questions": []})
+    assert response.status_code == 422
@@ -0,0 +1,50 @@
+import asyncio
+from app.services import reranking_service
+from app.services.retrieval_service import RetrievedChunk
+
+
+class StubCrossEncoder:
+    """Scores a (question, passage) pair by the number of shared words."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def predict(self, pairs, batch_size=None):
+        self.calls += 1
+        return [
+            len(set(question.lower().split()) & set(passage.lower().split()))
+            for question, passage in pairs
+        ]
+
+
+CHUNKS = [
+    RetrievedChunk(1, 1, "Unrelated passage"),
+    RetrievedChunk(2, 1, "The disk quota is set per user"),
+    RetrievedChunk(3, 2, "Another unrelated passage"),
+    RetrievedChunk(4, 2, "The quota of a user disk"),
+]
+
+
+def test_rerank_orders_and_truncates(monkeypatch):
+    """Test that re-ranking orders candidates by score and keeps the best k."""
+    model = StubCrossEncoder()
+    monkeypatch.setattr(reranking_service, "RERANK_ENABLED", True)
+    monkeypatch.setattr(reranking_service, "_model", model)
+    reranked = asyncio.run(
+        reranking_service.rerank_async("What is the user disk quota?", CHUNKS, 2)
+    )
+    assert [chunk.id for chunk in reranked] == [2, 4]
+    assert model.calls == 1
+
+
+def test_rerank_skipped_when_disabled(monkeypatch):
+    """Test that without re-ranking the first k candidates keep retrieval order."""
+    model = StubCrossEncoder()
+    monkeypatch.setattr(reranking_service, "RERANK_ENABLED", False)
+    monkeypatch.setattr(reranking_service, "_model", model)
+    reranked = asyncio.run(
+        reranking_service.rerank_async("What is the user disk quota?", CHUNKS, 2)
+    )
+    assert [chunk.id for chunk in reranked] == [1, 2]
+    assert model.calls == 0
+    assert reranking_service.candidate_count(2) == 2
@@ -0,0 +1,35 @@
+from datetime import timedelta
+import pytest
+from app.models import db_models
+from app.models.db_models import SelectionSession, utc_now
+from app.services.selection_store import DatabaseSelectionStore, Selection
+
+pytestmark = pytest.mark.usefixtures("database")
+
+
+def test_expired_selections_are_deleted():
+    """Test that setting a selection deletes the expired ones from the database."""
+    db = db_models.SessionLocal()
+    try:
+        db.add(
+            SelectionSession(
+                session_id="stale",
+                document_ids=b"",
+                chunk_ids=b"",
+                updated_at=utc_now() - timedelta(hours=2),
+            )
+        )
+        db.commit()
+    finally:
+        db.close()
+
+    store = DatabaseSelectionStore(ttl=3600)
+    assert store.get("stale") is None
+    store.set("fresh", Selection([1, 2], [10, 11, 20]))
+    assert store.get("fresh").chunk_ids.tolist() == [10, 11, 20]
+
+    db = db_models.SessionLocal()
+    try:
+        assert [row.session_id for row in db.query(SelectionSession)] == ["fresh"]
+    finally:
+        db.close()
@@ -0,0 +1,140 @@
+import numpy as np
+import pytest
+from app.models.vector_storage import VectorStorage
+
+
+def random_vectors(count, seed=0):
+    """Return ``count`` random unit vectors."""
+    vectors = np.random.default_rng(seed).standard_normal((count, 384)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def read_all(storage, min_id=0):
+    """Read every stored batch into one ``(ids, vectors)`` pair."""
+    batches = list(storage.iter_batches(min_id, batch_size=4))
+    if not batches:
+        return np.empty(0, dtype=np.int64), np.empty((0, storage.dimension))
+    return (
+        np.concatenate([ids for ids, _ in batches]),
+        np.concatenate([vectors for _, vectors in batches]),
+    )
+
+
+@pytest.mark.parametrize("dtype, tolerance", [("float16", 1e-3), ("int8", 1e-2)])
+def test_quantized_round_trip(tmp_path, dtype, tolerance):
+    """Test that quantized vectors decode close to the originals."""
+    vectors = random_vectors(10)
+    storage = VectorStorage(str(tmp_path), dtype=dtype)
+    storage.open()
+    assert storage.append(np.arange(1, 11), vectors) == 10
+
+    ids, decoded = read_all(storage)
+    assert ids.tolist() == list(range(1, 11))
+    assert np.abs(decoded - vectors).max() < tolerance
+    assert (np.sum(decoded * vectors, axis=1) > 0.999).all()
+
+
+def test_interrupted_append_is_ignored(tmp_path):
+    """Test that rows written after the last metadata update are discarded."""
+    vectors = random_vectors(6)
+    storage = VectorStorage(str(tmp_path))
+    storage.open()
+    storage.append([1, 2, 3], vectors[:3])
+    # An append that crashed before publishing its metadata
+    with open(tmp_path / "ids.bin", "ab") as f:
+        f.write(np.array([4, 5], dtype=np.int64).tobytes())
+    with open(tmp_path / "vectors.bin", "ab") as f:
+        f.write(vectors[3:5].tobytes()[:1000])
+
+    reopened = VectorStorage(str(tmp_path))
+    reopened.open()
+    assert reopened.count == 3 and reopened.watermark == 3
+    assert read_all(reopened)[0].tolist() == [1, 2, 3]
+
+    reopened.append([4, 5, 6], vectors[3:])
+    ids, stored = read_all(reopened)
+    assert ids.tolist() == [1, 2, 3, 4, 5, 6]
+    np.testing.assert_array_equal(stored, vectors)
+
+
+@pytest.mark.parametrize(
+    "change", [{"model_name": "other-model"}, {"dimension": 768}, {"dtype": "int8"}]
+)
+def test_layout_change_discards_files(tmp_path, change):
+    """Test that vectors stored for another model, dimension or type are dropped."""
+    storage = VectorStorage(str(tmp_path))
+    storage.open()
+    storage.append([1, 2], random_vectors(2))
+
+    changed = VectorStorage(str(tmp_path), **change)
+    changed.open()
+    assert changed.count == 0 and changed.watermark == 0
+    assert list(changed.iter_batches()) == []
+    assert not (tmp_path / "vectors.bin").exists()
+
+
+def test_iter_batches_from_min_id(tmp_path):
+    """Test reading only the chunks above a given ID, skipping deleted ones."""
+    vectors = random_vectors(10)
+    storage = VectorStorage(str(tmp_path))
+    storage.open()
+    storage.append([2, 4, 6, 8, 10, 12, 14, 16, 18, 20], vectors)
+
+    ids, stored = read_all(storage, min_id=7)
+    assert ids.tolist() == [8, 10, 12, 14, 16, 18, 20]
+    np.testing.assert_array_equal(stored, vectors[3:])
+    assert read_all(storage, min_id=20)[0].tolist() == []
+
+    storage.delete([10, 11])
+    assert read_all(storage, min_id=7)[0].tolist() == [8, 12, 14, 16, 18, 20]
+    storage.replace([10], vectors[:1])
+    ids, stored = read_all(storage, min_id=9)
+    assert ids.tolist() == [10, 12, 14, 16, 18, 20]
+    np.testing.assert_array_equal(stored[0], vectors[0])
+
+
+def test_late_ids_go_to_overflow(tmp_path):
+    """Test that chunks below the watermark are stored and merged by compaction."""
+    vectors = random_vectors(8)
+    storage = VectorStorage(str(tmp_path))
+    storage.open()
+    storage.append([2, 4, 6], vectors[[2, 4, 6]])
+    assert storage.append([5, 3, 4], vectors[[5, 3, 4]]) == 2
+    assert storage.count == 3 and storage.overflow_count == 2
+    # Without ``extend`` only chunks below the watermark are stored
+    assert storage.append([1, 7], vectors[[1, 7]], extend=False) == 1
+    storage.replace([3], vectors[:1])
+
+    reopened = VectorStorage(str(tmp_path))
+    reopened.open()
+    ids, stored = read_all(reopened)
+    assert sorted(ids.tolist()) == [1, 2, 3, 4, 5, 6]
+    np.testing.assert_array_equal(stored[ids.tolist().index(3)], vectors[0])
+    assert read_all(reopened, min_id=4)[0].tolist() == [6, 5]
+
+    reopened.compact()
+    assert reopened.count == 6 and reopened.overflow_count == 0
+    ids, stored = read_all(reopened)
+    assert ids.tolist() == [1, 2, 3, 4, 5, 6]
+    np.testing.assert_array_equal(stored[3:], vectors[4:7])
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "ids.1.bin",
+        "meta.json",
+        "vectors.1.bin",
+    ]
+
+
+def test_compact_drops_deleted(tmp_path):
+    """Test that compaction drops deleted rows and their marks."""
+    vectors = random_vectors(4)
+    storage = VectorStorage(str(tmp_path), dtype="int8")
+    storage.open()
+    storage.append([1, 2, 3], vectors[1:])
+    storage.delete([2, 9])
+    assert storage.compact() == 1
+    assert storage.deleted == {9}
+    ids, stored = read_all(storage)
+    assert ids.tolist() == [1, 3]
+    assert (np.sum(stored * vectors[[1, 3]], axis=1) > 0.999).all()
+    # Nothing left to compact
+    assert storage.compact() == 0 and storage.generation == 1
@@ -0,0 +1,206 @@
+"""
+Compare accuracy and latency of the inference backends on this machine.
+
+Each backend of the embedding and generation models is loaded in turn and
+compared with the fp32 PyTorch baseline:
+
+- embedding: cosine similarity of the embeddings to the baseline's, overlap of
+  the top-5 retrieved passages, and encode latency per text;
+- generation: exact-match rate and token F1 of the answers against the
+  baseline's, and latency per answer.
+
+Usage (from the project root):
+
+    python -m benchmarks.compare_backends --corpus sample_data/sample.txt
+    python -m benchmarks.compare_backends --generation-backends torch onnx --questions 20
+"""
+
+import argparse
+import gc
+import statistics
+import time
+from collections import Counter
+import numpy as np
+from app.models import model_backends
+from app.services.chunking_service import chunk_text
+from app.services.embedding_service import EMBEDDING_MODEL
+from app.services.generation_service import GENERATION_MODEL
+
+# Used when no questions file is given
+DEFAULT_QUESTIONS = [
+    "What is this document about?",
+    "Summarize the main idea.",
+    "What is artificial intelligence?",
+    "How does retrieval augmented generation work?",
+    "What are the key benefits mentioned?",
+    "Who is the intended audience?",
+    "What problem does the text describe?",
+    "What are the main components of the system?",
+]
+
+PROMPT = (
+    "Based on the given information, provide a concise answer:\n\n"
+    "{context}\n\nQuestion: {question}"
+)
+
+
+def load_passages(paths, min_passages):
+    """
+    Chunk the corpus files into passages, repeating them to reach ``min_passages``.
+    """
+    passages = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            passages.extend(chunk_text(f.read()))
+    if not passages:
+        raise SystemExit("The corpus contains no text.")
+    while len(passages) < min_passages:
+        passages.extend(passages[: min_passages - len(passages)])
+    return passages
+
+
+def timed(fn, *args, **kwargs):
+    """
+    Call ``fn`` and return its result and the elapsed seconds.
+    """
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def token_f1(answer, reference):
+    """
+    Token-level F1 between an answer and a reference answer.
+    """
+    answer_tokens, reference_tokens = answer.lower().split(), reference.lower().split()
+    common = sum((Counter(answer_tokens) & Counter(reference_tokens)).values())
+    if not common:
+        return float(answer_tokens == reference_tokens)
+    precision, recall = common / len(answer_tokens), common / len(reference_tokens)
+    return 2 * precision * recall / (precision + recall)
+
+
+def compare_embedding(backends, passages, questions, batch_size):
+    """
+    Benchmark each embedding backend against the first one.
+    """
+    rows, baseline = [], None
+    for backend in backends:
+        model, load_s = timed(model_backends.load_embedding_model, EMBEDDING_MODEL, backend)
+        model.encode(passages[:batch_size], normalize_embeddings=True)  # warm up
+        passage_vectors, encode_s = timed(
+            model.encode, passages, batch_size=batch_size, normalize_embeddings=True
+        )
+        question_vectors = model.encode(questions, normalize_embeddings=True)
+        top = np.argsort(-(question_vectors @ passage_vectors.T), axis=1)[:, :5]
+
+        row = {
+            "backend": backend,
+            "load_s": load_s,
+            "ms_per_text": encode_s * 1000 / len(passages),
+        }
+        if baseline is None:
+            baseline = (passage_vectors, top)
+        else:
+            row["cosine_to_baseline"] = float(
+                np.mean(np.sum(passage_vectors * baseline[0], axis=1))
+            )
+            row["top5_overlap"] = float(
+                np.mean([len(set(a) & set(b)) / 5 for a, b in zip(top, baseline[1])])
+            )
+        rows.append(row)
+        del model
+        gc.collect()
+    return rows
+
+
+def compare_generation(backends, passages, questions, max_length):
+    """
+    Benchmark each generation backend against the first one.
+    """
+    prompts = [
+        PROMPT.format(context=" ".join(passages[i : i + 3]), question=question)
+        for i, question in enumerate(questions)
+    ]
+    rows, baseline = [], None
+    for backend in backends:
+        qa, load_s = timed(model_backends.load_generation_pipeline, GENERATION_MODEL, backend)
+        qa(prompts[0], max_length=max_length)  # warm up
+        answers, latencies = [], []
+        for prompt in prompts:
+            output, seconds = timed(qa, prompt, max_length=max_length)
+            answers.append(output[0]["generated_text"].strip())
+            latencies.append(seconds * 1000)
+
+        row = {
+            "backend": backend,
+            "load_s": load_s,
+            "ms_per_answer": statistics.mean(latencies),
+            "p95_ms": sorted(latencies)[int(0.95 * (len(latencies) - 1))],
+        }
+        if baseline is None:
+            baseline = answers
+        else:
+            row["exact_match"] = float(np.mean([a == b for a, b in zip(answers, baseline)]))
+            row["token_f1"] = float(np.mean([token_f1(a, b) for a, b in zip(answers, baseline)]))
+        rows.append(row)
+        del qa
+        gc.collect()
+    return rows
+
+
+def print_table(title, rows):
+    """
+    Print benchmark rows as a Markdown table.
+    """
+    columns = list(dict.fromkeys(column for row in rows for column in row))
+    print(f"\n### {title}\n")
+    print("| " + " | ".join(columns) + " |")
+    print("|" + "---|" * len(columns))
+    for row in rows:
+        cells = [
+            f"{value:.3f}" if isinstance(value, float) else str(value)
+            for value in (row.get(column, "-") for column in columns)
+        ]
+        print("| " + " | ".join(cells) + " |")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--corpus", nargs="+", default=["sample_data/sample.txt"])
+    parser.add_argument("--questions-file", help="Text file with one question per line.")
+    parser.add_argument("--questions", type=int, default=len(DEFAULT_QUESTIONS))
+    parser.add_argument("--passages", type=int, default=256)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--max-length", type=int, default=150)
+    parser.add_argument(
+        "--embedding-backends", nargs="*", default=list(model_backends.BACKENDS)
+    )
+    parser.add_argument(
+        "--generation-backends", nargs="*", default=list(model_backends.BACKENDS)
+    )
+    args = parser.parse_args()
+
+    if args.questions_file:
+        with open(args.questions_file, encoding="utf-8") as f:
+            questions = [line.strip() for line in f if line.strip()]
+    else:
+        questions = DEFAULT_QUESTIONS
+    questions = (questions * (args.questions // len(questions) + 1))[: args.questions]
+    passages = load_passages(args.corpus, args.passages)
+
+    # The first backend of each list is the baseline the others are compared to
+    if args.embedding_backends:
+        print_table(
+            f"Embedding: {EMBEDDING_MODEL}",
+            compare_embedding(args.embedding_backends, passages, questions, args.batch_size),
+        )
+    if args.generation_backends:
+        print_table(
+            f"Generation: {GENERATION_MODEL}",
+            compare_generation(args.generation_backends, passages, questions, args.max_length),
+        )
+
+
+if __name__ == "__main__":
+    main()
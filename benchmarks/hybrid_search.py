@@ -0,0 +1,145 @@
+"""
+Measure hybrid (BM25 + FAISS) retrieval latency on a synthetic corpus.
+
+Builds a BM25 index and a FAISS index over ``--passages`` synthetic passages
+(1M by default) with a Zipf-distributed vocabulary, like natural text, and
+random normalized embeddings. It then times keyword search, vector search and
+their reciprocal rank fusion per query. The exit status is 1 if the p95
+latency of hybrid retrieval exceeds ``--budget-ms``, so the script can guard
+the latency budget in CI.
+
+Usage (from the project root):
+
+    python -m benchmarks.hybrid_search
+    python -m benchmarks.hybrid_search --passages 100000 --budget-ms 30
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import faiss
+import numpy as np
+from app.core.config import FAISS_HNSW_EF_CONSTRUCTION, FAISS_HNSW_M, HYBRID_CANDIDATES
+from app.models import index_factory
+from app.models.lexical_index import LexicalIndex
+from app.services.retrieval_service import reciprocal_rank_fusion
+
+# Passages are added to the BM25 index in batches of this size
+BUILD_BATCH_SIZE = 10000
+
+
+def synthetic_passages(count, length, vocabulary, rng):
+    """
+    Yield batches of ``(chunk_ids, texts)`` with Zipf-distributed word frequencies.
+    """
+    words = np.array([f"w{i}" for i in range(vocabulary)])
+    for start in range(0, count, BUILD_BATCH_SIZE):
+        size = min(BUILD_BATCH_SIZE, count - start)
+        ids = np.minimum(rng.zipf(1.1, size=(size, length)), vocabulary) - 1
+        texts = [" ".join(row) for row in words[ids]]
+        yield list(range(start + 1, start + size + 1)), texts
+
+
+def percentiles(samples):
+    """
+    Return p50, p95 and p99 of latency samples in milliseconds.
+    """
+    return {f"p{p}": float(np.percentile(samples, p)) for p in (50, 95, 99)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--passages", type=int, default=1_000_000)
+    parser.add_argument("--passage-length", type=int, default=60)
+    parser.add_argument("--vocabulary", type=int, default=200_000)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument(
+        "--index-type", default=index_factory.HNSW, choices=index_factory.INDEX_TYPES
+    )
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--candidates", type=int, default=HYBRID_CANDIDATES)
+    parser.add_argument("--budget-ms", type=float, default=50.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    rng = np.random.default_rng(args.seed)
+
+    # BM25 index
+    lexical = LexicalIndex(index_dir=tempfile.mkdtemp(), role="standalone", load=False)
+    started = time.perf_counter()
+    for chunk_ids, texts in synthetic_passages(
+        args.passages, args.passage_length, args.vocabulary, rng
+    ):
+        lexical.add_texts(chunk_ids, texts)
+    build_s = time.perf_counter() - started
+    started = time.perf_counter()
+    lexical.save_snapshot()
+    save_s = time.perf_counter() - started
+    snapshot_mb = os.path.getsize(lexical.snapshot_path) / 2**20
+    print(
+        f"BM25: indexed {args.passages} passages in {build_s:.1f}s, "
+        f"snapshot {snapshot_mb:.0f} MB written in {save_s:.1f}s."
+    )
+
+    # FAISS index over random normalized vectors
+    params = {
+        "nlist": int(4 * np.sqrt(args.passages)),
+        "nprobe": 16,
+        "pq_m": 48,
+        "pq_nbits": 8,
+        "hnsw_m": FAISS_HNSW_M,
+        "ef_construction": FAISS_HNSW_EF_CONSTRUCTION,
+        "ef_search": 64,
+    }
+    index = index_factory.create_index(
+        args.index_type, args.dimension, faiss.METRIC_INNER_PRODUCT, params
+    )
+    started = time.perf_counter()
+    for start in range(0, args.passages, 100_000):
+        size = min(100_000, args.passages - start)
+        vectors = rng.standard_normal((size, args.dimension), dtype=np.float32)
+        faiss.normalize_L2(vectors)
+        if not index.is_trained:
+            index.train(vectors)
+        index.add_with_ids(vectors, np.arange(start + 1, start + size + 1, dtype=np.int64))
+    print(f"FAISS: built {args.index_type} index in {time.perf_counter() - started:.1f}s.")
+
+    # Queries mix frequent and rare words, like questions with names or codes
+    queries = [
+        " ".join(f"w{i}" for i in rng.integers(0, 50, size=2))
+        + " "
+        + " ".join(f"w{i}" for i in rng.integers(1000, args.vocabulary, size=2))
+        for _ in range(args.queries)
+    ]
+    query_vectors = rng.standard_normal((args.queries, args.dimension), dtype=np.float32)
+    faiss.normalize_L2(query_vectors)
+
+    keyword_ms, vector_ms, hybrid_ms = [], [], []
+    for text, vector in zip(queries, query_vectors):
+        started = time.perf_counter()
+        _, vector_ids = index.search(vector[None, :], args.candidates)
+        vector_done = time.perf_counter()
+        keyword_ids = lexical.search(text, args.candidates)
+        keyword_done = time.perf_counter()
+        reciprocal_rank_fusion([vector_ids[0].tolist(), keyword_ids], args.k)
+        finished = time.perf_counter()
+        vector_ms.append((vector_done - started) * 1000)
+        keyword_ms.append((keyword_done - vector_done) * 1000)
+        hybrid_ms.append((finished - started) * 1000)
+
+    print(f"\n| stage | p50 ms | p95 ms | p99 ms |\n|---|---|---|---|")
+    for stage, samples in (("bm25", keyword_ms), ("faiss", vector_ms), ("hybrid", hybrid_ms)):
+        stats = percentiles(samples)
+        print(f"| {stage} | {stats['p50']:.2f} | {stats['p95']:.2f} | {stats['p99']:.2f} |")
+
+    p95 = percentiles(hybrid_ms)["p95"]
+    if p95 > args.budget_ms:
+        print(f"\nHybrid p95 {p95:.2f} ms exceeds the {args.budget_ms} ms budget.")
+        sys.exit(1)
+    print(f"\nHybrid p95 {p95:.2f} ms is within the {args.budget_ms} ms budget.")
+
+
+if __name__ == "__main__":
+    main()